@@ -1,87 +1,89 @@
 # app.py
 
-import streamlit as st
-import threading
+import os
+import subprocess
+import sys
 import time
 
-from config import CS_WEBSOCKET_URL
-from websocket_client import websocket_thread_runner
+import streamlit as st
+
+from config import DAEMON_AUTOSTART, DAEMON_LOG_FILE
+from utils.daemon_control import daemon_status, reload_links
 
 # --- Page Configuration ---
 # This runs on every page load, making it the perfect place for shared setup.
 
 
-# --- Thread Management Functions ---
-# These are defined here so they can be imported and used by other pages.
-
-
-def start_websocket_client():
-    """Starts the websocket client in a background thread."""
-    if (
-        "websocket_thread" in st.session_state
-        and st.session_state.websocket_thread.is_alive()
-    ):
-        print("Websocket client is already running, returning.")
+# --- Daemon Management Functions ---
+# Translation runs in translator_daemon.py, shared by every browser session;
+# these are defined here so they can be imported and used by other pages.
+
+
+def start_daemon(wait=10.0):
+    """Starts the translator daemon in the background if none is running.
+
+    Safe to call from several sessions at once: the daemon's lock file lets
+    only one of them run. Returns True once a daemon answers.
+    """
+    if daemon_status() is not None:
+        return True
+    print("Starting translator daemon...")
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    os.makedirs(os.path.dirname(DAEMON_LOG_FILE) or ".", exist_ok=True)
+    with open(DAEMON_LOG_FILE, "ab") as log:
+        subprocess.Popen(
+            [sys.executable, os.path.join(app_dir, "translator_daemon.py")],
+            cwd=app_dir,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            # Outlives this Streamlit server
+            start_new_session=True,
+        )
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(0.5)
+        if daemon_status() is not None:
+            return True
+    return False
+
+
+def apply_room_links():
+    """Tells the translator daemon to subscribe to newly saved room links."""
+    if reload_links():
+        st.toast("Subscribed to the new room links.", icon="🔗")
         return
+    # No daemon: a new one starts from the saved links
+    if DAEMON_AUTOSTART and start_daemon():
+        st.toast("Started the translator with the new room links.", icon="🔗")
 
-    print("Starting websocket client...")
-    st.session_state.stop_event = threading.Event()
-    st.session_state.websocket_thread = threading.Thread(
-        target=websocket_thread_runner,
-        args=(CS_WEBSOCKET_URL, st.session_state.stop_event),
-        daemon=True,
-    )
-    st.session_state.websocket_thread.start()
-    time.sleep(1)  # Give thread time to initialize
-    st.rerun()
-
-
-def stop_websocket_client():
-    """Stops the websocket client thread gracefully. IMPORTANT: Does not rerun."""
-    if (
-        "websocket_thread" in st.session_state
-        and st.session_state.websocket_thread.is_alive()
-    ):
-        st.toast("Stopping websocket client...", icon="🛑")
-        st.session_state.stop_event.set()
-        st.session_state.websocket_thread.join(timeout=5)
-        if st.session_state.websocket_thread.is_alive():
-            st.warning("Websocket thread did not stop gracefully.", icon="⚠️")
-        del st.session_state.websocket_thread
-        del st.session_state.stop_event
-        # We REMOVED st.rerun() from here to allow for a clean restart sequence.
-
-
-def restart_websocket_client():
-    """Stops and then starts the websocket client. For applying new room links."""
-    st.toast("Restarting client for new room links...", icon="🔄")
-    stop_websocket_client()
-    # The start function will trigger its own rerun to update the UI
-    start_websocket_client()
-
-
-# --- CHANGE 3: Logic to connect client only on initial load ---
+
+# --- Start the daemon only on initial load ---
 # We use a flag 'client_started' to ensure this block only runs ONCE per session.
 if "client_started" not in st.session_state:
-    start_websocket_client()
+    if DAEMON_AUTOSTART:
+        start_daemon()
     st.session_state.client_started = True  # Set the flag
 
 
-# --- CHANGE 1 & 2: Updated Sidebar ---
+# --- Sidebar ---
 # This will be displayed on every page of the app.
 # The user-facing stop/restart buttons have been removed.
 
-is_running = (
-    "websocket_thread" in st.session_state
-    and st.session_state.websocket_thread.is_alive()
-)
+status = daemon_status()
 
-if is_running:
-    pass
-else:
-    st.error("Websocket client is stopped.", icon="❌")
+if status is None:
+    st.error("Translator daemon is not running.", icon="❌")
+    st.warning(
+        "Start it with `python translator_daemon.py`. "
+        f"Its log is in {DAEMON_LOG_FILE}.",
+        icon="⚠️",
+    )
+elif status["draining"]:
+    st.warning("Translator daemon is draining and will stop shortly.", icon="⏳")
+elif not all(worker.get("connected") for worker in status["workers"]):
     st.warning(
-        "Client is not running. It may be reconnecting or have encountered an error.",
+        "Translator daemon is running but not connected to ChatSurfer. "
+        "It may be reconnecting.",
         icon="⚠️",
     )
 
@@ -94,10 +96,16 @@ already_linked = st.Page(
 interlink = st.Page(
     "sidebar/new_link.py", title="Create a new linkage", icon=":material/add_link:"
 )
+metrics_page = st.Page(
+    "sidebar/metrics.py", title="Metrics", icon=":material/monitoring:"
+)
 
 
 pg = st.navigation(
-    {"Interlink Rooms": [interlink], "Currently Linked Rooms": [already_linked]}
+    {
+        "Interlink Rooms": [interlink],
+        "Currently Linked Rooms": [already_linked, metrics_page],
+    }
 )
 
 pg.run()
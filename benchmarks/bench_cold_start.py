@@ -0,0 +1,202 @@
+# benchmarks/bench_cold_start.py
+
+"""Measures how fast the translator comes up: import cost and the time to
+the first translation after a start.
+
+    python -m benchmarks.bench_cold_start [--modules config,websocket_client]
+        [--top 10] [--starts 3] [--mode rooms] [--port 8775] [--output results.json]
+
+Import profile: each module is imported in a fresh interpreter under
+`python -X importtime`, reporting its total import time and the heaviest
+third-party packages it pulls in.
+
+Time to first translation: the real client (benchmarks/soak/run_client.py)
+is started against the soak mock server, and one message is published as
+soon as it has subscribed. The first start uses an empty data directory (a
+cold start); later starts reuse it, like a restart picking up the saved
+session. Only `--mode firehose` has a warm-start snapshot to pick up (the
+private room list); in rooms mode every subscription comes from the local
+link store, so warm and cold starts differ only by the session. Reported
+per start: process start to subscribed, publish to translated post, and
+the sum.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.soak import mock_chatsurfer, run_soak
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = "config,utils.daemon_control,utils.translator,websocket_client,translator_daemon"
+
+
+def import_profile(module, top):
+    """(total seconds, [(package, seconds)]) for importing `module` fresh."""
+    env = dict(os.environ)
+    env.setdefault("TEST_LOCAL", "True")
+    env.setdefault("CHATKEY", "benchmark")
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            seconds = int(cumulative) / 1e6
+        except ValueError:
+            continue  # the header line
+        name = name[1:]
+        # Nesting is shown by indenting two spaces per level
+        entries.append(((len(name) - len(name.lstrip())) // 2, name.strip(), seconds))
+
+    # Children are listed before their parent: walk the module's subtree
+    # backwards, parents first, and charge each third-party package to the
+    # repo module that first imported it
+    packages = {}
+    total = 0.0
+    ancestors = []  # is_local for each level above the current entry
+    for depth, name, seconds in reversed(entries):
+        if depth == 0:
+            if total:
+                break
+            if name == module:
+                total = seconds
+            ancestors = [True]
+            continue
+        if not total:
+            continue
+        del ancestors[depth:]
+        root = name.split(".")[0]
+        local = _is_local(root)
+        if not local and all(ancestors):
+            packages[root] = packages.get(root, 0.0) + seconds
+        ancestors.append(local)
+    heaviest = sorted(packages.items(), key=lambda item: -item[1])[:top]
+    return total, heaviest
+
+
+def _is_local(package):
+    return os.path.exists(os.path.join(REPO_ROOT, package)) or os.path.exists(
+        os.path.join(REPO_ROOT, package + ".py")
+    )
+
+
+async def first_translation(state, directory, port, log_file, timeout, mode="rooms"):
+    """Starts the client and times its first translation. Returns seconds
+    (start to subscribed, publish to posted), or None on timeout."""
+    rooms = run_soak.write_links(directory, 1)
+    posted = state.posted
+    started = time.monotonic()
+    client = run_soak.start_client(directory, port, log_file)
+    try:
+        # Polled finely: wait_for_subscriptions only looks every 0.2s
+        if mode == "firehose":
+            wanted = {mock_chatsurfer.FIREHOSE_TOPIC}
+        else:
+            wanted = {mock_chatsurfer.ROOM_TOPIC_PREFIX + room for room in rooms}
+        deadline = started + timeout
+        while not any(wanted <= set(conn.subscriptions) for conn in state.connections):
+            if time.monotonic() > deadline:
+                return None
+            await asyncio.sleep(0.002)
+        subscribed = time.monotonic()
+        await state.publish(rooms[0], "cold start soak-0")
+        deadline = subscribed + timeout
+        while state.posted == posted:
+            if time.monotonic() > deadline:
+                return None
+            await asyncio.sleep(0.002)
+        return subscribed - started, time.monotonic() - subscribed
+    finally:
+        client.terminate()
+        client.wait()
+        # The next start must see no connection of this one
+        while state.connections:
+            await asyncio.sleep(0.05)
+
+
+async def time_starts(args):
+    state = mock_chatsurfer.MockState(translate_latency=0.0, translate_jitter=0.0)
+    # A private room for the firehose client to fetch, snapshot and subscribe to
+    state.private_rooms = ["cold_start_private"]
+    runner = await mock_chatsurfer.start(state, port=args.port)
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="cold-start-") as directory:
+            with open(os.path.join(directory, "client.log"), "wb") as log_file:
+                for start in range(args.starts):
+                    timing = await first_translation(
+                        state, directory, args.port, log_file, args.timeout, args.mode
+                    )
+                    label = "cold" if start == 0 else "warm"
+                    if timing is None:
+                        print(f"{label} start {start}: timed out")
+                        results.append({"start": start, "kind": label, "timed_out": True})
+                        continue
+                    to_subscribed, to_posted = timing
+                    print(
+                        f"{label} start {start}: subscribed {to_subscribed * 1000:.0f}ms, "
+                        f"first translation {to_posted * 1000:.0f}ms, "
+                        f"total {(to_subscribed + to_posted) * 1000:.0f}ms"
+                    )
+                    results.append(
+                        {
+                            "start": start,
+                            "kind": label,
+                            "to_subscribed": to_subscribed,
+                            "to_first_translation": to_posted,
+                        }
+                    )
+    finally:
+        await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--modules", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=8, help="heaviest packages to list")
+    parser.add_argument("--starts", type=int, default=3, help="client starts; 0 skips")
+    parser.add_argument(
+        "--mode", choices=("rooms", "firehose"), default="rooms", help="SUBSCRIPTION_MODE"
+    )
+    parser.add_argument("--port", type=int, default=8775)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="where to write the JSON results")
+    args = parser.parse_args()
+    # Read by the client processes started below
+    os.environ["SUBSCRIPTION_MODE"] = args.mode
+
+    imports = {}
+    for module in args.modules.split(","):
+        total, heaviest = import_profile(module, args.top)
+        imports[module] = {"total": total, "heaviest": heaviest}
+        print(
+            f"import {module}: {total * 1000:.0f}ms ("
+            + ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in heaviest)
+            + ")"
+        )
+    starts = asyncio.run(time_starts(args)) if args.starts else []
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"mode": args.mode, "imports": imports, "starts": starts}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+# benchmarks/bench_hot_path.py
+
+"""Replays frames through the message hot path and reports per-stage cost.
+
+    python -m benchmarks.bench_hot_path [--corpus frames.jsonl.gz]
+        [--sizes 1000,10000] [--links 1,10,100] [--output results.json]
+        [--baseline previous.json]
+
+Stages: process_stomp_message (decode + filter), the in-memory room lookup,
+the old per-message recreate_room_lookups rebuild, and translation_module.
+The Translate API, session and ChatSurfer post are replaced with local fakes,
+so the numbers only cover work done in this process. Each stage reports
+throughput, p50/p99 latency and tracemalloc peak/retained memory. Results
+are written as JSON; pass a previous file as --baseline to print deltas.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+# config.py requires these; keep the benchmark off the real cache and outbox
+os.environ.setdefault("TEST_LOCAL", "True")
+os.environ.setdefault("CHATKEY", "benchmark")
+os.environ["TRANSLATION_CACHE_DB"] = ""
+os.environ["OUTBOX_DB"] = ""
+os.environ.setdefault("LINKS_DB", ":memory:")
+
+from benchmarks.corpus import load_recorded, synthetic  # noqa: E402
+from utils import translator  # noqa: E402
+from utils.link_store import LinkStore  # noqa: E402
+from utils.translation_cache import TranslationCache  # noqa: E402
+from utils.translation_memory import TranslationMemory  # noqa: E402
+from websocket_client import process_stomp_message  # noqa: E402
+
+REBUILD_SAMPLE = 2000  # the old rebuild is slow; time at most this many calls
+
+
+def install_fakes(cache):
+    """Replaces every remote call translation_module makes with a local fake."""
+    translator.TRANSLATION_SERVICE.translate_many = lambda texts, src, tgt: [
+        text[::-1] for text in texts
+    ]
+    translator.send_public_message = lambda **kwargs: SimpleNamespace(status_code=200, ok=True)
+    translator.create_session = lambda: "benchmark-session"
+    translator.TRANSLATION_CACHE = TranslationCache(max_entries=10000 if cache else 0)
+    translator.TRANSLATION_MEMORY = TranslationMemory() if cache else None
+
+
+def write_links(directory, count):
+    """Stores `count` room pairs and points the room index at them."""
+    store = LinkStore(os.path.join(directory, f"links_{count}.db"))
+    for i in range(count):
+        store.add_link(
+            f"linked_room_{2 * i}", "English", f"linked_room_{2 * i + 1}", "Spanish", f"pair-{i}"
+        )
+
+    def loader():
+        return translator.recreate_room_lookups(store)
+
+    translator.ROOM_INDEX.loader = loader
+    translator.ROOM_INDEX.signature = store.version
+    translator.ROOM_INDEX.notify()
+    return [f"linked_room_{i}" for i in range(2 * count)], loader
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
+
+
+def summarize(latencies_ns, wall_s):
+    latencies_ns.sort()
+    return {
+        "calls": len(latencies_ns),
+        "ops_per_sec": round(len(latencies_ns) / wall_s) if wall_s else 0,
+        "p50_us": round(percentile(latencies_ns, 0.50) / 1000, 2),
+        "p99_us": round(percentile(latencies_ns, 0.99) / 1000, 2),
+    }
+
+
+def measure_memory(run):
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        run()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "peak_kib": round((peak - before) / 1024, 1),
+        "retained_kib": round((after - before) / 1024, 1),
+    }
+
+
+def timed(fn, items):
+    latencies = []
+    results = []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter_ns()
+        results.append(fn(item))
+        latencies.append(time.perf_counter_ns() - t0)
+    return results, latencies, time.perf_counter() - start
+
+
+def run_parse(frames):
+    async def replay():
+        latencies = []
+        messages = []
+        start = time.perf_counter()
+        for frame in frames:
+            t0 = time.perf_counter_ns()
+            messages.extend(await process_stomp_message(frame))
+            latencies.append(time.perf_counter_ns() - t0)
+        return messages, latencies, time.perf_counter() - start
+
+    return asyncio.run(replay())
+
+
+def bench(frames, loader):
+    stages = {}
+    messages, latencies, wall = run_parse(frames)
+    stages["parse"] = summarize(latencies, wall)
+    stages["parse"]["memory"] = measure_memory(lambda: run_parse(frames))
+    frames_per_sec = round(len(frames) / wall) if wall else 0
+
+    rooms = [m.get("roomName") for m in messages]
+    _, latencies, wall = timed(translator.ROOM_INDEX.lookup, rooms)
+    stages["room_lookup"] = summarize(latencies, wall)
+    stages["room_lookup"]["memory"] = measure_memory(
+        lambda: timed(translator.ROOM_INDEX.lookup, rooms)
+    )
+
+    sample = rooms[:REBUILD_SAMPLE]
+    _, latencies, wall = timed(lambda room: loader().get(room), sample)
+    stages["room_lookup_rebuild"] = summarize(latencies, wall)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        _, latencies, wall = timed(translator.translation_module, messages)
+        stages["translation_module"] = summarize(latencies, wall)
+        stages["translation_module"]["memory"] = measure_memory(
+            lambda: timed(translator.translation_module, messages)
+        )
+    return {
+        "frames": len(frames),
+        "messages": len(messages),
+        "frames_per_sec": frames_per_sec,
+        "stages": stages,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old_runs = {(r["corpus"], r["links"]): r for r in baseline["runs"]}
+    for run in results["runs"]:
+        old = old_runs.get((run["corpus"], run["links"]))
+        if old is None:
+            continue
+        print(f"\n{run['corpus']} frames, {run['links']} links vs {baseline_path}:")
+        change = run["frames_per_sec"] / old["frames_per_sec"] - 1
+        print(f"  frames/sec {old['frames_per_sec']} -> {run['frames_per_sec']} ({change:+.1%})")
+        for name, stage in run["stages"].items():
+            old_stage = old["stages"].get(name)
+            if old_stage and old_stage["p99_us"]:
+                change = stage["p99_us"] / old_stage["p99_us"] - 1
+                print(
+                    f"  {name} p99 {old_stage['p99_us']}us -> {stage['p99_us']}us ({change:+.1%})"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--corpus", help="recorded JSON-lines corpus (.gz ok)")
+    parser.add_argument("--sizes", default="1000,10000")
+    parser.add_argument("--links", default="1,10,100")
+    parser.add_argument("--linked-ratio", type=float, default=0.05)
+    parser.add_argument("--no-cache", action="store_true", help="disable the translation cache")
+    parser.add_argument("--output", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="previous results to compare against")
+    args = parser.parse_args()
+
+    install_fakes(cache=not args.no_cache)
+    recorded = load_recorded(args.corpus) if args.corpus else None
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "cache": not args.no_cache,
+        },
+        "runs": [],
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        for link_count in [int(n) for n in args.links.split(",")]:
+            linked_rooms, loader = write_links(directory, link_count)
+            corpora = (
+                [(args.corpus, recorded)]
+                if recorded is not None
+                else [
+                    (size, synthetic(size, linked_rooms, args.linked_ratio))
+                    for size in [int(n) for n in args.sizes.split(",")]
+                ]
+            )
+            for name, frames in corpora:
+                run = bench(frames, loader)
+                run.update({"corpus": name, "links": link_count})
+                results["runs"].append(run)
+                print(
+                    f"{name} frames, {link_count} links: {run['frames_per_sec']} frames/sec, "
+                    f"{run['messages']} messages translated"
+                )
+
+    results["meta"]["translation_cache"] = translator.TRANSLATION_CACHE.stats()
+    output = args.output or os.path.join(
+        "benchmarks", "results", f"hot_path-{results['meta']['revision'] or 'local'}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# benchmarks/bench_stomp_decode.py
+
+"""Compares the SockJS/STOMP decoder with the old regex-based parse.
+
+    python -m benchmarks.bench_stomp_decode [--corpus frames.jsonl] [--size 20000]
+"""
+
+import argparse
+import json
+import re
+import time
+from uuid import uuid4
+
+from benchmarks.corpus import load_recorded, synthetic
+from utils import stomp
+from utils.frame_filter import frame_room, raw_message_room
+
+QUOTECODE = str(uuid4())
+
+
+def legacy_parse(stomp_message):
+    """The parse process_stomp_message used before utils.stomp existed."""
+    if "CONNECTED" in stomp_message or stomp_message == "o":
+        return None
+    json_part_match = re.search(r"(\{.+\})", stomp_message)
+    if not json_part_match:
+        return None
+    json_str = json_part_match.group(1).replace('\\\\\\"', QUOTECODE).replace("\\", "")
+    try:
+        parsed_dict = json.loads(json_str)
+    except json.JSONDecodeError:
+        return None
+    if "text" in parsed_dict:
+        parsed_dict["text"] = parsed_dict["text"].replace(QUOTECODE, '"')
+    return parsed_dict
+
+
+def decoder_parse(stomp_message):
+    return [f.json() for f in stomp.decode(stomp_message) if f.command == "MESSAGE"]
+
+
+def make_filtered_parse(linked_rooms):
+    """The decoder plus the room prefilters process_stomp_message applies."""
+    linked = set(linked_rooms)
+
+    def wanted(room_name):
+        return room_name is None or room_name in linked
+
+    def filtered_parse(stomp_message):
+        if not wanted(raw_message_room(stomp_message)):
+            return []
+        return [
+            f.json()
+            for f in stomp.decode(stomp_message)
+            if f.command == "MESSAGE" and wanted(frame_room(f))
+        ]
+
+    return filtered_parse
+
+
+def run(parser, frames, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for frame in frames:
+            parser(frame)
+        best = min(best, time.perf_counter() - start)
+    return len(frames) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--corpus", help="recorded JSON-lines corpus")
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--linked-rooms", type=int, default=10)
+    parser.add_argument(
+        "--linked-ratio", type=float, default=0.01, help="share of linked traffic"
+    )
+    args = parser.parse_args()
+
+    linked_rooms = [f"linked_room_{i}" for i in range(args.linked_rooms)]
+    frames = (
+        load_recorded(args.corpus)
+        if args.corpus
+        else synthetic(args.size, linked_rooms, args.linked_ratio)
+    )
+
+    legacy_failures = sum(1 for f in frames if f.startswith("a") and legacy_parse(f) is None)
+    results = {
+        "frames": len(frames),
+        "legacy_frames_per_sec": round(run(legacy_parse, frames, args.repeat)),
+        "decoder_frames_per_sec": round(run(decoder_parse, frames, args.repeat)),
+        "decoder_filtered_frames_per_sec": round(
+            run(make_filtered_parse(linked_rooms), frames, args.repeat)
+        ),
+        "legacy_failed_frames": legacy_failures,
+    }
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
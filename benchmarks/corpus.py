@@ -0,0 +1,76 @@
+# benchmarks/corpus.py
+
+"""Frame corpora for the benchmarks: recorded traffic or synthetic frames.
+
+A recorded corpus is a JSON-lines file with one raw websocket message (the
+exact string `websocket.recv()` returned) per line, as written by
+utils.frame_recorder (set RECORD_FRAMES_PATH). Paths ending in .gz are gzip.
+"""
+
+import gzip
+import json
+import random
+import uuid
+
+from utils import stomp
+
+SAMPLE_TEXTS = [
+    "hello",
+    "ack",
+    "roger",
+    "👍",
+    "Can you check the \"status\" page?",
+    "Meeting moved to 1400Z, same room.",
+    "SITREP\nLine 1: all systems nominal\nLine 2: no change\nv/r",
+    "¿Dónde está el informe de hoy?",
+    "Path is C:\\temp\\logs, see attached.",
+]
+
+
+def load_recorded(path):
+    """Loads a corpus captured by the websocket client's recorder."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def make_message(room_name, text, user_id=None):
+    return {
+        "classification": "UNCLASSIFIED//FOUO",
+        "domainId": "chatsurferxmppunclass",
+        "id": str(uuid.uuid4()),
+        "roomName": room_name,
+        "sender": "benchuser",
+        "text": text,
+        "timestamp": "2024-08-05T20:02:58.321Z",
+        "userId": user_id or str(uuid.uuid4()),
+        "private": False,
+    }
+
+
+def make_frame(message, destination="/topic/chat-messages-all", subscription="sub-0"):
+    """Wraps a message dict the way the server does: a SockJS 'a' frame."""
+    body = json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+    frame = (
+        "MESSAGE\n"
+        f"destination:{destination}\n"
+        "content-type:application/json\n"
+        f"subscription:{subscription}\n"
+        f"message-id:{uuid.uuid4()}\n"
+        f"content-length:{len(body.encode('utf-8'))}\n\n"
+        f"{body}\x00"
+    )
+    return "a" + json.dumps([frame])
+
+
+def synthetic(size, linked_rooms, linked_ratio=0.05, seed=0):
+    """A corpus of `size` frames where `linked_ratio` of them hit a linked room."""
+    rng = random.Random(seed)
+    frames = ["o", stomp.encode_frame("CONNECTED", {"version": "1.2"}).replace("[", "a[", 1)]
+    for _ in range(size):
+        if linked_rooms and rng.random() < linked_ratio:
+            room = rng.choice(linked_rooms)
+        else:
+            room = f"unlinked_room_{rng.randrange(5000)}"
+        frames.append(make_frame(make_message(room, rng.choice(SAMPLE_TEXTS))))
+    return frames
@@ -0,0 +1,146 @@
+# benchmarks/soak/check_restart.py
+
+"""Restart check: every accepted message is posted exactly once, even when
+the client dies with work still queued.
+
+    python -m benchmarks.soak.check_restart [--rooms 2] [--rate 10]
+        [--phase 3] [--burst 3] [--port 8795] [--timeout 60]
+
+Runs the real client (benchmarks/soak/run_client.py) against mock_chatsurfer
+with burst coalescing on. Translation is paused on the mock while messages
+are published, so they pile up in the parse, coalesce and translate stages
+and none is posted. The client is then stopped in two ways, each followed
+by a restart: SIGKILL, then SIGTERM (which stops without draining).
+The last start resumes translation and must post every published message
+exactly once. Backfill is off, so only the outbox can bring back what the
+stopped clients had queued. Exits with status 1 otherwise.
+
+Pausing translation keeps posts out of flight when the client dies. A
+SIGKILL right after a successful post can repost it (see utils/outbox.py),
+which this check deliberately does not exercise.
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.soak import mock_chatsurfer, run_soak
+
+
+async def run_phase(state, rooms, args, first_seq, seed):
+    """Publishes one phase's messages with translation paused, and waits
+    until the last burst is received but still held by the coalescer."""
+    state.translating.clear()
+    next_seq = await run_soak.generate_load(
+        state, rooms, args.rate, args.phase, seed=seed, burst=args.burst, first_seq=first_seq
+    )
+    # Past the outbox's commit interval, well inside the coalescing gap
+    await asyncio.sleep(0.5)
+    return next_seq
+
+
+async def restart(state, client, stop, directory, args, log_file):
+    """Stops the client with SIGKILL or SIGTERM and starts a new one."""
+    process = client["process"]
+    started = time.monotonic()
+    if stop == "kill":
+        process.kill()
+    else:
+        process.send_signal(signal.SIGTERM)
+    try:
+        await asyncio.to_thread(process.wait, args.timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        raise RuntimeError(f"client did not exit within {args.timeout}s of SIG{stop.upper()}")
+    print(f"SIG{stop.upper()}: client exited in {time.monotonic() - started:.2f}s")
+    # Until the mock notices, the dead connection still looks subscribed
+    while state.connections:
+        await asyncio.sleep(0.05)
+    client["process"] = run_soak.start_client(directory, args.port, log_file)
+
+
+async def check(args, directory, log_file):
+    state = mock_chatsurfer.MockState(translate_latency=0.02, translate_jitter=0.0)
+    runner = await mock_chatsurfer.start(state, port=args.port)
+    rooms = run_soak.write_links(directory, args.rooms)
+    client = {"process": run_soak.start_client(directory, args.port, log_file)}
+    seq = 0
+    try:
+        for phase, stop in enumerate(("kill", "term")):
+            if not await run_soak.wait_for_subscriptions(state, rooms, args.timeout):
+                raise RuntimeError("client did not subscribe to the linked rooms in time")
+            seq = await run_phase(state, rooms, args, seq, seed=phase)
+            if state.posted:
+                raise RuntimeError(f"{state.posted} posts while translation was paused")
+            print(f"Published {seq} messages so far, none posted")
+            await restart(state, client, stop, directory, args, log_file)
+
+        if not await run_soak.wait_for_subscriptions(state, rooms, args.timeout):
+            raise RuntimeError("client did not subscribe to the linked rooms in time")
+        state.translating.set()
+        deadline = time.monotonic() + args.timeout
+        while time.monotonic() < deadline and len(state.delivered) < len(state.published):
+            await asyncio.sleep(0.2)
+        # Anything posted twice would arrive shortly after
+        await asyncio.sleep(1.0)
+    finally:
+        state.translating.set()
+        process = client["process"]
+        process.send_signal(signal.SIGTERM)
+        try:
+            await asyncio.to_thread(process.wait, 30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        await runner.cleanup()
+    return state.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rooms", type=int, default=2, help="linked room pairs")
+    parser.add_argument("--rate", type=float, default=10.0, help="messages per second")
+    parser.add_argument("--phase", type=float, default=3.0, help="seconds of load per stop")
+    parser.add_argument("--burst", type=int, default=3, help="messages per sender burst")
+    parser.add_argument("--port", type=int, default=8795)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--client-log", help="keep the client's output in this file")
+    args = parser.parse_args()
+
+    # Long enough that the last burst of a phase is still held when the client stops
+    os.environ.setdefault("COALESCE_GAP", "2")
+    # The soak text is English in every room; skipping it would post without
+    # waiting for the paused translation
+    os.environ.setdefault("SKIP_POLICY", "translate")
+    # Backfill would fetch lost messages again; the outbox alone must keep them
+    os.environ.setdefault("BACKFILL_MAX_AGE", "0")
+
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = args.client_log or os.path.join(directory, "client.log")
+        with open(log_path, "w") as log_file:
+            try:
+                results = asyncio.run(check(args, directory, log_file))
+            except RuntimeError as e:
+                print(f"Restart check failed: {e}. Client log:")
+                with open(log_path) as f:
+                    print(f.read()[-4000:])
+                sys.exit(1)
+
+    missing = results["published"] - results["delivered"]
+    print(
+        f"published {results['published']}, delivered {results['delivered']}, "
+        f"missing {missing}, duplicates {results['duplicates']}; "
+        f"{results['posted']} posts, {results['translate_calls']} translate calls"
+    )
+    if missing or results["duplicates"]:
+        print("Restart check failed: every message must be posted exactly once.")
+        sys.exit(1)
+    print("Restart check passed.")
+
+
+if __name__ == "__main__":
+    main()
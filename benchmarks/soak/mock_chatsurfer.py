@@ -0,0 +1,374 @@
+# benchmarks/soak/mock_chatsurfer.py
+
+"""Local ChatSurfer stand-in for soak and load tests.
+
+Speaks the SockJS/STOMP websocket protocol connect_and_subscribe expects and
+the REST endpoints cs_helpers uses, plus a fake translation backend with
+configurable latency and error rate. Point the client at it with:
+
+    CS_HOST=127.0.0.1:8765 CS_USE_TLS=False \\
+    TRANSLATE_ENDPOINT=http://127.0.0.1:8765/_mock/translate ...
+
+    python -m benchmarks.soak.mock_chatsurfer --port 8765
+
+Test drivers publish chat messages with POST /_mock/publish and read
+end-to-end delivery stats from GET /_mock/stats; POST /_mock/stall makes
+the open connections go silent. In-process drivers can clear
+`MockState.translating` to hold every translation request until it is set.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from aiohttp import WSMsgType, web
+
+from utils import stomp
+from utils.heartbeat import negotiate
+from utils.frame_filter import FIREHOSE_TOPIC, ROOM_TOPIC_PREFIX
+
+BOT_USER_ID = "27fbef28-0663-4659-b479-ca8cd555e013"
+SEQ_RE = re.compile(r"soak-(\d+)")
+
+
+def iso_now():
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace(
+        "+00:00", "Z"
+    )
+
+
+def parse_iso(timestamp):
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+
+
+class MockState:
+    def __init__(
+        self,
+        translate_latency=0.05,
+        translate_jitter=0.02,
+        error_rate=0.0,
+        echo=True,
+        throttle_rate=0.0,
+        heartbeat_ms=10000,
+    ):
+        self.translate_latency = translate_latency
+        self.translate_jitter = translate_jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.throttled = 0
+        self.heartbeat_ms = heartbeat_ms
+        self.echo = echo
+        self.connections = set()
+        self.rooms = set()
+        self.private_rooms = []
+        self.history = defaultdict(list)
+        self.published = {}  # seq -> publish timestamp (epoch seconds)
+        self.delays = []
+        self.posted = 0
+        self.duplicates = 0
+        self.delivered = set()
+        self.translate_calls = 0
+        self.translate_texts = 0
+        self.translate_errors = 0
+        self.sessions = set()
+        # Cleared, translation requests wait until it is set again
+        self.translating = asyncio.Event()
+        self.translating.set()
+
+    async def publish(self, room_name, text, user_id=None, sender="soakuser"):
+        message = {
+            "classification": "UNCLASSIFIED//FOUO",
+            "domainId": "chatsurferxmppunclass",
+            "id": str(uuid.uuid4()),
+            "roomName": room_name,
+            "sender": sender,
+            "text": text,
+            "timestamp": iso_now(),
+            "userId": user_id or str(uuid.uuid4()),
+            "private": False,
+        }
+        self.rooms.add(room_name)
+        self.history[room_name].append(message)
+        match = SEQ_RE.search(text)
+        if match and user_id != BOT_USER_ID:
+            self.published[int(match.group(1))] = parse_iso(message["timestamp"])
+        body = json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+        for conn in list(self.connections):
+            await conn.deliver(room_name, body)
+        return message
+
+    def record_post(self, text, room_name):
+        self.posted += 1
+        # A coalesced post answers several published messages
+        for match in SEQ_RE.finditer(text or ""):
+            seq = int(match.group(1))
+            if seq in self.delivered:
+                self.duplicates += 1
+                continue
+            self.delivered.add(seq)
+            published = self.published.get(seq)
+            if published is not None:
+                self.delays.append(time.time() - published)
+
+    def stats(self):
+        delays = sorted(self.delays)
+
+        def pct(q):
+            return round(delays[min(len(delays) - 1, int(q * len(delays)))] * 1000, 1) if delays else None
+
+        return {
+            "published": len(self.published),
+            "delivered": len(self.delivered),
+            "posted": self.posted,
+            "duplicates": self.duplicates,
+            "missing": len(self.published) - len(self.delivered),
+            "delay_ms": {
+                "p50": pct(0.50),
+                "p95": pct(0.95),
+                "p99": pct(0.99),
+                "max": round(delays[-1] * 1000, 1) if delays else None,
+            },
+            "translate_calls": self.translate_calls,
+            "translate_texts": self.translate_texts,
+            "translate_errors": self.translate_errors,
+            "throttled": self.throttled,
+            "connections": len(self.connections),
+        }
+
+
+class Connection:
+    """One client websocket and its STOMP subscriptions."""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.subscriptions = {}  # destination -> sub id
+        # While stalled nothing is sent, like a connection gone half-open
+        self.stalled = False
+        self.heartbeats = None
+
+    async def send_frame(self, command, headers, body=""):
+        if self.stalled:
+            return
+        await self.ws.send_str("a" + stomp.encode_frame(command, headers, body))
+
+    async def send_heartbeats(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            if not self.stalled:
+                await self.ws.send_str("a" + stomp.HEARTBEAT)
+
+    async def deliver(self, room_name, body):
+        destination = ROOM_TOPIC_PREFIX + room_name
+        if destination not in self.subscriptions:
+            destination = FIREHOSE_TOPIC
+            if destination not in self.subscriptions:
+                return
+        try:
+            await self.send_frame(
+                "MESSAGE",
+                {
+                    "destination": destination,
+                    "content-type": "application/json",
+                    "subscription": self.subscriptions[destination],
+                    "message-id": str(uuid.uuid4()),
+                },
+                body,
+            )
+        except ConnectionResetError:
+            pass
+
+
+async def websocket_handler(request):
+    state = request.app["state"]
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    conn = Connection(ws)
+    state.connections.add(conn)
+    await ws.send_str("o")
+    try:
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            for payload in json.loads(msg.data):
+                for frame in stomp.parse_frames(payload):
+                    if frame.command == "CONNECT":
+                        offer = f"{state.heartbeat_ms},{state.heartbeat_ms}"
+                        await conn.send_frame(
+                            "CONNECTED", {"version": "1.2", "heart-beat": offer}
+                        )
+                        interval, _ = negotiate(offer, frame.headers.get("heart-beat"))
+                        if interval:
+                            conn.heartbeats = asyncio.create_task(
+                                conn.send_heartbeats(interval)
+                            )
+                    elif frame.command == "SUBSCRIBE":
+                        conn.subscriptions[frame.destination] = frame.headers.get("id")
+                    elif frame.command == "UNSUBSCRIBE":
+                        sub_id = frame.headers.get("id")
+                        for dest, sid in list(conn.subscriptions.items()):
+                            if sid == sub_id:
+                                del conn.subscriptions[dest]
+    finally:
+        if conn.heartbeats is not None:
+            conn.heartbeats.cancel()
+        state.connections.discard(conn)
+    return ws
+
+
+async def new_session(request):
+    session_id = str(uuid.uuid4())
+    request.app["state"].sessions.add(session_id)
+    response = web.json_response({})
+    response.headers["Set-Cookie"] = f"SESSION={session_id}; Path=/; HttpOnly"
+    return response
+
+
+async def clear_sessions(request):
+    request.app["state"].sessions.clear()
+    return web.json_response({})
+
+
+async def private_rooms(request):
+    rooms = request.app["state"].private_rooms
+    return web.json_response({"privateRooms": [{"roomName": room} for room in rooms]})
+
+
+async def room_search(request):
+    state = request.app["state"]
+    payload = await request.json()
+    rooms = sorted(state.rooms)
+    size = payload.get("pageSize", 500)
+    page = payload.get("pageNumber", 0)
+    return web.json_response(
+        {
+            "totalRoomCount": len(rooms),
+            "rooms": [{"roomName": r} for r in rooms[page * size : (page + 1) * size]],
+        }
+    )
+
+
+async def room_messages(request):
+    state = request.app["state"]
+    room_name = request.match_info["room"]
+    if "threadId" in request.query:
+        # Soak messages never start threads, so every reply opens a new one
+        return web.json_response({"messages": []})
+    return web.json_response({"messages": list(reversed(state.history[room_name][-100:]))})
+
+
+async def post_message(request):
+    state = request.app["state"]
+    if random.random() < state.throttle_rate:
+        state.throttled += 1
+        return web.json_response({"error": "slow down"}, status=429)
+    message = await request.json()
+    text = message.get("message") or message.get("text")
+    state.record_post(text, message.get("roomName"))
+    if state.echo and message.get("roomName"):
+        # The real server echoes the bot's own posts back to subscribers
+        await state.publish(message["roomName"], text, user_id=BOT_USER_ID, sender="bot")
+    return web.json_response({"status": "ok"})
+
+
+async def translate(request):
+    state = request.app["state"]
+    payload = await request.json()
+    await state.translating.wait()
+    state.translate_calls += 1
+    await asyncio.sleep(
+        max(0.0, random.gauss(state.translate_latency, state.translate_jitter))
+    )
+    if random.random() < state.throttle_rate:
+        state.throttled += 1
+        return web.json_response({"error": "quota"}, status=429, headers={"Retry-After": "0.2"})
+    if random.random() < state.error_rate:
+        state.translate_errors += 1
+        return web.json_response({"error": "injected failure"}, status=503)
+    contents = payload.get("contents", [])
+    state.translate_texts += len(contents)
+    target = payload.get("target_language_code", "xx")
+    return web.json_response({"translations": [f"[{target}] {text}" for text in contents]})
+
+
+async def publish(request):
+    payload = await request.json()
+    message = await request.app["state"].publish(
+        payload["roomName"], payload["text"], payload.get("userId")
+    )
+    return web.json_response({"id": message["id"], "timestamp": message["timestamp"]})
+
+
+async def stall(request):
+    """Stops sending on every open connection, heart-beats included, as if
+    the network had silently dropped them. The client's watchdog should
+    notice and reconnect."""
+    connections = list(request.app["state"].connections)
+    for conn in connections:
+        conn.stalled = True
+    return web.json_response({"stalled": len(connections)})
+
+
+async def stats(request):
+    return web.json_response(request.app["state"].stats())
+
+
+def make_app(state):
+    app = web.Application()
+    app["state"] = state
+    app.add_routes(
+        [
+            web.get("/ws/connect/topic/chat-messages-all/websocket", websocket_handler),
+            web.post("/api/auth/newsession", new_session),
+            web.post("/api/auth/clearsessions", clear_sessions),
+            web.get("/api/roommembership/rooms/private", private_rooms),
+            web.post("/api/roomsearch/rooms/search", room_search),
+            web.get("/api/chat/messages/chatsurferxmppunclass/{room}", room_messages),
+            web.post("/api/chatserver/message", post_message),
+            web.post("/api/thread/thread/{thread_id}/reply", post_message),
+            web.post("/_mock/translate", translate),
+            web.post("/_mock/publish", publish),
+            web.post("/_mock/stall", stall),
+            web.get("/_mock/stats", stats),
+        ]
+    )
+    return app
+
+
+async def start(state, host="127.0.0.1", port=8765):
+    """Starts the mock server on the running loop. Returns the AppRunner."""
+    runner = web.AppRunner(make_app(state), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--translate-latency", type=float, default=0.05)
+    parser.add_argument("--translate-jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--heartbeat-ms", type=int, default=10000, help="STOMP heart-beats offered (0: none)"
+    )
+    args = parser.parse_args()
+    state = MockState(
+        args.translate_latency,
+        args.translate_jitter,
+        args.error_rate,
+        throttle_rate=args.throttle_rate,
+        heartbeat_ms=args.heartbeat_ms,
+    )
+    web.run_app(make_app(state), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+# benchmarks/soak/run_client.py
+
+"""Runs the websocket client headless until SIGTERM/SIGINT.
+
+    python -m benchmarks.soak.run_client
+
+Configured entirely through the environment (CS_HOST, CS_USE_TLS,
+TRANSLATE_ENDPOINT, ...), and reads its room links from data/ in the
+working directory, the same as the Streamlit app.
+"""
+
+import signal
+import threading
+
+from config import CS_WEBSOCKET_URL
+from websocket_client import websocket_thread_runner
+
+
+def main():
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    websocket_thread_runner(CS_WEBSOCKET_URL, stop_event)
+
+
+if __name__ == "__main__":
+    main()
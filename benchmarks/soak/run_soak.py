@@ -0,0 +1,302 @@
+# benchmarks/soak/run_soak.py
+
+"""Soak test: drives the real websocket client against the local stand-in.
+
+    python -m benchmarks.soak.run_soak [--rate 20] [--rooms 10]
+        [--duration 600] [--translate-latency 0.05] [--error-rate 0.0]
+        [--throttle-rate 0.0] [--burst 1] [--kill-every 0] [--daemon-workers 0]
+        [--output results.json]
+
+Starts mock_chatsurfer in this process, runs benchmarks/soak/run_client.py
+(or translator_daemon.py with --daemon-workers) in a subprocess pointed at it (no TLS, fake translation endpoint, its own
+data/ directory holding `--rooms` linked pairs), then publishes `--rate`
+messages per second spread over the linked rooms for `--duration` seconds.
+
+Every message carries a sequence token that survives the fake translation,
+so the mock can match each post back to the message it answers. Reports
+end-to-end delay (message timestamp to translated post) percentiles,
+delivered/duplicate/missing counts and the client's RSS over time, so slow
+leaks and latency drift show up over long runs.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.soak import mock_chatsurfer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+WORDS = "the quick brown fox jumps over a lazy dog while soldiers watch the river".split()
+
+
+def write_links(directory, count):
+    """Writes `count` English/Spanish room pairs into directory/data."""
+    data_dir = os.path.join(directory, "data")
+    os.makedirs(data_dir, exist_ok=True)
+    pairs = [
+        {
+            "pairId": f"soak-pair-{i}",
+            "room1name": f"soak_room_{2 * i}",
+            "room2name": f"soak_room_{2 * i + 1}",
+            "room1lang": "English",
+            "room2lang": "Spanish",
+        }
+        for i in range(count)
+    ]
+    with open(os.path.join(data_dir, "rooms_for_translating.json"), "w") as f:
+        json.dump({"rooms": pairs}, f, indent=4)
+    shutil.copy(
+        os.path.join(REPO_ROOT, "data", "language_codes.json"),
+        os.path.join(data_dir, "language_codes.json"),
+    )
+    return [p[k] for p in pairs for k in ("room1name", "room2name")]
+
+
+def start_client(directory, port, log_file, daemon_workers=0):
+    env = dict(os.environ)
+    env.update(
+        {
+            "CS_HOST": f"127.0.0.1:{port}",
+            "CS_USE_TLS": "False",
+            "TRANSLATE_ENDPOINT": f"http://127.0.0.1:{port}/_mock/translate",
+            "TEST_LOCAL": env.get("TEST_LOCAL", "True"),
+            "CHATKEY": env.get("CHATKEY", "soak"),
+            "PYTHONPATH": REPO_ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+            "DAEMON_CONTROL_PORT": str(port + 1),
+        }
+    )
+    command = [sys.executable, "-m", "benchmarks.soak.run_client"]
+    if daemon_workers:
+        command = [
+            sys.executable,
+            os.path.join(REPO_ROOT, "translator_daemon.py"),
+            "--workers",
+            str(daemon_workers),
+        ]
+    return subprocess.Popen(
+        command,
+        cwd=directory,
+        env=env,
+        stdout=log_file,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def read_rss_kib(pid):
+    """Resident set size of `pid` from /proc (Linux only), or None."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def rss_slope_kib_per_hour(samples):
+    """Least-squares slope of RSS over time; a steady climb suggests a leak."""
+    if len(samples) < 2:
+        return None
+    xs = [t for t, _ in samples]
+    ys = [rss for _, rss in samples]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    var = sum((x - mean_x) ** 2 for x in xs)
+    if not var:
+        return None
+    cov = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    return round(cov / var * 3600, 1)
+
+
+async def wait_for_subscriptions(state, rooms, timeout):
+    wanted = {mock_chatsurfer.ROOM_TOPIC_PREFIX + room for room in rooms}
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        # Sharded daemon workers split the rooms between their connections
+        subscribed = set()
+        for conn in state.connections:
+            subscribed |= set(conn.subscriptions)
+        if wanted <= subscribed:
+            return True
+        await asyncio.sleep(0.2)
+    return False
+
+
+async def generate_load(state, rooms, rate, duration, seed=0, burst=1, first_seq=0):
+    """Publishes `rate` messages/s on an absolute schedule, so a slow publish
+    does not lower the offered load. With `burst`, each sender posts that
+    many messages in a row in one room. Sequence tokens start at
+    `first_seq`; returns the next one."""
+    rng = random.Random(seed)
+    interval = 1.0 / rate
+    start = time.monotonic()
+    seq = first_seq
+    room = user_id = sender = None
+    while True:
+        due = start + (seq - first_seq) * interval
+        if due - start >= duration:
+            return seq
+        delay = due - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if seq % burst == 0:
+            room = rng.choice(rooms)
+            user = rng.randint(0, 50)
+            # A burst keeps its sender; single messages each get a new user id
+            user_id = f"soak-user-{seq}" if burst > 1 else None
+            sender = f"user{user}"
+        text = f"soak-{seq} " + " ".join(rng.choices(WORDS, k=rng.randint(3, 12)))
+        await state.publish(room, text, user_id=user_id, sender=sender)
+        seq += 1
+
+
+async def sample_rss(client, interval, samples, started):
+    while True:
+        rss = read_rss_kib(client["process"].pid)
+        if rss is not None:
+            samples.append((round(time.monotonic() - started, 1), rss))
+        await asyncio.sleep(interval)
+
+
+async def kill_and_restart(client, interval, directory, port, log_file, daemon_workers):
+    """SIGKILLs the client every `interval` seconds and starts a new one in
+    the same directory, to check that the outbox resumes unfinished work."""
+    while True:
+        await asyncio.sleep(interval)
+        client["process"].kill()
+        await asyncio.to_thread(client["process"].wait)
+        client["kills"] += 1
+        client["process"] = start_client(directory, port, log_file, daemon_workers)
+
+
+async def soak(args, directory, log_file):
+    state = mock_chatsurfer.MockState(
+        args.translate_latency,
+        args.translate_jitter,
+        args.error_rate,
+        throttle_rate=args.throttle_rate,
+    )
+    runner = await mock_chatsurfer.start(state, port=args.port)
+    rooms = write_links(directory, args.rooms)
+    client = {
+        "process": start_client(directory, args.port, log_file, args.daemon_workers),
+        "kills": 0,
+    }
+    samples = []
+    sampler = killer = None
+    try:
+        if not await wait_for_subscriptions(state, rooms, args.connect_timeout):
+            raise RuntimeError("client did not subscribe to the linked rooms in time")
+        sampler = asyncio.create_task(
+            sample_rss(client, args.sample_interval, samples, time.monotonic())
+        )
+        if args.kill_every:
+            killer = asyncio.create_task(
+                kill_and_restart(
+                    client, args.kill_every, directory, args.port, log_file, args.daemon_workers
+                )
+            )
+        print(f"Client subscribed to {len(rooms)} rooms; publishing {args.rate} msg/s for {args.duration}s")
+        await generate_load(state, rooms, args.rate, args.duration, burst=args.burst)
+        if killer is not None:
+            killer.cancel()
+        # Let in-flight messages finish before counting what is missing
+        deadline = time.monotonic() + args.settle
+        while time.monotonic() < deadline and len(state.delivered) < len(state.published):
+            await asyncio.sleep(0.2)
+    finally:
+        for task in (sampler, killer):
+            if task is not None:
+                task.cancel()
+        process = client["process"]
+        process.send_signal(signal.SIGTERM)
+        try:
+            await asyncio.to_thread(process.wait, 30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        await runner.cleanup()
+
+    results = state.stats()
+    results["client_kills"] = client["kills"]
+    results["delivered_ratio"] = (
+        round(results["delivered"] / results["published"], 4) if results["published"] else None
+    )
+    results["rss_kib"] = {
+        "first": samples[0][1] if samples else None,
+        "last": samples[-1][1] if samples else None,
+        "max": max(rss for _, rss in samples) if samples else None,
+        "slope_per_hour": rss_slope_kib_per_hour(samples),
+        "samples": samples,
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rate", type=float, default=20.0, help="messages per second")
+    parser.add_argument("--rooms", type=int, default=10, help="linked room pairs")
+    parser.add_argument("--duration", type=float, default=600.0, help="seconds of load")
+    parser.add_argument("--settle", type=float, default=30.0, help="seconds to wait for stragglers")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--translate-latency", type=float, default=0.05)
+    parser.add_argument("--translate-jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction answered 429")
+    parser.add_argument(
+        "--burst", type=int, default=1, help="consecutive messages per sender and room"
+    )
+    parser.add_argument(
+        "--kill-every", type=float, default=0, help="SIGKILL and restart the client this often"
+    )
+    parser.add_argument(
+        "--daemon-workers",
+        type=int,
+        default=0,
+        help="run translator_daemon.py with this many sharded workers instead of run_client",
+    )
+    parser.add_argument("--sample-interval", type=float, default=5.0)
+    parser.add_argument("--connect-timeout", type=float, default=30.0)
+    parser.add_argument("--client-log", help="keep the client's output in this file")
+    parser.add_argument("--output", help="where to write the JSON results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = args.client_log or os.path.join(directory, "client.log")
+        with open(log_path, "w") as log_file:
+            try:
+                results = asyncio.run(soak(args, directory, log_file))
+            except RuntimeError as e:
+                print(f"Soak failed: {e}. Client log:")
+                with open(log_path) as f:
+                    print(f.read()[-4000:])
+                sys.exit(1)
+
+    results["config"] = vars(args)
+    delay = results["delay_ms"]
+    print(
+        f"published {results['published']}, delivered {results['delivered']} "
+        f"({results['delivered_ratio']}), duplicates {results['duplicates']}; "
+        f"delay p50 {delay['p50']}ms p95 {delay['p95']}ms p99 {delay['p99']}ms max {delay['max']}ms; "
+        f"RSS {results['rss_kib']['first']} -> {results['rss_kib']['last']} KiB; "
+        f"{results['posted']} posts, {results['translate_calls']} translate calls"
+    )
+    output = args.output or os.path.join(
+        "benchmarks", "results", f"soak-{time.strftime('%Y%m%dT%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,14 @@
+import json
 import os
 
-CS_HOST = "chatsurfer.nro.mil"
+# CS_HOST / CS_USE_TLS can point the client at a local stand-in (see benchmarks/soak)
+CS_HOST = os.environ.get("CS_HOST", "chatsurfer.nro.mil")
+CS_USE_TLS = os.environ.get("CS_USE_TLS", "True") == "True"
 TEST = os.environ["TEST_LOCAL"]
 CHATKEY = os.environ["CHATKEY"]
 BOT_USER_ID = "27fbef28-0663-4659-b479-ca8cd555e013"
-CS_WEBSOCKET_URL = f"wss://{CS_HOST}/ws/connect/topic/chat-messages-all/websocket"
+CS_BASE_URL = f"{'https' if CS_USE_TLS else 'http'}://{CS_HOST}"
+CS_WEBSOCKET_URL = f"{'wss' if CS_USE_TLS else 'ws'}://{CS_HOST}/ws/connect/topic/chat-messages-all/websocket"
 
 
 if TEST == "True":
@@ -16,3 +20,198 @@ else:
     CERT_PATH = "/root/certs/justcert.pem"
     KEY_PATH = "/root/certs/decrypted.key"
     CA_BUNDLE_PATH = "/root/certs/dod_CAs.pem"
+
+CERT_PATH = os.environ.get("CERT_PATH", CERT_PATH)
+KEY_PATH = os.environ.get("KEY_PATH", KEY_PATH)
+CA_BUNDLE_PATH = os.environ.get("CA_BUNDLE_PATH", CA_BUNDLE_PATH)
+
+# --- Translation pipeline ---
+# Frames are parsed, translated and posted by separate stages joined by bounded
+# queues, so the websocket recv loop never waits on a Translate or REST call.
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "1000"))
+TRANSLATE_WORKERS = int(os.environ.get("TRANSLATE_WORKERS", "4"))
+POST_WORKERS = int(os.environ.get("POST_WORKERS", "4"))
+# "block" pauses reading from the socket when the pipeline is full, "drop" discards frames
+PIPELINE_OVERFLOW = os.environ.get("PIPELINE_OVERFLOW", "block")
+PIPELINE_REPORT_INTERVAL = float(os.environ.get("PIPELINE_REPORT_INTERVAL", "30"))
+
+# --- Translation cache ---
+TRANSLATION_CACHE_SIZE = int(os.environ.get("TRANSLATION_CACHE_SIZE", "10000"))
+TRANSLATION_CACHE_TTL = float(os.environ.get("TRANSLATION_CACHE_TTL", str(24 * 60 * 60)))
+# Set to an empty string to keep the cache in memory only
+TRANSLATION_CACHE_DB = os.environ.get("TRANSLATION_CACHE_DB", "data/translation_cache.db")
+TRANSLATION_CACHE_DB_TTL = float(
+    os.environ.get("TRANSLATION_CACHE_DB_TTL", str(30 * 24 * 60 * 60))
+)
+# New disk entries are committed in batches this often, off the hot path
+TRANSLATION_CACHE_COMMIT_INTERVAL = float(
+    os.environ.get("TRANSLATION_CACHE_COMMIT_INTERVAL", "1.0")
+)
+
+# --- Translation memory ---
+# Multi-line messages that miss the whole-message cache are translated per
+# segment ("lines", or "sentences" within lines), and only segments this
+# memory has not seen are sent. 0 entries disables it.
+TRANSLATION_MEMORY_SIZE = int(os.environ.get("TRANSLATION_MEMORY_SIZE", "50000"))
+TRANSLATION_MEMORY_SPLIT = os.environ.get("TRANSLATION_MEMORY_SPLIT", "lines")
+
+# --- Skip filter ---
+# Messages with nothing to translate (links, numbers, emoji, one-letter acks)
+# or already in the target language skip the Translate API. SKIP_POLICY is
+# "pass" (post the original text), "drop" (post nothing) or "translate"
+# (disable the filter); per room pair, e.g. {"ops-hub:ops-fr": "drop"}
+SKIP_POLICY = os.environ.get("SKIP_POLICY", "pass")
+SKIP_PAIR_POLICIES = json.loads(os.environ.get("SKIP_PAIR_POLICIES", "{}"))
+SKIP_SENDER_CACHE_SIZE = int(os.environ.get("SKIP_SENDER_CACHE_SIZE", "5000"))
+# Confident detections in a row before a sender's short messages are assumed
+# to be in the same language
+SKIP_SENDER_STREAK = int(os.environ.get("SKIP_SENDER_STREAK", "3"))
+
+# --- Burst coalescing ---
+# Consecutive messages from one sender in a room, each within COALESCE_GAP
+# seconds of the one before, are joined and translated and posted once (0 turns
+# it off). COALESCE_ROOM_GAPS sets the gap per source room, e.g. {"ops-hub": 3}.
+# A burst is sent once it reaches COALESCE_MAX_MESSAGES messages or
+# COALESCE_MAX_CHARS characters, or COALESCE_MAX_WAIT seconds after it began.
+COALESCE_GAP = float(os.environ.get("COALESCE_GAP", "0"))
+COALESCE_ROOM_GAPS = json.loads(os.environ.get("COALESCE_ROOM_GAPS", "{}"))
+COALESCE_MAX_MESSAGES = int(os.environ.get("COALESCE_MAX_MESSAGES", "8"))
+COALESCE_MAX_CHARS = int(os.environ.get("COALESCE_MAX_CHARS", "2000"))
+COALESCE_MAX_WAIT = float(os.environ.get("COALESCE_MAX_WAIT", "10"))
+
+# --- Scheduling ---
+# "fair" gives the translate and post stages a lane per room, so a room's
+# translations are posted in the order its messages were sent and waiting
+# rooms take turns. "fifo" shares one queue between all rooms.
+SCHEDULER = os.environ.get("SCHEDULER", "fair")
+# Messages of one room translated at once; their posts still go out in order,
+# one at a time per target room
+SCHEDULER_LANE_CONCURRENCY = int(os.environ.get("SCHEDULER_LANE_CONCURRENCY", "2"))
+# Turns a room gets in a row while others wait, e.g. {"ops-hub": 3}
+SCHEDULER_ROOM_WEIGHTS = json.loads(os.environ.get("SCHEDULER_ROOM_WEIGHTS", "{}"))
+# Lower classes go first; direct messages are class 0, rooms default to 1
+SCHEDULER_ROOM_PRIORITIES = json.loads(os.environ.get("SCHEDULER_ROOM_PRIORITIES", "{}"))
+
+# --- Room links ---
+LINKS_DB = os.environ.get("LINKS_DB", "data/links.db")
+
+# --- Outbox ---
+# Accepted messages are tracked here until posted, so a restart resumes them
+# and a message seen twice is posted once. Set to an empty string to disable.
+OUTBOX_DB = os.environ.get("OUTBOX_DB", "data/outbox.db")
+OUTBOX_COMMIT_INTERVAL = float(os.environ.get("OUTBOX_COMMIT_INTERVAL", "0.2"))
+# Posted message ids are remembered this long for deduplication
+OUTBOX_RETENTION = float(os.environ.get("OUTBOX_RETENTION", str(24 * 60 * 60)))
+OUTBOX_COMPACT_INTERVAL = float(os.environ.get("OUTBOX_COMPACT_INTERVAL", str(10 * 60)))
+# Unfinished messages resumed this many times, or accepted this long ago,
+# are marked failed instead of being retried again
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_MAX_AGE = float(os.environ.get("OUTBOX_MAX_AGE", str(6 * 60 * 60)))
+
+# --- Translate API ---
+TRANSLATE_PROJECT_ID = os.environ.get("TRANSLATE_PROJECT_ID", "cs-autotranslation")
+# Concurrent texts for the same language pair within this window share one request
+TRANSLATE_BATCH_WINDOW = float(os.environ.get("TRANSLATE_BATCH_WINDOW", "0.01"))
+TRANSLATE_BATCH_MAX_ITEMS = int(os.environ.get("TRANSLATE_BATCH_MAX_ITEMS", "64"))
+TRANSLATE_BATCH_MAX_CHARS = int(os.environ.get("TRANSLATE_BATCH_MAX_CHARS", "10000"))
+# Threads sending batched requests; more batches than this wait their turn
+TRANSLATE_SENDER_THREADS = int(os.environ.get("TRANSLATE_SENDER_THREADS", "8"))
+# Send Translate requests to this HTTP endpoint instead of Google (local testing)
+TRANSLATE_ENDPOINT = os.environ.get("TRANSLATE_ENDPOINT", "")
+
+# --- Rate limits ---
+# Defaults sit at 90% of Google's default Translate quotas (6M characters and
+# 6000 requests per minute). 0 disables a limit.
+TRANSLATE_REQUESTS_PER_SECOND = float(os.environ.get("TRANSLATE_REQUESTS_PER_SECOND", "90"))
+TRANSLATE_CHARS_PER_MINUTE = float(os.environ.get("TRANSLATE_CHARS_PER_MINUTE", "5400000"))
+TRANSLATE_MAX_CONCURRENCY = int(os.environ.get("TRANSLATE_MAX_CONCURRENCY", "8"))
+# Per language pair, e.g. {"en:ko": {"requests_per_second": 5, "units_per_minute": 100000}}
+TRANSLATE_PAIR_LIMITS = json.loads(os.environ.get("TRANSLATE_PAIR_LIMITS", "{}"))
+# ChatSurfer publishes no quota: posts are only capped by the adaptive
+# concurrency limit unless a rate is configured here
+POST_REQUESTS_PER_SECOND = float(os.environ.get("POST_REQUESTS_PER_SECOND", "0"))
+POST_MAX_CONCURRENCY = int(os.environ.get("POST_MAX_CONCURRENCY", "8"))
+# Per target room, e.g. {"translate_en_es": {"requests_per_second": 1}}
+POST_ROOM_LIMITS = json.loads(os.environ.get("POST_ROOM_LIMITS", "{}"))
+# Throttled (429/503) calls are retried this many times with jittered backoff
+RATE_LIMIT_RETRIES = int(os.environ.get("RATE_LIMIT_RETRIES", "4"))
+RATE_LIMIT_BACKOFF = float(os.environ.get("RATE_LIMIT_BACKOFF", "0.5"))
+RATE_LIMIT_MAX_BACKOFF = float(os.environ.get("RATE_LIMIT_MAX_BACKOFF", "30"))
+
+# --- ChatSurfer HTTP transport ---
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "16"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "30"))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "3"))
+
+# --- Reconnect and backfill ---
+# Reconnects back off exponentially with jitter, from RECONNECT_BACKOFF up to
+# RECONNECT_MAX_BACKOFF seconds; a connection that stayed up for
+# RECONNECT_STABLE_AFTER seconds resets the backoff
+RECONNECT_BACKOFF = float(os.environ.get("RECONNECT_BACKOFF", "1"))
+RECONNECT_MAX_BACKOFF = float(os.environ.get("RECONNECT_MAX_BACKOFF", "60"))
+RECONNECT_STABLE_AFTER = float(os.environ.get("RECONNECT_STABLE_AFTER", "60"))
+# After a reconnect, messages posted while disconnected (up to this many
+# seconds ago; 0 disables backfill) are fetched per room and translated at
+# BACKFILL_RATE messages per second
+BACKFILL_MAX_AGE = float(os.environ.get("BACKFILL_MAX_AGE", str(60 * 60)))
+BACKFILL_RATE = float(os.environ.get("BACKFILL_RATE", "20"))
+# Recent message ids remembered to drop copies seen by both live and backfill
+BACKFILL_SEEN_IDS = int(os.environ.get("BACKFILL_SEEN_IDS", "10000"))
+
+# --- Heart-beats ---
+# STOMP heart-beats offered in CONNECT, in milliseconds: how often the client
+# can send one and how often it asks the server to (0 turns a direction off)
+STOMP_HEARTBEAT_SEND_MS = int(os.environ.get("STOMP_HEARTBEAT_SEND_MS", "10000"))
+STOMP_HEARTBEAT_RECEIVE_MS = int(os.environ.get("STOMP_HEARTBEAT_RECEIVE_MS", "10000"))
+# Reconnect after this many seconds without any traffic from the server,
+# and at least two missed heart-beats; 0 disables the watchdog
+SILENCE_TIMEOUT = float(os.environ.get("SILENCE_TIMEOUT", "30"))
+
+# --- Websocket subscriptions ---
+# "rooms" subscribes to each linked room's topic; "firehose" subscribes to
+# every message on the server and filters locally
+SUBSCRIPTION_MODE = os.environ.get("SUBSCRIPTION_MODE", "rooms")
+
+# --- Warm start ---
+# Firehose mode only: the private room list a connection needs before it can
+# listen is saved here, so a restart subscribes without waiting on ChatSurfer
+# and refreshes it in the background. Older snapshots are ignored. Rooms mode
+# subscribes from the local link store and has nothing to snapshot.
+WARM_START_FILE = os.environ.get("WARM_START_FILE", "data/warm_start.json")
+WARM_START_MAX_AGE = float(os.environ.get("WARM_START_MAX_AGE", str(24 * 60 * 60)))
+
+# --- Room directory ---
+# New rooms are fetched incrementally this often; a full rebuild (which also
+# drops deleted rooms) runs at most once per full interval
+ROOM_DIRECTORY_REFRESH_INTERVAL = float(
+    os.environ.get("ROOM_DIRECTORY_REFRESH_INTERVAL", str(10 * 60))
+)
+ROOM_DIRECTORY_FULL_REFRESH_INTERVAL = float(
+    os.environ.get("ROOM_DIRECTORY_FULL_REFRESH_INTERVAL", str(24 * 60 * 60))
+)
+
+# --- Diagnostics ---
+# When set, every raw websocket message is appended to this JSON-lines file
+# (gzip if it ends in .gz) for replay by the benchmarks
+RECORD_FRAMES_PATH = os.environ.get("RECORD_FRAMES_PATH", "")
+
+# --- Metrics ---
+# Prometheus text format on http://METRICS_HOST:METRICS_PORT/metrics; 0 disables it.
+# Daemon worker N serves its metrics on METRICS_PORT + N
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9464"))
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+
+# --- Daemon ---
+# One translator daemon owns the websocket client; the Streamlit pages talk to
+# it over a local HTTP control socket, kept clear of the workers' metrics ports
+DAEMON_CONTROL_HOST = os.environ.get("DAEMON_CONTROL_HOST", "127.0.0.1")
+DAEMON_CONTROL_PORT = int(os.environ.get("DAEMON_CONTROL_PORT", "9463"))
+DAEMON_LOCK_FILE = os.environ.get("DAEMON_LOCK_FILE", "data/translator.lock")
+DAEMON_LOG_FILE = os.environ.get("DAEMON_LOG_FILE", "data/translator_daemon.log")
+# Worker processes, each with its own connection and a shard of the rooms
+DAEMON_WORKERS = int(os.environ.get("DAEMON_WORKERS", "1"))
+# Seconds a drain waits for queued messages to be translated and posted
+DAEMON_DRAIN_TIMEOUT = float(os.environ.get("DAEMON_DRAIN_TIMEOUT", "30"))
+# The Streamlit app starts the daemon when it finds none running
+DAEMON_AUTOSTART = os.environ.get("DAEMON_AUTOSTART", "True") == "True"
@@ -2,10 +2,21 @@
 
 import streamlit as st
 import pandas as pd
-from utils.cs_helpers import load_json_data
 
-# --- Constants ---
-ROOMS_FILE = "data/rooms_for_translating.json"
+from utils.daemon_control import reload_links
+from utils.link_store import LINK_STORE
+
+
+def remove_selected_links():
+    """Runs before the page is drawn again, so the table no longer shows them."""
+    pair_ids = st.session_state.get("links_to_remove") or []
+    removed = sum(LINK_STORE.remove_link(pair_id) for pair_id in pair_ids)
+    if removed:
+        st.session_state.links_removed = removed
+        # A running daemon unsubscribes from rooms that are no longer linked,
+        # without reconnecting; one started later reads the saved links
+        reload_links()
+
 
 # --- UI: Display Current State ---
 st.title("📊 Currently Linked Rooms")
@@ -14,10 +25,13 @@ st.markdown(
 )
 st.divider()
 
-rooms_data = load_json_data(ROOMS_FILE, {"rooms": []})
+if st.session_state.pop("links_removed", None):
+    st.success("Removed the selected links.", icon="✅")
 
-if rooms_data["rooms"]:
-    df = pd.DataFrame(rooms_data["rooms"])
+links = LINK_STORE.links()
+
+if links:
+    df = pd.DataFrame(links)
     df_display = df.rename(
         columns={
             "pairId": "Pair ID",
@@ -25,8 +39,25 @@ if rooms_data["rooms"]:
             "room1lang": "Lang 1",
             "room2name": "Room 2",
             "room2lang": "Lang 2",
+            "groupId": "Group",
         }
     )
     st.dataframe(df_display, use_container_width=True, hide_index=True)
+
+    # --- UI: Remove Links ---
+    # To change a link, remove it and create it again on the Create New Link page.
+    st.subheader("Remove links", anchor=False)
+    labels = {
+        link["pairId"]: f"{link['room1name']} ({link['room1lang']}) ↔ "
+        f"{link['room2name']} ({link['room2lang']})"
+        for link in links
+    }
+    with st.form("remove_links_form"):
+        st.multiselect(
+            "Links to remove", list(labels), format_func=labels.get, key="links_to_remove"
+        )
+        st.form_submit_button(
+            "Remove Selected Links", type="primary", on_click=remove_selected_links
+        )
 else:
     st.info("No rooms have been linked yet.", icon="ℹ️")
@@ -0,0 +1,210 @@
+# sidebar/metrics.py
+
+import time
+
+import pandas as pd
+import streamlit as st
+
+from utils import metrics
+from utils.daemon_control import daemon_metrics, daemon_status
+
+REFRESH_SECONDS = 5
+
+# --- UI: Live Metrics ---
+st.title("📈 Translation Metrics")
+st.markdown(
+    "Live throughput and latency for each linked room pair, read from the "
+    "translator daemon and summed over its workers. Each worker also exports "
+    "its own numbers in Prometheus format on the metrics endpoint."
+)
+st.divider()
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def _rate_per_minute(name, key, current, now):
+    """Per-minute rate of a counter since the previous refresh of this page."""
+    previous = st.session_state.get("metrics_previous")
+    if not previous:
+        return None
+    old_snapshot, old_time = previous
+    elapsed = now - old_time
+    if elapsed <= 0:
+        return None
+    old_value = old_snapshot.get(name, {}).get(key, 0)
+    return round((current - old_value) / elapsed * 60, 1)
+
+
+@st.fragment(run_every=REFRESH_SECONDS)
+def show_metrics():
+    exported = daemon_metrics()
+    if exported is None:
+        st.warning(
+            "The translator daemon is not running, so there are no metrics.", icon="⚠️"
+        )
+        return
+    snapshot = metrics.REGISTRY.snapshot_from(exported)
+    now = time.monotonic()
+
+    received = snapshot[metrics.FRAMES_RECEIVED.name].get((), 0)
+    dropped = snapshot[metrics.FRAMES_DROPPED.name]
+    cache = snapshot[metrics.CACHE_REQUESTS.name]
+    lookups = cache.get(("hit",), 0) + cache.get(("miss",), 0)
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric(
+        "Frames received",
+        received,
+        _rate_per_minute(metrics.FRAMES_RECEIVED.name, (), received, now),
+        help="Change is per minute since the last refresh.",
+    )
+    col2.metric("Frames dropped", sum(dropped.values()))
+    col3.metric(
+        "Cache hit ratio",
+        f"{cache.get(('hit',), 0) / lookups:.0%}" if lookups else "–",
+    )
+    col4.metric("Reconnects", snapshot[metrics.RECONNECTS.name].get((), 0))
+
+    # --- Per room pair ---
+    st.subheader("Room pairs")
+    translated = snapshot[metrics.MESSAGES_TRANSLATED.name]
+    posted = snapshot[metrics.MESSAGES_POSTED.name]
+    translate_latency = snapshot[metrics.TRANSLATE_SECONDS.name]
+    post_latency = snapshot[metrics.POST_SECONDS.name]
+    lag = snapshot[metrics.LAG_SECONDS.name]
+
+    rows = []
+    for pair in sorted(set(translated) | set(lag)):
+        failed = sum(
+            count
+            for (source, target, outcome), count in posted.items()
+            if (source, target) == pair and outcome != "ok"
+        )
+        rows.append(
+            {
+                "From": pair[0],
+                "To": pair[1],
+                "Translated": translated.get(pair, 0),
+                "Per minute": _rate_per_minute(
+                    metrics.MESSAGES_TRANSLATED.name, pair, translated.get(pair, 0), now
+                ),
+                "Failed posts": failed,
+                "Translate p95 (ms)": _ms(translate_latency.get(pair, {}).get("p95")),
+                "Post p95 (ms)": _ms(post_latency.get(pair, {}).get("p95")),
+                "Lag p50 (s)": lag.get(pair, {}).get("p50"),
+                "Lag p95 (s)": lag.get(pair, {}).get("p95"),
+            }
+        )
+    if rows:
+        st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+    else:
+        st.info("No messages have been translated since the client started.", icon="ℹ️")
+
+    # --- Pipeline ---
+    st.subheader("Pipeline")
+    depths = snapshot[metrics.QUEUE_DEPTH.name]
+    stage_latency = snapshot[metrics.STAGE_SECONDS.name]
+    stages = sorted(set(stage_latency) | set(depths))
+    if stages:
+        st.dataframe(
+            pd.DataFrame(
+                [
+                    {
+                        "Stage": stage[0],
+                        "Queue depth": depths.get(stage),
+                        "Processed": stage_latency.get(stage, {}).get("count", 0),
+                        "p50 (ms)": _ms(stage_latency.get(stage, {}).get("p50")),
+                        "p99 (ms)": _ms(stage_latency.get(stage, {}).get("p99")),
+                    }
+                    for stage in stages
+                ]
+            ),
+            use_container_width=True,
+            hide_index=True,
+        )
+    throttled = snapshot[metrics.THROTTLED.name]
+    limits = snapshot[metrics.CONCURRENCY_LIMIT.name]
+    if limits:
+        st.caption(
+            "Concurrency limits: "
+            + ", ".join(
+                f"{api[0]} {limit:.1f} ({throttled.get(api, 0)} throttled)"
+                for api, limit in sorted(limits.items())
+            )
+        )
+    segments = snapshot[metrics.MEMORY_SEGMENTS.name]
+    if segments:
+        segment_chars = snapshot[metrics.MEMORY_CHARACTERS.name]
+        segment_lookups = sum(segments.values())
+        char_lookups = sum(segment_chars.values())
+        st.caption(
+            f"Translation memory: {segments.get(('hit',), 0) / segment_lookups:.0%} of "
+            f"segments and {segment_chars.get(('hit',), 0) / char_lookups:.0%} of "
+            "characters found"
+            if segment_lookups and char_lookups
+            else "Translation memory: no segment lookups yet"
+        )
+    skipped = snapshot[metrics.MESSAGES_SKIPPED.name]
+    if skipped:
+        skipped_chars = snapshot[metrics.CHARACTERS_SKIPPED.name]
+        st.caption(
+            "Skipped translations: "
+            + ", ".join(
+                f"{reason} ({action}) {count}"
+                for (reason, action), count in sorted(skipped.items())
+            )
+            + f"; {sum(skipped_chars.values()):,} characters not sent to Translate"
+        )
+    coalesced = sum(snapshot[metrics.MESSAGES_COALESCED.name].values())
+    if coalesced:
+        saved = snapshot[metrics.CALLS_SAVED.name]
+        st.caption(
+            f"Burst coalescing: {coalesced:,} messages joined onto earlier ones, saving "
+            f"{saved.get(('translate',), 0):,} translate requests and "
+            f"{saved.get(('post',), 0):,} posts"
+        )
+    backfilled = snapshot[metrics.BACKFILLED.name]
+    if backfilled:
+        st.caption(
+            "Backfilled after reconnects: "
+            + ", ".join(f"{result[0]} {count}" for result, count in sorted(backfilled.items()))
+        )
+    if dropped:
+        st.caption(
+            "Dropped frames: "
+            + ", ".join(f"{reason[0]} {count}" for reason, count in sorted(dropped.items()))
+        )
+
+    # --- Workers ---
+    status = daemon_status()
+    if status is not None:
+        st.subheader("Workers")
+        st.dataframe(
+            pd.DataFrame(
+                [
+                    {
+                        "Shard": worker["shard"],
+                        "PID": worker.get("pid"),
+                        "Connected": worker.get("connected", False),
+                        "Rooms": worker.get("rooms"),
+                        "Outbox in flight": (worker.get("outbox") or {}).get("in_flight"),
+                    }
+                    for worker in status["workers"]
+                ]
+            ),
+            use_container_width=True,
+            hide_index=True,
+        )
+
+    st.session_state.metrics_previous = (
+        {
+            metrics.FRAMES_RECEIVED.name: {(): received},
+            metrics.MESSAGES_TRANSLATED.name: dict(translated),
+        },
+        now,
+    )
+
+
+show_metrics()
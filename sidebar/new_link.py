@@ -1,20 +1,20 @@
 # pages/1_🔗_Create_New_Link.py
 
+import pandas as pd
 import streamlit as st
-import uuid
 
 # Import shared functions from the main app.py
-from app import restart_websocket_client
+from app import apply_room_links
 from utils.cs_helpers import (
     load_json_data,
-    save_json_data,
     is_room_name_valid,
     do_two_rooms_exist,
     create_session,
+    ROOM_DIRECTORY,
 )
+from utils.link_store import LINK_STORE
 
 # --- Constants and File Paths ---
-ROOMS_FILE = "data/rooms_for_translating.json"
 LANG_CODES_FILE = "data/language_codes.json"
 PLACEHOLDER_LANG = "Select a language..."
 
@@ -23,11 +23,36 @@ st.title("🔗 Create a New Room Link")
 st.markdown(
     """
     Use this tool to create a translation link between two ChatSurfer rooms.
-    When a link is created, the websocket client will automatically restart to subscribe to the new rooms.
+    When a link is created, the translator daemon subscribes to the new rooms without reconnecting.
+    A room can be linked to several rooms; links are removed on the View Rooms page.
     """
 )
 st.divider()
 
+# --- UI: Room Lookup ---
+# Served from the local room directory, which refreshes itself in the background.
+
+
+@st.cache_resource
+def start_room_directory():
+    """Starts the directory's refresh thread once per server, not per rerun."""
+    ROOM_DIRECTORY.start()
+    return ROOM_DIRECTORY
+
+
+start_room_directory()
+room_query = st.text_input(
+    "Find a room",
+    placeholder="Start typing a room name...",
+    help=f"Searches {len(ROOM_DIRECTORY)} known ChatSurfer rooms by prefix.",
+)
+if room_query:
+    matches = ROOM_DIRECTORY.search(room_query)
+    if matches:
+        st.code("\n".join(matches), language=None)
+    else:
+        st.caption("No known rooms start with that name.")
+
 # --- UI: Input Form ---
 with st.form("link_rooms_form"):
     # Load data for form
@@ -71,6 +96,9 @@ if submitted:
         errors.append("Please select a language for both rooms.")
     if room1_name and room1_name == room2_name:
         errors.append("Room names must be unique.")
+    # A room may have several links (a hub and its spokes), but not the same one twice
+    if room1_name and room2_name and LINK_STORE.has_link(room1_name, room2_name):
+        errors.append(f"'{room1_name}' and '{room2_name}' are already linked.")
 
     if not errors:
         with st.spinner("Checking if rooms exist..."):
@@ -82,21 +110,78 @@ if submitted:
             st.error(error, icon="🚨")
     else:
         # All checks passed, create the link
-        new_pair = {
-            "pairId": str(uuid.uuid4()),
-            "room1name": room1_name,
-            "room2name": room2_name,
-            "room1lang": room1_lang,
-            "room2lang": room2_lang,
-        }
-
-        rooms_data = load_json_data(ROOMS_FILE, {"rooms": []})
-        rooms_data["rooms"].append(new_pair)
-        save_json_data(ROOMS_FILE, rooms_data)
+        LINK_STORE.add_link(room1_name, room1_lang, room2_name, room2_lang)
 
         st.success(f"Successfully linked '{room1_name}' and '{room2_name}'!", icon="✅")
         st.balloons()
 
-        # CHANGE 3: This now calls the refined restart function, which is the
-        # only other time (besides initial load) the client should reconnect.
-        restart_websocket_client()
+        # Reloads the link index and sends SUBSCRIBE frames for the new rooms
+        # on the live connection; no reconnect, so no messages are missed.
+        apply_room_links()
+
+# --- UI: Link Group ---
+st.divider()
+st.subheader("🌐 Link a hub room to several rooms", anchor=False)
+st.markdown(
+    "Every room in a group mirrors into every other one. Each message is "
+    "translated once per language, however many rooms share that language."
+)
+with st.form("link_group_form"):
+    hub_col1, hub_col2 = st.columns(2)
+    with hub_col1:
+        hub_name = st.text_input("Hub Room Name", placeholder="e.g., ops-hub")
+    with hub_col2:
+        hub_lang = st.selectbox("Hub Room Language", [PLACEHOLDER_LANG] + language_names)
+    member_rows = st.data_editor(
+        pd.DataFrame({"Room": [""] * 3, "Language": [None] * 3}),
+        num_rows="dynamic",
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "Room": st.column_config.TextColumn("Room Name"),
+            "Language": st.column_config.SelectboxColumn(
+                "Language", options=language_names
+            ),
+        },
+        key="group_members",
+    )
+    group_submitted = st.form_submit_button(
+        "Create Link Group", type="primary", use_container_width=True
+    )
+
+if group_submitted:
+    members = [
+        (str(row["Room"]).strip(), row["Language"])
+        for _, row in member_rows.iterrows()
+        if str(row["Room"] or "").strip()
+    ]
+    names = [hub_name] + [name for name, _ in members]
+    errors = []
+    if not hub_name or not members:
+        errors.append("A hub room and at least one other room are required.")
+    if hub_lang == PLACEHOLDER_LANG or any(not lang for _, lang in members):
+        errors.append("Please select a language for every room.")
+    if len(set(names)) != len(names):
+        errors.append("Room names must be unique.")
+    for name in names:
+        if name and not is_room_name_valid(name):
+            errors.append(f"'{name}' has invalid characters.")
+    # Rooms may belong to several groups, but a link may not be repeated
+    for name, _ in members:
+        if hub_name and name and LINK_STORE.has_link(hub_name, name):
+            errors.append(f"'{hub_name}' and '{name}' are already linked.")
+
+    if not errors:
+        with st.spinner("Checking if rooms exist..."):
+            session_id = create_session()
+            for name, _ in members:
+                if not do_two_rooms_exist(hub_name, name, session_id):
+                    errors.append(f"'{hub_name}' or '{name}' does not exist.")
+
+    if errors:
+        for error in errors:
+            st.error(error, icon="🚨")
+    else:
+        LINK_STORE.add_group(hub_name, hub_lang, members)
+        st.success(f"Linked '{hub_name}' with {len(members)} rooms!", icon="✅")
+        apply_room_links()
@@ -0,0 +1,326 @@
+# translator_daemon.py
+
+"""Headless translator daemon: the single process that owns the websocket
+client, its pipeline and the outbox.
+
+    python translator_daemon.py [--workers N]
+
+Only one daemon runs per data directory (DAEMON_LOCK_FILE). It is controlled
+over a local HTTP socket (see utils/daemon_control.py) for status, reloading
+room links and draining. With several workers, each runs in its own process
+with its own connection and translates one shard of the source rooms, chosen
+by a hash of the room name.
+
+SIGTERM/SIGINT stop at once. Messages the client had already parsed are
+in the outbox and are resumed by the next start; newer ones it had not got
+to are fetched by that start's backfill (BACKFILL_MAX_AGE). POST /drain
+finishes queued messages first.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+
+from config import (
+    CS_WEBSOCKET_URL,
+    DAEMON_CONTROL_HOST,
+    DAEMON_CONTROL_PORT,
+    DAEMON_DRAIN_TIMEOUT,
+    DAEMON_LOCK_FILE,
+    DAEMON_WORKERS,
+    METRICS_PORT,
+)
+from utils.daemon_control import start_control_server
+from utils.instance_lock import AlreadyRunning, InstanceLock
+from utils.metrics import merge_exports
+
+logger = logging.getLogger("websockets")
+
+
+class Worker:
+    """Runs the websocket client for one shard of the rooms on a thread."""
+
+    def __init__(self, index=0, count=1):
+        self.index = index
+        self.count = count
+        self.stop_event = threading.Event()
+        self.drain_event = threading.Event()
+        self.thread = None
+        self.started = None
+
+    def start(self):
+        # Imported here: the client's singletons (outbox, caches) belong in
+        # the process that translates, not in a supervisor
+        from utils import translator
+        from websocket_client import websocket_thread_runner
+
+        translator.set_shard(self.index, self.count)
+        # Each worker process needs a metrics port of its own
+        metrics_port = METRICS_PORT + self.index if METRICS_PORT else 0
+        self.thread = threading.Thread(
+            target=websocket_thread_runner,
+            args=(CS_WEBSOCKET_URL, self.stop_event, self.drain_event, metrics_port),
+            name=f"worker-{self.index}",
+            daemon=True,
+        )
+        self.thread.start()
+        self.started = time.time()
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def status(self):
+        from utils.translator import OUTBOX, ROOM_INDEX
+        from websocket_client import CONTROL
+
+        return {
+            "shard": self.index,
+            "pid": os.getpid(),
+            "running": self.is_alive(),
+            "connected": CONTROL.connected,
+            "rooms": len(ROOM_INDEX.rooms()),
+            "started": self.started,
+            "outbox": OUTBOX.stats() if OUTBOX is not None else None,
+        }
+
+    def reload(self):
+        from websocket_client import links_changed
+
+        return links_changed()
+
+    def metrics(self):
+        from utils.metrics import REGISTRY
+
+        return REGISTRY.export()
+
+    def stop(self, drain=False):
+        if drain:
+            self.drain_event.set()
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=DAEMON_DRAIN_TIMEOUT + 10)
+        return not self.is_alive()
+
+
+def _serve_worker(index, count, conn):
+    """Worker process: runs a Worker and answers the supervisor over `conn`."""
+    # Only the supervisor decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    worker = Worker(index, count)
+    worker.start()
+    while True:
+        try:
+            request_id, command, args = conn.recv()
+        except (EOFError, OSError):
+            # The supervisor is gone
+            worker.stop()
+            return
+        try:
+            result = getattr(worker, command)(*args)
+        except Exception as e:
+            logger.error(f"Worker {index} failed to run {command}: {e}")
+            result = None
+        conn.send((request_id, result))
+        if command == "stop":
+            return
+
+
+class ProcessWorker:
+    """A Worker in a child process, driven over a pipe."""
+
+    def __init__(self, index, count):
+        self.index = index
+        self.count = count
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_serve_worker,
+            args=(index, count, child_conn),
+            name=f"translator-worker-{index}",
+        )
+        self._lock = threading.Lock()
+        self._request_id = 0
+
+    def start(self):
+        self.process.start()
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def _call(self, command, *args, timeout=10.0):
+        with self._lock:
+            if not self.process.is_alive():
+                return None
+            self._request_id += 1
+            request_id = self._request_id
+            try:
+                self._conn.send((request_id, command, args))
+                deadline = time.monotonic() + timeout
+                # Replies to earlier requests that timed out are skipped
+                while self._conn.poll(max(0.0, deadline - time.monotonic())):
+                    reply_id, result = self._conn.recv()
+                    if reply_id == request_id:
+                        return result
+            except (EOFError, OSError):
+                pass
+            return None
+
+    def status(self):
+        return self._call("status") or {
+            "shard": self.index,
+            "pid": self.process.pid,
+            "running": False,
+        }
+
+    def reload(self):
+        return bool(self._call("reload"))
+
+    def metrics(self):
+        return self._call("metrics") or {}
+
+    def stop(self, drain=False):
+        stopped = self._call("stop", drain, timeout=DAEMON_DRAIN_TIMEOUT + 10)
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            logger.warning(f"Worker {self.index} did not stop; terminating it.")
+            self.process.terminate()
+            self.process.join(timeout=5)
+        return bool(stopped)
+
+
+class Daemon:
+    def __init__(self, workers=1):
+        self.count = max(1, workers)
+        self.workers = [self._new_worker(index) for index in range(self.count)]
+        self.started = time.time()
+        self.draining = False
+        self.stopped = threading.Event()
+        self._stopping = threading.Lock()
+
+    def _new_worker(self, index):
+        return Worker() if self.count == 1 else ProcessWorker(index, self.count)
+
+    # --- Control socket ---
+    def status(self):
+        return {
+            "pid": os.getpid(),
+            "started": self.started,
+            "draining": self.draining,
+            "workers": [worker.status() for worker in self.workers],
+        }
+
+    def reload(self):
+        return {"applied": [worker.reload() for worker in self.workers]}
+
+    def metrics(self):
+        return merge_exports([worker.metrics() for worker in self.workers])
+
+    def drain(self):
+        if not self.draining:
+            self.draining = True
+            logger.info("Draining: finishing queued messages, then shutting down.")
+            threading.Thread(target=self.shutdown, args=(True,), daemon=True).start()
+        return {"draining": True}
+
+    # --- Lifecycle ---
+    def shutdown(self, drain=False):
+        """Stops every worker (in parallel) and lets `run` return."""
+        if not self._stopping.acquire(blocking=False):
+            return
+        threads = [
+            threading.Thread(target=worker.stop, args=(drain,)) for worker in self.workers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.stopped.set()
+
+    def run(self):
+        """Serves the control socket and supervises the workers until shutdown.
+        Raises OSError, before any worker starts, if the control port is taken."""
+        server = start_control_server(
+            {
+                ("GET", "/status"): self.status,
+                ("GET", "/metrics"): self.metrics,
+                ("POST", "/reload"): self.reload,
+                ("POST", "/drain"): self.drain,
+            }
+        )
+        for worker in self.workers:
+            worker.start()
+        try:
+            while not self.stopped.wait(5.0):
+                self._replace_dead_workers()
+        finally:
+            server.shutdown()
+
+    def _replace_dead_workers(self):
+        if self._stopping.locked():
+            return
+        for index, worker in enumerate(self.workers):
+            if not worker.is_alive():
+                logger.error(f"Worker {index} died; starting a new one.")
+                self.workers[index] = self._new_worker(index)
+                self.workers[index].start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the translator daemon.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DAEMON_WORKERS,
+        help="worker processes, each translating a shard of the rooms",
+    )
+    args = parser.parse_args()
+
+    if not logger.handlers:
+        logger.setLevel(logging.INFO)
+        logger.addHandler(logging.StreamHandler())
+
+    if METRICS_PORT and METRICS_PORT <= DAEMON_CONTROL_PORT < METRICS_PORT + args.workers:
+        # A worker's exporter would fail to bind and its metrics go missing
+        logger.error(
+            f"DAEMON_CONTROL_PORT {DAEMON_CONTROL_PORT} is one of the workers' metrics "
+            f"ports ({METRICS_PORT}-{METRICS_PORT + args.workers - 1}); move one of them."
+        )
+        sys.exit(1)
+
+    lock = InstanceLock(DAEMON_LOCK_FILE)
+    try:
+        lock.acquire(
+            control=f"http://{DAEMON_CONTROL_HOST}:{DAEMON_CONTROL_PORT}",
+            workers=args.workers,
+        )
+    except AlreadyRunning as e:
+        logger.error(f"Translator daemon is already running: {e}")
+        sys.exit(1)
+
+    daemon = Daemon(args.workers)
+
+    def stop(*_):
+        # Stop from a thread; the main thread keeps supervising until it is done
+        threading.Thread(target=daemon.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info(f"Translator daemon {os.getpid()} starting {daemon.count} worker(s).")
+    try:
+        daemon.run()
+    except OSError as e:
+        logger.error(f"Translator daemon could not start its control socket: {e}")
+        sys.exit(1)
+    finally:
+        lock.release()
+    logger.info("Translator daemon stopped.")
+
+
+if __name__ == "__main__":
+    main()
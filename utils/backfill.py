@@ -0,0 +1,74 @@
+# utils/backfill.py
+
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+
+def parse_timestamp(timestamp):
+    """Epoch seconds from a ChatSurfer ISO timestamp, or None."""
+    try:
+        return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class HighWaterMarks:
+    """Newest message seen in each room, and the ids of recent messages.
+
+    The marks say where a reconnecting client should backfill from; the ids
+    let the live stream and a backfill share rooms without handling a
+    message twice (`claim`). With a `store` (the outbox), marks are loaded
+    at start and every `advance` is written through, so they survive
+    restarts. Advance a mark only once the store holds the message: its
+    writes are committed in order, so a saved mark never runs ahead of the
+    messages behind it.
+    """
+
+    def __init__(self, store=None, max_ids=10000):
+        self.store = store
+        self.max_ids = max_ids
+        self._marks = {}  # room -> (epoch seconds, timestamp, message id)
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+        if store is not None:
+            for room, timestamp, message_id in store.load_watermarks():
+                self._marks[room] = (parse_timestamp(timestamp) or 0.0, timestamp, message_id)
+
+    def claim(self, message):
+        """Records a message's id as handled.
+
+        Returns False if it was already claimed, i.e. the live stream and a
+        backfill both delivered it and this copy must be dropped.
+        """
+        message_id = message.get("id")
+        if message_id is None:
+            return True
+        with self._lock:
+            if message_id in self._ids:
+                return False
+            self._ids[message_id] = None
+            if len(self._ids) > self.max_ids:
+                self._ids.popitem(last=False)
+        return True
+
+    def advance(self, message):
+        """Moves the message's room mark forward to it, if it is newer."""
+        message_id = message.get("id")
+        room = message.get("roomName")
+        timestamp = message.get("timestamp")
+        seconds = parse_timestamp(timestamp)
+        if room is None or seconds is None:
+            return
+        with self._lock:
+            mark = self._marks.get(room)
+            if mark is not None and mark[0] >= seconds:
+                return
+            self._marks[room] = (seconds, timestamp, message_id)
+        if self.store is not None:
+            self.store.save_watermark(room, timestamp, message_id)
+
+    def snapshot(self):
+        """{room: epoch seconds of its newest handled message}."""
+        with self._lock:
+            return {room: mark[0] for room, mark in self._marks.items()}
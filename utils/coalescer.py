@@ -0,0 +1,116 @@
+# utils/coalescer.py
+
+import asyncio
+import logging
+
+from utils.metrics import MESSAGES_COALESCED
+
+logger = logging.getLogger("websockets")
+
+
+class _Burst:
+    __slots__ = ("sender", "messages", "chars", "started", "timer")
+
+    def __init__(self, sender, started):
+        self.sender = sender
+        self.messages = []
+        self.chars = 0
+        self.started = started
+        self.timer = None
+
+
+class Coalescer:
+    """Joins rapid consecutive messages from one sender in a room.
+
+    A pipeline stage: `add` holds each message of a room whose gap
+    (`gap_for(room)`, 0 to pass it straight on) is set, until the sender goes
+    quiet for that gap, someone else speaks in the room, the burst reaches
+    `max_messages` or `max_chars`, or `max_wait` seconds pass since it
+    began. A finished burst becomes one message: the first message with the
+    texts joined by newlines and every source id in `coalesced_ids`.
+
+    Bursts that end on a message are returned from `add`; those ending on a
+    timer are handed to the `emit` coroutine. `flush` ends them all when the
+    pipeline stops.
+    """
+
+    def __init__(self, gap_for, max_messages=8, max_chars=2000, max_wait=10.0, emit=None):
+        self.gap_for = gap_for
+        self.max_messages = max_messages
+        self.max_chars = max_chars
+        self.max_wait = max_wait
+        self.emit = emit
+        self._open = {}  # room -> _Burst
+        self._emitting = set()
+
+    async def add(self, message):
+        room = message.get("roomName")
+        gap = self.gap_for(room) if room is not None else 0
+        if not gap:
+            return message
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        sender = message.get("userId")
+        text = message.get("text", "")
+        done = []
+        burst = self._open.get(room)
+        if burst is not None and (
+            burst.sender != sender
+            or burst.chars + 1 + len(text) > self.max_chars
+            or now - burst.started >= self.max_wait
+        ):
+            done.append(self._close(room))
+            burst = None
+        if burst is None:
+            burst = self._open[room] = _Burst(sender, now)
+        burst.messages.append(message)
+        burst.chars += len(text) + (1 if burst.chars else 0)
+        if burst.timer is not None:
+            burst.timer.cancel()
+        if len(burst.messages) >= self.max_messages:
+            done.append(self._close(room))
+        else:
+            wait = min(gap, burst.started + self.max_wait - now)
+            burst.timer = loop.call_later(max(0.0, wait), self._expire, room, burst)
+        return done or None
+
+    def _close(self, room):
+        burst = self._open.pop(room)
+        if burst.timer is not None:
+            burst.timer.cancel()
+        return merge(burst.messages)
+
+    def _expire(self, room, burst):
+        if self._open.get(room) is not burst:
+            return
+        task = asyncio.create_task(self._emit(self._close(room)))
+        self._emitting.add(task)
+        task.add_done_callback(self._emitting.discard)
+
+    async def _emit(self, message):
+        try:
+            await self.emit(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Could not pass on a coalesced message: {e}")
+
+    async def flush(self, drain=True):
+        """Ends every open burst and returns them. Bursts already being
+        handed on are let through when draining, cancelled otherwise."""
+        if drain and self._emitting:
+            await asyncio.gather(*self._emitting, return_exceptions=True)
+        for task in list(self._emitting):
+            task.cancel()
+        return [self._close(room) for room in list(self._open)]
+
+
+def merge(messages):
+    """One message standing for a burst: the first, carrying all the texts."""
+    if len(messages) == 1:
+        return messages[0]
+    merged = dict(messages[0])
+    merged["text"] = "\n".join(message.get("text", "") for message in messages)
+    merged["coalesced_ids"] = [message["id"] for message in messages]
+    MESSAGES_COALESCED.inc(len(messages) - 1)
+    return merged
@@ -1,12 +1,16 @@
+import asyncio
 import time
-import requests
 import re
 import json
 from config import *
+from utils.http_client import get_async_client, request as http_request
+from utils.room_directory import RoomDirectory
+from utils.session_manager import SessionManager
 
 SESSION_EXPIRATION_TIME = (
     60 * 60
 )  # 1 hour before we expire the old session and get a new one
+SESSION_REFRESH_MARGIN = 5 * 60  # rotate this long before expiry, in the background
 
 
 def load_json_data(filepath, default_data):
@@ -21,9 +25,15 @@ def load_json_data(filepath, default_data):
 
 
 def save_json_data(filepath, data):
-    """Saves data to a JSON file with pretty printing."""
-    with open(filepath, "w", encoding="utf-8") as f:
+    """Saves data to a JSON file with pretty printing.
+
+    Written to a temporary file and renamed over the old one, so readers
+    never see a half-written file.
+    """
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, filepath)
 
 
 # --- Validation Helper ---
@@ -37,18 +47,12 @@ def is_room_name_valid(name):
 
 
 def get_thread(message_id: str, roomName: str, session_id: str):
-    url = f"https://{CS_HOST}/api/chat/messages/chatsurferxmppunclass/{roomName}?threadId={message_id}"
+    url = f"{CS_BASE_URL}/api/chat/messages/chatsurferxmppunclass/{roomName}?threadId={message_id}"
     headers = {
         "Content-type": "application/json",
     }
     cook = {"SESSION": session_id}
-    send = requests.get(
-        url,
-        cert=(CERT_PATH, KEY_PATH),
-        verify=CA_BUNDLE_PATH,
-        headers=headers,
-        cookies=cook,
-    )
+    send = http_request("GET", url, headers=headers, cookies=cook)
     if "messages" in send.json():
         threaded_messages = send.json()["messages"]
     else:
@@ -56,13 +60,9 @@ def get_thread(message_id: str, roomName: str, session_id: str):
     last_message = threaded_messages[-1]
     # print('last message from method get_thread:', last_message)
     if "threadId" in last_message.keys():  # thread exists for this message
-        new_url = f"https://{CS_HOST}/api/chat/messages/chatsurferxmppunclass/{roomName}?threadId={last_message['threadId']}"
-        whole_thread = requests.get(
-            new_url,
-            cert=(CERT_PATH, KEY_PATH),
-            verify=CA_BUNDLE_PATH,
-            headers=headers,
-            cookies=cook,
+        new_url = f"{CS_BASE_URL}/api/chat/messages/chatsurferxmppunclass/{roomName}?threadId={last_message['threadId']}"
+        whole_thread = http_request(
+            "GET", new_url, headers=headers, cookies=cook
         ).json()["messages"]
         return {"whole_thread": whole_thread, "thread_id": last_message["threadId"]}
     else:
@@ -71,11 +71,9 @@ def get_thread(message_id: str, roomName: str, session_id: str):
 
 def get_last_five_dms(user_id: str, session_id: str):
 
-    url = f"https://chatsurfer.nro.mil/api/directmessage/contacts/{user_id}/messages?commonClassification=UNCLASSIFIED%2F%2FFOUO"
+    url = f"{CS_BASE_URL}/api/directmessage/contacts/{user_id}/messages?commonClassification=UNCLASSIFIED%2F%2FFOUO"
     cook = {"SESSION": session_id}
-    send = requests.get(
-        url, cert=(CERT_PATH, KEY_PATH), verify=CA_BUNDLE_PATH, cookies=cook
-    )
+    send = http_request("GET", url, cookies=cook)
     formatted_for_gemini = ""
     last_five = send.json()["messages"][:5]
     last_five.reverse()
@@ -114,7 +112,7 @@ def send_public_message(
     }
     cook = {"SESSION": session_id}
 
-    url = "https://" + CS_HOST + "/api/chatserver/message?api-key=" + CHATKEY
+    url = CS_BASE_URL + "/api/chatserver/message?api-key=" + CHATKEY
 
     if thread:
         message["files"] = []
@@ -124,17 +122,11 @@ def send_public_message(
         )
         if whole_thread != "noThread":
             thread_message_id = whole_thread["thread_id"]
-        url = f"https://{CS_HOST}/api/thread/thread/{thread_message_id}/reply"
-
-    send = requests.post(
-        url,
-        cert=(CERT_PATH, KEY_PATH),
-        verify=CA_BUNDLE_PATH,
-        headers=headers,
-        json=message,
-        cookies=cook,
-    )
+        url = f"{CS_BASE_URL}/api/thread/thread/{thread_message_id}/reply"
+
+    send = http_request("POST", url, headers=headers, json=message, cookies=cook)
     print(f"Response from ChatSurfer send public message: {send}")
+    return send
 
 
 def send_dm(message_text: str, user_id: str, session_id: str):
@@ -149,92 +141,63 @@ def send_dm(message_text: str, user_id: str, session_id: str):
     }
     cook = {"SESSION": session_id}
 
-    url = f"https://{CS_HOST}/api/directmessage/contacts/{user_id}/messages"
+    url = f"{CS_BASE_URL}/api/directmessage/contacts/{user_id}/messages"
 
-    send = requests.post(
-        url,
-        cert=(CERT_PATH, KEY_PATH),
-        verify=CA_BUNDLE_PATH,
-        headers=headers,
-        json=message,
-        cookies=cook,
-    )
+    send = http_request("POST", url, headers=headers, json=message, cookies=cook)
     print(f"Response from ChatSurfer send DM: {send}")
 
 
-def session_request():
-    clear_sessions()
-    print("session expired, creating new session")
-    url = "https://" + CS_HOST + "/api/auth/newsession"
+def request_new_session():
+    """Asks ChatSurfer for a new session once. Returns the session id or None."""
+    url = CS_BASE_URL + "/api/auth/newsession"
     headers = {
         "Content-type": "application/json",
     }
     json_data = {
         "apiKey": CHATKEY,
     }
-    session_response = requests.post(
-        url,
-        cert=(CERT_PATH, KEY_PATH),
-        headers=headers,
-        json=json_data,
-        verify=CA_BUNDLE_PATH,
-    )
-    tries = 5
-    while session_response.status_code > 204 and tries > 0:
-        if (
-            "Set-Cookie" in session_response.headers
-            and session_response.headers["Set-Cookie"].split(";")[0] != "SESSION="
-        ):
-            break
-        else:
-            session_response = requests.post(
-                url,
-                cert=(CERT_PATH, KEY_PATH),
-                headers=headers,
-                json=json_data,
-                verify=CA_BUNDLE_PATH,
-            )
-            time.sleep(1)
-            tries -= 1
-    session_id = session_response.headers["Set-Cookie"].split(";")[0].split("=")[1]
-    with open("data/session_created.txt", "w") as f:
-        f.write(f"{time.time()+(SESSION_EXPIRATION_TIME)}separator1234{session_id}")
-    print("got session:", session_id)
-    return session_id
+    session_response = http_request("POST", url, headers=headers, json=json_data)
+    cookie = session_response.headers.get("Set-Cookie", "").split(";")[0]
+    if not cookie.startswith("SESSION=") or cookie == "SESSION=":
+        return None
+    return cookie.split("=", 1)[1]
+
+
+def session_request():
+    """Forces a new session, e.g. after the current one was rejected."""
+    print("session expired, creating new session")
+    return SESSIONS.refresh(stale=SESSIONS.session_id)
 
 
 def create_session():
-    with open("data/session_created.txt", "r") as f:
-        text = f.read()
-    if "separator1234" in text:
-        info = text.split("separator1234")
-        if time.time() > float(info[0]) or info[1] == "":
-            session_id = session_request()
-        else:
-            print("using existing session:", info[1])
-            session_id = info[1]
-    else:
-        session_id = session_request()
-    return session_id
+    """Returns the current session, served from memory and refreshed in the background."""
+    return SESSIONS.get()
 
 
 def clear_sessions():
-    url = "https://" + CS_HOST + "/api/auth/clearsessions?api-key=" + CHATKEY
-    clear = requests.post(url, cert=(CERT_PATH, KEY_PATH), verify=CA_BUNDLE_PATH)
+    url = CS_BASE_URL + "/api/auth/clearsessions?api-key=" + CHATKEY
+    clear = http_request("POST", url)
     tries = 5
     while clear.status_code > 204 and tries > 0:
-        clear = requests.post(url, cert=(CERT_PATH, KEY_PATH), verify=CA_BUNDLE_PATH)
+        clear = http_request("POST", url)
         time.sleep(1)
         tries -= 1
 
 
+SESSIONS = SessionManager(
+    request_new_session,
+    clear_sessions=clear_sessions,
+    lifetime=SESSION_EXPIRATION_TIME,
+    refresh_margin=SESSION_REFRESH_MARGIN,
+    state_file="data/session_created.txt",
+)
+
+
 def get_private_rooms(session_id: str):
-    url = f"https://{CS_HOST}/api/roommembership/rooms/private"
+    url = f"{CS_BASE_URL}/api/roommembership/rooms/private"
     cook = {"SESSION": session_id}
 
-    priv_rooms_raw = requests.get(
-        url, cert=(CERT_PATH, KEY_PATH), verify=CA_BUNDLE_PATH, cookies=cook
-    ).json()
+    priv_rooms_raw = http_request("GET", url, cookies=cook).json()
     private_rooms_list = []
     if "privateRooms" in priv_rooms_raw.keys():
         for room in priv_rooms_raw["privateRooms"]:
@@ -242,49 +205,172 @@ def get_private_rooms(session_id: str):
         return private_rooms_list
 
 
-def do_two_rooms_exist(room_name1: str, room_name2: str, session_id: str):
-    url = f"https://{CS_HOST}/api/roomsearch/rooms/search"
+# --- Async variants ---
+# These run on the websocket event loop over the pooled aiohttp client, so
+# posts to several rooms can be in flight at once.
+
+
+async def async_create_session():
+    """Like create_session, but only leaves the event loop if a refresh is needed."""
+    session_id = SESSIONS.current()
+    if session_id is None:
+        session_id = await asyncio.to_thread(SESSIONS.get)
+    return session_id
+
+
+async def async_get_room_messages(roomName: str, session_id: str):
+    """The room's most recent messages, from the endpoint get_thread uses."""
+    url = f"{CS_BASE_URL}/api/chat/messages/chatsurferxmppunclass/{roomName}"
+    cook = {"SESSION": session_id}
+    _, _, body = await get_async_client().request("GET", url, cookies=cook)
+    return (body or {}).get("messages") or []
+
+
+async def async_get_thread(message_id: str, roomName: str, session_id: str):
+    client = get_async_client()
+    url = f"{CS_BASE_URL}/api/chat/messages/chatsurferxmppunclass/{roomName}?threadId={message_id}"
+    headers = {
+        "Content-type": "application/json",
+    }
     cook = {"SESSION": session_id}
-    pageNumber = 0
-    total_rooms_count = float("inf")
-    rooms_list = []
-    room_found = False
-    while pageNumber * 500 < total_rooms_count and pageNumber < 100:
-        print(
-            f"browsing page {pageNumber} for {room_name1} and {room_name2} to see if they are a valid rooms..."
+    _, _, body = await client.request("GET", url, headers=headers, cookies=cook)
+    if not body or not body.get("messages"):
+        return "noThread"
+    last_message = body["messages"][-1]
+    if "threadId" in last_message:  # thread exists for this message
+        new_url = f"{CS_BASE_URL}/api/chat/messages/chatsurferxmppunclass/{roomName}?threadId={last_message['threadId']}"
+        _, _, thread_body = await client.request(
+            "GET", new_url, headers=headers, cookies=cook
         )
-        payload = {
-            "sortCriteria": {
-                "orders": [{"sortField": "FIRST_JOINED_DATE", "sortDirection": "DESC"}]
-            },
-            "keywordCriteria": {"searchFields": ["DISPLAY_NAME"], "query": ""},
-            "aboveUserDefaultHighOptIn": True,
-            "includePrivateRooms": True,
-            "pageNumber": pageNumber,
-            "pageSize": 500,
+        return {
+            "whole_thread": thread_body["messages"],
+            "thread_id": last_message["threadId"],
         }
+    return "noThread"
+
 
-        rooms_raw = requests.post(
-            url,
-            cert=(CERT_PATH, KEY_PATH),
-            verify=CA_BUNDLE_PATH,
-            cookies=cook,
-            json=payload,
-        ).json()
-        total_rooms_count = rooms_raw.get("totalRoomCount")
-        for room in rooms_raw.get("rooms"):
-            rooms_list.append(room["roomName"])
-        pageNumber += 1
-        time.sleep(0.2)
-
-        if room_name1 in rooms_list and room_name2 in rooms_list:
-            print("found rooms!")
-            room_found = True
-            break
-
-    with open("data/found_some_cs_rooms.json", "w") as file:
-        json.dump(rooms_list, file, indent=4)
-    return room_found
+async def async_send_public_message(
+    message_text: str,
+    roomName: str,
+    message_id: str,
+    session_id: str,
+    thread=True,
+    classification: str = "UNCLASSIFIED//FOUO",
+    domainId: str = "chatsurferxmppunclass",
+    nickName: str = "AskSlammy",
+):
+    """Async send_public_message. Returns the HTTP status of the post."""
+    headers = {
+        "Content-type": "application/json",
+    }
+    message = {
+        "classification": classification,
+        "message": message_text,
+        "domainId": domainId,
+        "nickName": nickName,
+        "roomName": roomName,
+    }
+    cook = {"SESSION": session_id}
+
+    url = CS_BASE_URL + "/api/chatserver/message?api-key=" + CHATKEY
+
+    if thread:
+        message["files"] = []
+        thread_message_id = message_id
+        whole_thread = await async_get_thread(
+            roomName=roomName, message_id=message_id, session_id=session_id
+        )
+        if whole_thread != "noThread":
+            thread_message_id = whole_thread["thread_id"]
+        url = f"{CS_BASE_URL}/api/thread/thread/{thread_message_id}/reply"
+
+    status, _, _ = await get_async_client().request(
+        "POST", url, headers=headers, json=message, cookies=cook
+    )
+    print(f"Response from ChatSurfer send public message: {status}")
+    return status
+
+
+async def async_send_dm(message_text: str, user_id: str, session_id: str):
+    """Async send_dm. Returns the HTTP status of the post."""
+    headers = {
+        "Content-type": "application/json",
+    }
+    message = {
+        "classification": "UNCLASSIFIED//FOUO",
+        "files": [],
+        "instanceId": "unclass-prod",
+        "text": message_text,
+    }
+    cook = {"SESSION": session_id}
+
+    url = f"{CS_BASE_URL}/api/directmessage/contacts/{user_id}/messages"
+
+    status, _, _ = await get_async_client().request(
+        "POST", url, headers=headers, json=message, cookies=cook
+    )
+    print(f"Response from ChatSurfer send DM: {status}")
+    return status
+
+
+async def async_get_private_rooms(session_id: str):
+    url = f"{CS_BASE_URL}/api/roommembership/rooms/private"
+    cook = {"SESSION": session_id}
+    status, _, priv_rooms_raw = await get_async_client().request("GET", url, cookies=cook)
+    if status in (401, 403):
+        # A session kept from an earlier run that the server no longer accepts
+        SESSIONS.invalidate(session_id)
+        return None
+    if priv_rooms_raw and "privateRooms" in priv_rooms_raw:
+        return [room["roomName"] for room in priv_rooms_raw["privateRooms"]]
+
+
+def search_rooms_page(page_number: int, page_size: int, session_id: str = None, query: str = ""):
+    """One page of room names, newest first, optionally only those matching
+    `query`. Returns (room names, total room count)."""
+    url = f"{CS_BASE_URL}/api/roomsearch/rooms/search"
+    cook = {"SESSION": session_id or create_session()}
+    payload = {
+        "sortCriteria": {
+            "orders": [{"sortField": "FIRST_JOINED_DATE", "sortDirection": "DESC"}]
+        },
+        "keywordCriteria": {"searchFields": ["DISPLAY_NAME"], "query": query},
+        "aboveUserDefaultHighOptIn": True,
+        "includePrivateRooms": True,
+        "pageNumber": page_number,
+        "pageSize": page_size,
+    }
+    rooms_raw = http_request("POST", url, cookies=cook, json=payload).json()
+    rooms = [room["roomName"] for room in rooms_raw.get("rooms") or []]
+    return rooms, rooms_raw.get("totalRoomCount") or 0
+
+
+def find_room(room_name: str, session_id: str = None):
+    """Asks ChatSurfer whether one room exists: a single keyword search."""
+    names, _ = search_rooms_page(0, 500, session_id, query=room_name)
+    return room_name in names
+
+
+ROOM_DIRECTORY = RoomDirectory(
+    search_rooms_page,
+    "data/found_some_cs_rooms.json",
+    find_room=find_room,
+    refresh_interval=ROOM_DIRECTORY_REFRESH_INTERVAL,
+    full_refresh_interval=ROOM_DIRECTORY_FULL_REFRESH_INTERVAL,
+)
+
+
+def do_two_rooms_exist(room_name1: str, room_name2: str, session_id: str):
+    """Checks both rooms against the local room directory.
+
+    A room it does not know is looked up on ChatSurfer by name, so a link is
+    validated in a request or two even while the directory's first full scan
+    is still running; rebuilding the directory is left to its background
+    refresh.
+    """
+    return all(
+        ROOM_DIRECTORY.lookup(room_name, session_id) for room_name in (room_name1, room_name2)
+    )
 
 
 # do_two_rooms_exist("translate_es_en", "translate_en_es", create_session())
@@ -0,0 +1,91 @@
+# utils/daemon_control.py
+
+"""Local HTTP control socket of the translator daemon, and the client the
+Streamlit pages use to talk to it.
+
+    GET  /status   daemon and per-worker state
+    GET  /metrics  raw metric values of all workers, summed
+    POST /reload   apply saved room-link changes now
+    POST /drain    finish queued messages, then shut down
+"""
+
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from config import DAEMON_CONTROL_HOST, DAEMON_CONTROL_PORT
+
+logger = logging.getLogger("websockets")
+
+
+class _ControlHandler(BaseHTTPRequestHandler):
+    def _dispatch(self, method):
+        handler = self.server.routes.get((method, self.path.split("?")[0]))
+        if handler is None:
+            self.send_error(404)
+            return
+        try:
+            body = json.dumps(handler()).encode("utf-8")
+        except Exception as e:
+            logger.error(f"Control request {method} {self.path} failed: {e}")
+            self.send_error(500, str(e))
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_control_server(routes, host=DAEMON_CONTROL_HOST, port=DAEMON_CONTROL_PORT):
+    """Serves `routes`, {(method, path): function returning JSON data}, on a
+    daemon thread. Returns the server; call shutdown() to stop it."""
+    server = ThreadingHTTPServer((host, port), _ControlHandler)
+    server.daemon_threads = True
+    server.routes = routes
+    threading.Thread(target=server.serve_forever, name="daemon-control", daemon=True).start()
+    logger.info(f"Daemon control socket on http://{host}:{port}")
+    return server
+
+
+# --- Client ---
+def _request(method, path, timeout):
+    url = f"http://{DAEMON_CONTROL_HOST}:{DAEMON_CONTROL_PORT}{path}"
+    try:
+        response = requests.request(method, url, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+    except (requests.RequestException, ValueError):
+        return None
+
+
+def daemon_status(timeout=2.0):
+    """The daemon's status, or None if no daemon is reachable."""
+    return _request("GET", "/status", timeout)
+
+
+def daemon_metrics(timeout=5.0):
+    """Summed raw metrics of every worker (see metrics.merge_exports), or None."""
+    return _request("GET", "/metrics", timeout)
+
+
+def reload_links(timeout=5.0):
+    """Asks the daemon to apply saved room links. False if it is not running."""
+    return _request("POST", "/reload", timeout) is not None
+
+
+def drain(timeout=5.0):
+    """Asks the daemon to finish queued work and exit. False if it is not running."""
+    return _request("POST", "/drain", timeout) is not None
@@ -0,0 +1,30 @@
+# utils/frame_filter.py
+
+"""Cheap room detection for incoming frames, used to drop unlinked room traffic
+before any JSON is decoded."""
+
+from utils import stomp
+
+FIREHOSE_TOPIC = "/topic/chat-messages-all"
+ROOM_TOPIC_PREFIX = "/topic/chat-messages-room/chatsurferxmppunclass/"
+
+
+def _room_for(destination, body, escaped):
+    if destination is None:
+        return None
+    if destination.startswith(ROOM_TOPIC_PREFIX):
+        return destination[len(ROOM_TOPIC_PREFIX) :]
+    if destination == FIREHOSE_TOPIC:
+        return stomp.peek_json_string(body, "roomName", escaped=escaped)
+    return None
+
+
+def raw_message_room(message):
+    """The room a raw single-frame SockJS message belongs to, if it can be told
+    without decoding. None means "unknown or not room traffic": keep it."""
+    return _room_for(stomp.peek_header(message, "destination"), message, True)
+
+
+def frame_room(frame):
+    """Like raw_message_room, for an already split frame whose body is not decoded."""
+    return _room_for(frame.destination, frame.body, False)
@@ -0,0 +1,30 @@
+# utils/frame_recorder.py
+
+import gzip
+import json
+
+
+class FrameRecorder:
+    """Appends raw websocket messages to a JSON-lines file for later replay.
+
+    Each line is one message exactly as `websocket.recv()` returned it, so the
+    file can be fed back through `process_stomp_message` by the benchmarks.
+    Paths ending in .gz are gzip-compressed.
+    """
+
+    def __init__(self, path, flush_every=100):
+        self.path = path
+        self.flush_every = flush_every
+        self.count = 0
+        opener = gzip.open if path.endswith(".gz") else open
+        self._file = opener(path, "at", encoding="utf-8")
+
+    def record(self, message):
+        self._file.write(json.dumps(message, ensure_ascii=False))
+        self._file.write("\n")
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,107 @@
+# utils/heartbeat.py
+
+import asyncio
+import logging
+import threading
+
+from utils import stomp
+
+logger = logging.getLogger("websockets")
+
+
+def negotiate(offered, accepted):
+    """STOMP heart-beat negotiation.
+
+    `offered` is the client's CONNECT header and `accepted` the server's
+    CONNECTED header, both "cx,cy" in milliseconds. Returns (send, receive)
+    in seconds: how often the client must send a heart-beat and how often it
+    can expect one. 0 means none in that direction.
+    """
+    cx, cy = _parse(offered)
+    sx, sy = _parse(accepted)
+    send = max(cx, sy) if cx and sy else 0
+    receive = max(sx, cy) if sx and cy else 0
+    return send / 1000.0, receive / 1000.0
+
+
+def _parse(header):
+    try:
+        x, y = (header or "0,0").split(",")
+        return max(0, int(x)), max(0, int(y))
+    except ValueError:
+        return 0, 0
+
+
+async def send_heartbeats(websocket, interval):
+    """Sends a STOMP heart-beat every `interval` seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        await websocket.send(stomp.HEARTBEAT)
+
+
+class Watchdog:
+    """Calls `on_silence` once nothing has arrived for `timeout` seconds.
+
+    `touch` only stores a timestamp; a single timer checks it when it would
+    expire and re-arms itself, so a busy connection costs no timer churn and
+    an idle one wakes once per timeout. While `busy` (the receiver is held
+    up by backpressure, not by the server) the timer is pushed back.
+    """
+
+    def __init__(self, timeout, on_silence):
+        self.timeout = timeout
+        self.on_silence = on_silence
+        self.expired = False
+        self.busy = False
+        self._loop = None
+        self._last = 0.0
+        self._handle = None
+
+    def start(self):
+        if not self.timeout:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._last = self._loop.time()
+        self._handle = self._loop.call_later(self.timeout, self._check)
+
+    def touch(self):
+        if self._loop is not None:
+            self._last = self._loop.time()
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _check(self):
+        now = self._loop.time()
+        if self.busy:
+            self._last = now
+        silent = now - self._last
+        if silent < self.timeout:
+            self._handle = self._loop.call_later(self.timeout - silent, self._check)
+            return
+        self._handle = None
+        self.expired = True
+        self.on_silence()
+
+
+def stop_signal(stop_event, loop):
+    """An asyncio.Event on `loop` that is set when the threading.Event
+    `stop_event` is.
+
+    A waiter thread bridges the two, so the loop learns of a stop at once
+    instead of polling for it. The thread lives until `stop_event` is set.
+    """
+    stopped = asyncio.Event()
+
+    def wake():
+        stop_event.wait()
+        try:
+            loop.call_soon_threadsafe(stopped.set)
+        except RuntimeError:
+            # The loop is already closed; nothing is waiting any more
+            pass
+
+    threading.Thread(target=wake, name="stop-signal", daemon=True).start()
+    return stopped
@@ -0,0 +1,149 @@
+# utils/http_client.py
+
+import asyncio
+import functools
+import http.cookiejar
+import ssl
+import threading
+import weakref
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import (
+    CA_BUNDLE_PATH,
+    CERT_PATH,
+    CS_USE_TLS,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_POOL_SIZE,
+    HTTP_READ_TIMEOUT,
+    HTTP_RETRIES,
+    KEY_PATH,
+)
+
+# Only idempotent calls are retried automatically; a retried POST could double-post
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_METHODS = frozenset(["GET", "HEAD", "OPTIONS"])
+
+
+@functools.lru_cache(maxsize=None)
+def get_ssl_context():
+    """The mutual-TLS context for ChatSurfer, built once per process.
+
+    None when CS_USE_TLS is off (plain ws/http to a local stand-in).
+    """
+    if not CS_USE_TLS:
+        return None
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    ssl_context.load_verify_locations(CA_BUNDLE_PATH)
+    ssl_context.load_cert_chain(CERT_PATH, KEY_PATH)
+    return ssl_context
+
+
+_sync_session = None
+_sync_lock = threading.Lock()
+
+
+def get_http_session():
+    """A shared keep-alive requests.Session with a connection pool and retries."""
+    global _sync_session
+    if _sync_session is None:
+        with _sync_lock:
+            if _sync_session is None:
+                session = requests.Session()
+                if CS_USE_TLS:
+                    session.cert = (CERT_PATH, KEY_PATH)
+                    session.verify = CA_BUNDLE_PATH
+                # Session cookies are passed per call; never let responses stick
+                session.cookies.set_policy(
+                    http.cookiejar.DefaultCookiePolicy(allowed_domains=[])
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_POOL_SIZE,
+                    pool_maxsize=HTTP_POOL_SIZE,
+                    max_retries=Retry(
+                        total=HTTP_RETRIES,
+                        backoff_factor=0.3,
+                        status_forcelist=RETRY_STATUSES,
+                        allowed_methods=RETRY_METHODS,
+                        # Hand back the last response, as before pooling;
+                        # callers check status_code, not RetryError
+                        raise_on_status=False,
+                    ),
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _sync_session = session
+    return _sync_session
+
+
+def request(method, url, **kwargs):
+    """Sends a request through the shared session with the default timeouts."""
+    kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    return get_http_session().request(method, url, **kwargs)
+
+
+class AsyncHttpClient:
+    """Pooled aiohttp client bound to one event loop.
+
+    Reuses keep-alive connections and the cached mTLS context, so concurrent
+    posts share a handful of TLS handshakes instead of paying one per call.
+    """
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, retries=HTTP_RETRIES):
+        self.retries = retries
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                ssl=get_ssl_context() or False, limit=pool_size, keepalive_timeout=60
+            ),
+            cookie_jar=aiohttp.DummyCookieJar(),
+            timeout=aiohttp.ClientTimeout(
+                sock_connect=HTTP_CONNECT_TIMEOUT, sock_read=HTTP_READ_TIMEOUT
+            ),
+        )
+
+    async def request(self, method, url, **kwargs):
+        """Sends a request and returns (status, headers, parsed JSON or None)."""
+        attempts = self.retries + 1 if method in RETRY_METHODS else 1
+        delay = 0.3
+        for attempt in range(attempts):
+            try:
+                async with self._session.request(method, url, **kwargs) as resp:
+                    if resp.status in RETRY_STATUSES and attempt + 1 < attempts:
+                        await asyncio.sleep(delay)
+                        delay *= 2
+                        continue
+                    try:
+                        body = await resp.json(content_type=None)
+                    except ValueError:
+                        body = None
+                    return resp.status, resp.headers, body
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt + 1 >= attempts:
+                    raise
+                await asyncio.sleep(delay)
+                delay *= 2
+
+    async def close(self):
+        await self._session.close()
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """The AsyncHttpClient for the running event loop, created on first use."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncHttpClient()
+    return client
+
+
+async def close_async_client():
+    """Closes the running loop's client; call before the loop is shut down."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
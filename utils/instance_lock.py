@@ -0,0 +1,59 @@
+# utils/instance_lock.py
+
+import fcntl
+import json
+import os
+
+
+class AlreadyRunning(Exception):
+    """Another process holds the lock; `owner` is what it wrote into the file."""
+
+    def __init__(self, path, owner):
+        super().__init__(f"{path} is held by {owner or 'another process'}")
+        self.owner = owner
+
+
+class InstanceLock:
+    """Exclusive lock file that keeps a second daemon from starting.
+
+    Uses flock, so the lock goes away with the process that held it, even on
+    a crash or SIGKILL, and a stale file never blocks a restart. The holder's
+    details (pid, control port) are written into the file for diagnostics.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self, **owner):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # Opened without truncating so a failed attempt keeps the owner's details
+        f = open(self.path, "a+", encoding="utf-8")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.seek(0)
+            try:
+                current = json.loads(f.read() or "null")
+            except json.JSONDecodeError:
+                current = None
+            f.close()
+            raise AlreadyRunning(self.path, current)
+        f.seek(0)
+        f.truncate()
+        json.dump({"pid": os.getpid(), **owner}, f)
+        f.flush()
+        self._file = f
+        return self
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
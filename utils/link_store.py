@@ -0,0 +1,177 @@
+# utils/link_store.py
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from config import LINKS_DB
+
+logger = logging.getLogger("websockets")
+
+LINK_FIELDS = ("pairId", "room1name", "room2name", "room1lang", "room2lang", "groupId")
+
+
+class LinkStore:
+    """Room links in SQLite, shared safely by every thread and process.
+
+    A link joins two rooms. Links created together share a groupId, and
+    every room in a group mirrors into every other one (a hub room and its
+    language rooms); a plain pair is a group of two.
+
+    Each change runs in its own transaction and bumps a version counter, so
+    readers can poll `version()` (one indexed row) and only reload links when
+    it moves. Links are looked up by pairId or by either room name through
+    indexes. On first use, links from the old rooms_for_translating.json are
+    imported once; the file is left in place but no longer read.
+    """
+
+    def __init__(self, db_path, legacy_json=None):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS links ("
+                " pair_id TEXT PRIMARY KEY, room1name TEXT NOT NULL,"
+                " room2name TEXT NOT NULL, room1lang TEXT NOT NULL,"
+                " room2lang TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(links)")]
+            if "group_id" not in columns:
+                self._db.execute("ALTER TABLE links ADD COLUMN group_id TEXT")
+            self._db.execute("CREATE INDEX IF NOT EXISTS links_room1 ON links (room1name)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS links_room2 ON links (room2name)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            self._db.execute("INSERT OR IGNORE INTO meta VALUES ('version', 0)")
+        if legacy_json:
+            self._migrate(legacy_json)
+
+    def _migrate(self, path):
+        with self._lock:
+            done = self._db.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone()
+        if done:
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                pairs = json.load(f).get("rooms", [])
+        except FileNotFoundError:
+            pairs = []
+        except (json.JSONDecodeError, AttributeError) as e:
+            logger.error(f"Not migrating unreadable {path}: {e}")
+            return
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            # Another process may have migrated while we read the file
+            if self._db.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone():
+                return
+            for pair in pairs:
+                pair_id = pair.get("pairId") or str(uuid.uuid4())
+                self._db.execute(
+                    "INSERT OR IGNORE INTO links (pair_id, room1name, room2name,"
+                    " room1lang, room2lang, group_id, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        pair_id,
+                        pair["room1name"],
+                        pair["room2name"],
+                        pair["room1lang"],
+                        pair["room2lang"],
+                        pair_id,
+                        time.time(),
+                    ),
+                )
+            self._db.execute("INSERT INTO meta VALUES ('migrated', 1)")
+            self._bump()
+        if pairs:
+            logger.info(f"Migrated {len(pairs)} room links from {path} into {self.db_path}.")
+
+    def _bump(self):
+        self._db.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    def _rows(self, sql, params=()):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT pair_id, room1name, room2name, room1lang, room2lang,"
+                " COALESCE(group_id, pair_id) FROM links " + sql,
+                params,
+            ).fetchall()
+        return [dict(zip(LINK_FIELDS, row)) for row in rows]
+
+    def version(self):
+        """Changes every time a link is added or removed, by any process."""
+        with self._lock:
+            return self._db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def links(self):
+        """Every link as a dict in the old JSON layout plus groupId, oldest first."""
+        return self._rows("ORDER BY created, pair_id")
+
+    def get(self, pair_id):
+        rows = self._rows("WHERE pair_id = ?", (pair_id,))
+        return rows[0] if rows else None
+
+    def find(self, room_name):
+        """Links that include `room_name` on either side."""
+        return self._rows(
+            "WHERE room1name = ? UNION SELECT pair_id, room1name, room2name, room1lang,"
+            " room2lang, COALESCE(group_id, pair_id) FROM links WHERE room2name = ?",
+            (room_name, room_name),
+        )
+
+    def has_link(self, room_a, room_b):
+        """True if `room_a` and `room_b` are already linked directly, either way round."""
+        return any(
+            {link["room1name"], link["room2name"]} == {room_a, room_b}
+            for link in self.find(room_a)
+        )
+
+    def add_link(self, room1name, room1lang, room2name, room2lang, pair_id=None):
+        """Stores a new link between two rooms and returns it."""
+        pair_id = pair_id or str(uuid.uuid4())
+        return self._add([(pair_id, room1name, room2name, room1lang, room2lang, pair_id)])[0]
+
+    def add_group(self, hub_name, hub_lang, members):
+        """Links `hub_name` with every (room name, language) in `members`, as
+        one group in one transaction. Returns the new links."""
+        group_id = str(uuid.uuid4())
+        return self._add(
+            [
+                (str(uuid.uuid4()), hub_name, name, hub_lang, lang, group_id)
+                for name, lang in members
+            ]
+        )
+
+    def _add(self, rows):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT INTO links (pair_id, room1name, room2name, room1lang, room2lang,"
+                " group_id, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(*row, now) for row in rows],
+            )
+            self._bump()
+        return [dict(zip(LINK_FIELDS, row)) for row in rows]
+
+    def remove_link(self, pair_id):
+        """Deletes a link. Returns False if there was no such link."""
+        with self._lock, self._db:
+            removed = self._db.execute(
+                "DELETE FROM links WHERE pair_id = ?", (pair_id,)
+            ).rowcount
+            if removed:
+                self._bump()
+        return bool(removed)
+
+
+ROOMS_FILE = "data/rooms_for_translating.json"
+
+# Shared by the daemon and the Streamlit pages; the old JSON file is
+# imported on first start
+LINK_STORE = LinkStore(LINKS_DB, legacy_json=ROOMS_FILE)
@@ -0,0 +1,405 @@
+# utils/metrics.py
+
+"""In-process counters, gauges and histograms with a Prometheus text exporter.
+
+Metrics live in module-level objects so any thread can record into them
+cheaply. `render()` produces the Prometheus text exposition format, served by
+`start_exporter`; `snapshot()` gives the same data as plain dicts. Worker
+processes hand their raw values to the daemon with `export()`, which sums them
+with `merge_exports` for the Streamlit metrics page (`snapshot_from`).
+"""
+
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("websockets")
+
+# Seconds; covers a fast parse (~10us) up to a Translate call that timed out
+DEFAULT_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._function = None
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def set_function(self, function):
+        """Reads values from `function()` at export time instead of storing them.
+
+        It returns a number for an unlabelled metric, or a dict of label
+        tuple -> number. Pass None to go back to stored values.
+        """
+        self._function = function
+
+    def _values(self):
+        if self._function is not None:
+            try:
+                values = self._function()
+            except Exception as e:
+                logger.error(f"Metric {self.name} callback failed: {e}")
+                return {}
+            return values if isinstance(values, dict) else {(): values}
+        with self._lock:
+            return dict(self._data)
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self._values().items()):
+            lines.append(f"{self.name}{self._format_labels(key)} {value}")
+        return lines
+
+    def snapshot(self, values=None):
+        return dict(self._values() if values is None else values)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._data = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._data[key] = self._data.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._data = {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._data[self._key(labels)] = value
+
+
+class _HistogramValue:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._data = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        # The last slot counts observations above the largest bucket (+Inf)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                entry = self._data[key] = _HistogramValue(len(self.buckets) + 1)
+            entry.counts[index] += 1
+            entry.sum += value
+            entry.count += 1
+
+    def _values(self):
+        with self._lock:
+            return {
+                key: (list(v.counts), v.sum, v.count) for key, v in self._data.items()
+            }
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self._values().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                labels = self._format_labels(key, [("le", bound)])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = self._format_labels(key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+    def snapshot(self, values=None):
+        return {
+            key: {
+                "count": count,
+                "sum": total,
+                "p50": self._quantile(counts, count, 0.50),
+                "p95": self._quantile(counts, count, 0.95),
+                "p99": self._quantile(counts, count, 0.99),
+            }
+            for key, (counts, total, count) in (
+                self._values() if values is None else values
+            ).items()
+        }
+
+    def _quantile(self, counts, count, q):
+        """Estimates a quantile by interpolating inside the bucket, the same
+        way Prometheus' histogram_quantile does."""
+        if not count:
+            return None
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """{metric name: {label tuple: value}} for in-process readers."""
+        return {name: metric.snapshot() for name, metric in list(self._metrics.items())}
+
+    def export(self):
+        """Raw values as JSON-friendly {name: [[labels, value], ...]}; a
+        histogram's value is [bucket counts, sum, count]."""
+        return {
+            name: [[list(key), value] for key, value in metric._values().items()]
+            for name, metric in list(self._metrics.items())
+        }
+
+    def snapshot_from(self, exported):
+        """Like snapshot, for values from `export` or `merge_exports`."""
+        return {
+            name: metric.snapshot(
+                {tuple(key): value for key, value in exported.get(name, [])}
+            )
+            for name, metric in list(self._metrics.items())
+        }
+
+
+def _add(total, value):
+    if total is None:
+        return value
+    if isinstance(value, list):
+        # Histogram: [bucket counts, sum, count]
+        counts = [a + b for a, b in zip(total[0], value[0])]
+        return [counts, total[1] + value[1], total[2] + value[2]]
+    return total + value
+
+
+def merge_exports(exports):
+    """Sums the exports of several processes. Gauges are summed too, which
+    suits queue depths and concurrency limits of separate workers."""
+    merged = {}
+    for exported in exports:
+        for name, rows in exported.items():
+            values = merged.setdefault(name, {})
+            for key, value in rows:
+                values[tuple(key)] = _add(values.get(tuple(key)), value)
+    return {
+        name: [[list(key), value] for key, value in values.items()]
+        for name, values in merged.items()
+    }
+
+
+REGISTRY = MetricsRegistry()
+
+# --- Client metrics ---
+FRAMES_RECEIVED = REGISTRY.counter(
+    "chat_translation_frames_received_total", "Websocket messages received."
+)
+FRAMES_DROPPED = REGISTRY.counter(
+    "chat_translation_frames_dropped_total",
+    "Frames dropped before translation, by reason.",
+    ["reason"],
+)
+RECONNECTS = REGISTRY.counter(
+    "chat_translation_reconnects_total", "Websocket reconnect attempts."
+)
+SILENT_CONNECTIONS = REGISTRY.counter(
+    "chat_translation_silent_connections_total",
+    "Connections dropped by the watchdog after the server went silent.",
+)
+BACKFILLED = REGISTRY.counter(
+    "chat_translation_backfilled_total",
+    "Messages fetched after a reconnect, by result (queued, duplicate, too_old).",
+    ["result"],
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "chat_translation_stage_seconds",
+    "Time spent in each pipeline stage handler.",
+    ["stage"],
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "chat_translation_queue_depth", "Items waiting in front of each pipeline stage.", ["stage"]
+)
+LANE_DEPTH = REGISTRY.gauge(
+    "chat_translation_lane_depth",
+    "Items waiting in the lanes of a fairly scheduled stage, per lane class (room or dm).",
+    ["stage", "lane_class"],
+)
+LANE_WAIT_SECONDS = REGISTRY.histogram(
+    "chat_translation_lane_wait_seconds",
+    "Time an item waited in its lane before a worker took it, per lane class.",
+    ["stage", "lane_class"],
+)
+SESSION_SECONDS = REGISTRY.histogram(
+    "chat_translation_session_seconds", "Time spent getting a ChatSurfer session for a post."
+)
+THROTTLED = REGISTRY.counter(
+    "chat_translation_throttled_total", "Calls throttled (429/503) by a remote API.", ["api"]
+)
+CONCURRENCY_LIMIT = REGISTRY.gauge(
+    "chat_translation_concurrency_limit", "Current adaptive concurrency limit.", ["api"]
+)
+OUTBOX_MESSAGES = REGISTRY.gauge(
+    "chat_translation_outbox_messages", "Messages in the outbox, by state.", ["state"]
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "chat_translation_cache_requests_total", "Translation cache lookups, by result.", ["result"]
+)
+MEMORY_SEGMENTS = REGISTRY.counter(
+    "chat_translation_memory_segments_total",
+    "Translation memory segment lookups, by result.",
+    ["result"],
+)
+MEMORY_CHARACTERS = REGISTRY.counter(
+    "chat_translation_memory_characters_total",
+    "Characters in translation memory segment lookups, by result.",
+    ["result"],
+)
+MESSAGES_SKIPPED = REGISTRY.counter(
+    "chat_translation_messages_skipped_total",
+    "Translations skipped by the pre-translation filter, by reason and action.",
+    ["reason", "action"],
+)
+CHARACTERS_SKIPPED = REGISTRY.counter(
+    "chat_translation_characters_skipped_total",
+    "Characters not sent to the Translate API thanks to the skip filter.",
+    ["reason"],
+)
+MESSAGES_COALESCED = REGISTRY.counter(
+    "chat_translation_messages_coalesced_total",
+    "Messages joined onto an earlier one from the same sender in a burst.",
+)
+CALLS_SAVED = REGISTRY.counter(
+    "chat_translation_calls_saved_total",
+    "Translate requests and posts saved by burst coalescing, by call.",
+    ["call"],
+)
+
+# --- Per room pair ---
+PAIR_LABELS = ["source_room", "target_room"]
+MESSAGES_TRANSLATED = REGISTRY.counter(
+    "chat_translation_messages_translated_total", "Messages translated.", PAIR_LABELS
+)
+MESSAGES_POSTED = REGISTRY.counter(
+    "chat_translation_messages_posted_total",
+    "Translations posted to ChatSurfer, by outcome.",
+    PAIR_LABELS + ["outcome"],
+)
+TRANSLATE_SECONDS = REGISTRY.histogram(
+    "chat_translation_translate_seconds", "Translate latency per message.", PAIR_LABELS
+)
+POST_SECONDS = REGISTRY.histogram(
+    "chat_translation_post_seconds", "ChatSurfer post latency per message.", PAIR_LABELS
+)
+LAG_SECONDS = REGISTRY.histogram(
+    "chat_translation_lag_seconds",
+    "Message timestamp to translated post, end to end.",
+    PAIR_LABELS,
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+
+
+# --- Exporter ---
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def start_exporter(port, host="127.0.0.1"):
+    """Serves /metrics on a daemon thread. Safe to call more than once."""
+    global _exporter
+    with _exporter_lock:
+        if _exporter is not None or not port:
+            return _exporter
+        try:
+            _exporter = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            logger.error(f"Could not start metrics exporter on {host}:{port}: {e}")
+            return None
+        _exporter.daemon_threads = True
+        threading.Thread(
+            target=_exporter.serve_forever, name="metrics-exporter", daemon=True
+        ).start()
+        logger.info(f"Metrics exporter listening on http://{host}:{port}/metrics")
+        return _exporter
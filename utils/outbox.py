@@ -0,0 +1,356 @@
+# utils/outbox.py
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("websockets")
+
+ACCEPTED = "accepted"
+TRANSLATED = "translated"
+POSTED = "posted"
+FAILED = "failed"  # rejected by ChatSurfer, or given up on; never retried
+MERGED = "merged"  # joined into another message of the same burst
+DROPPED = "dropped"  # left out by the skip filter, or no longer routed there
+DONE = (POSTED, FAILED, MERGED, DROPPED)
+
+
+class Outbox:
+    """Durable record of every message the client has taken on.
+
+    Each (source message id, target room) moves accepted -> translated ->
+    posted, or failed if ChatSurfer rejects it outright or it is still
+    unfinished after `max_attempts` resumes or `max_age` seconds. Messages are
+    accepted as soon as they are received, so work still queued in memory
+    is not lost. Rows are written by a background thread that commits in
+    batches, in the order they were queued (WAL, synchronous=NORMAL: a
+    commit survives a process crash without an fsync per message), so the
+    hot path only queues a write. Unfinished rows are handed back by
+    `claim_pending` after a restart or reconnect; finished rows are kept for
+    `retention` seconds so a message that arrives again is not posted twice,
+    then compacted away.
+
+    A crash between a successful post and the next commit (at most
+    `commit_interval` seconds) can still repost that one message.
+    """
+
+    def __init__(
+        self,
+        db_path,
+        commit_interval=0.2,
+        commit_every=500,
+        retention=24 * 60 * 60,
+        compact_interval=10 * 60,
+        max_attempts=5,
+        max_age=6 * 60 * 60,
+    ):
+        self.db_path = db_path
+        self.commit_interval = commit_interval
+        self.commit_every = commit_every
+        self.retention = retention
+        self.compact_interval = compact_interval
+        self.max_attempts = max_attempts
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._states = {}  # (message_id, target_room) -> state
+        self._in_flight = set()
+        self._writes = queue.Queue()
+        self._db_lock = threading.Lock()
+        self.duplicates = 0
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " message_id TEXT NOT NULL, target_room TEXT NOT NULL,"
+            " state TEXT NOT NULL, message TEXT NOT NULL, outgoing TEXT,"
+            " created REAL NOT NULL, updated REAL NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (message_id, target_room))"
+        )
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(outbox)")]
+        if "attempts" not in columns:
+            self._db.execute(
+                "ALTER TABLE outbox ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0"
+            )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS outbox_state ON outbox (state, updated)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS watermarks ("
+            " room TEXT PRIMARY KEY, timestamp TEXT NOT NULL, message_id TEXT)"
+        )
+        self._db.commit()
+        for message_id, target_room, state in self._db.execute(
+            "SELECT message_id, target_room, state FROM outbox"
+        ):
+            self._states[(message_id, target_room)] = state
+
+        self._writer = threading.Thread(target=self._write_loop, name="outbox", daemon=True)
+        self._writer.start()
+
+    # --- Hot path ---
+    def accept(self, message_id, target_room, message):
+        """Claims a message for translation into `target_room`.
+
+        Returns False if it was already posted or is being worked on, i.e.
+        it is a duplicate and must be dropped.
+        """
+        key = (message_id, target_room)
+        with self._lock:
+            state = self._states.get(key)
+            if state in DONE or key in self._in_flight:
+                self.duplicates += 1
+                return False
+            self._in_flight.add(key)
+            if state is None:
+                self._states[key] = ACCEPTED
+                now = time.time()
+                self._writes.put(
+                    (
+                        "INSERT OR IGNORE INTO outbox (message_id, target_room, state,"
+                        " message, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                        (message_id, target_room, ACCEPTED, json.dumps(message), now, now),
+                    )
+                )
+        return True
+
+    def merge(self, message_ids, target_room):
+        """Records messages that were joined into another one for
+        `target_room`, so a later copy of any of them is a duplicate.
+        Entries they already had are finished."""
+        now = time.time()
+        with self._lock:
+            for message_id in message_ids:
+                key = (message_id, target_room)
+                state = self._states.get(key)
+                if state in DONE:
+                    continue
+                self._states[key] = MERGED
+                self._in_flight.discard(key)
+                if state is None:
+                    self._writes.put(
+                        (
+                            "INSERT OR IGNORE INTO outbox (message_id, target_room,"
+                            " state, message, created, updated) VALUES (?, ?, ?, '', ?, ?)",
+                            (message_id, target_room, MERGED, now, now),
+                        )
+                    )
+                else:
+                    self._writes.put(
+                        (
+                            "UPDATE outbox SET state = ?, message = '', outgoing = NULL,"
+                            " updated = ? WHERE message_id = ? AND target_room = ?",
+                            (MERGED, now, message_id, target_room),
+                        )
+                    )
+
+    def mark_translated(self, message_id, target_room, outgoing):
+        with self._lock:
+            self._states[(message_id, target_room)] = TRANSLATED
+        self._writes.put(
+            (
+                "UPDATE outbox SET state = ?, outgoing = ?, updated = ?"
+                " WHERE message_id = ? AND target_room = ?",
+                (TRANSLATED, json.dumps(outgoing), time.time(), message_id, target_room),
+            )
+        )
+
+    def mark_posted(self, message_id, target_room):
+        self._finish(message_id, target_room, POSTED)
+
+    def mark_failed(self, message_id, target_room):
+        self._finish(message_id, target_room, FAILED)
+
+    def mark_dropped(self, message_id, target_room):
+        self._finish(message_id, target_room, DROPPED)
+
+    def _finish(self, message_id, target_room, state):
+        key = (message_id, target_room)
+        with self._lock:
+            self._states[key] = state
+            self._in_flight.discard(key)
+        self._write_final(key, state)
+
+    def _write_final(self, key, state):
+        # The payload is no longer needed, only the key for deduplication
+        self._writes.put(
+            (
+                "UPDATE outbox SET state = ?, message = '', outgoing = NULL, updated = ?"
+                " WHERE message_id = ? AND target_room = ?",
+                (state, time.time(), *key),
+            )
+        )
+
+    def release(self, message_id, target_room):
+        """Gives up on a message for now; it is retried by the next
+        `claim_pending`, until it runs out of attempts."""
+        with self._lock:
+            self._in_flight.discard((message_id, target_room))
+
+    def release_all(self):
+        """Releases everything in flight, e.g. after a pipeline was stopped
+        with work still queued."""
+        with self._lock:
+            self._in_flight.clear()
+
+    # --- Recovery ---
+    def claim_pending(self, owns=None):
+        """Unfinished work not currently in flight, oldest first.
+
+        Returns (messages, outgoings): accepted messages to run through
+        translation again (they are claimed by `accept`), and translated
+        messages ready to post, which are claimed here. With `owns`, only
+        work whose source room `owns(room)` accepts is returned, so processes
+        sharing the outbox each resume their own rooms.
+
+        Every claim counts as an attempt. Work already claimed `max_attempts`
+        times, or accepted more than `max_age` seconds ago, keeps failing for
+        a reason retrying will not fix (or is too stale to post); it is
+        marked failed instead of being returned.
+        """
+        self.flush()
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT message_id, target_room, state, message, outgoing, created,"
+                " attempts FROM outbox WHERE state IN (?, ?) ORDER BY created",
+                (ACCEPTED, TRANSLATED),
+            ).fetchall()
+        now = time.time()
+        messages, outgoings = [], []
+        with self._lock:
+            for message_id, target_room, state, message, outgoing, created, attempts in rows:
+                key = (message_id, target_room)
+                if key in self._in_flight or self._states.get(key) in DONE:
+                    continue
+                if state == TRANSLATED:
+                    work = json.loads(outgoing)
+                    room = work.get("source_room")
+                else:
+                    work = json.loads(message)
+                    room = work.get("roomName")
+                if owns is not None and not owns(room):
+                    continue
+                if attempts >= self.max_attempts:
+                    self._give_up(key, f"still {state} after {attempts} attempts")
+                    continue
+                if now - created > self.max_age:
+                    self._give_up(key, f"still {state} after {now - created:.0f}s")
+                    continue
+                self._writes.put(
+                    (
+                        "UPDATE outbox SET attempts = attempts + 1"
+                        " WHERE message_id = ? AND target_room = ?",
+                        key,
+                    )
+                )
+                if state == TRANSLATED:
+                    self._in_flight.add(key)
+                    outgoings.append(work)
+                else:
+                    messages.append(work)
+        return messages, outgoings
+
+    def _give_up(self, key, reason):
+        # Called with self._lock held
+        logger.warning(f"Outbox gave up on message {key[0]} for {key[1]}: {reason}.")
+        self._states[key] = FAILED
+        self._write_final(key, FAILED)
+
+    # --- High-water marks ---
+    def load_watermarks(self):
+        """(room, timestamp, message id) of the newest message taken on per room."""
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT room, timestamp, message_id FROM watermarks"
+            ).fetchall()
+
+    def save_watermark(self, room, timestamp, message_id):
+        self._writes.put(
+            (
+                "INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?)",
+                (room, timestamp, message_id),
+            )
+        )
+
+    # --- Writer ---
+    def _write_loop(self):
+        last_compact = time.monotonic()
+        while True:
+            batch = [self._writes.get()]
+            deadline = time.monotonic() + self.commit_interval
+            while len(batch) < self.commit_every:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._writes.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                with self._db_lock, self._db:
+                    for sql, params in batch:
+                        self._db.execute(sql, params)
+            except sqlite3.Error as e:
+                logger.error(f"Outbox commit of {len(batch)} writes failed: {e}")
+            finally:
+                for _ in batch:
+                    self._writes.task_done()
+            if time.monotonic() - last_compact > self.compact_interval:
+                self.compact()
+                last_compact = time.monotonic()
+
+    def compact(self):
+        """Drops finished rows (posted, failed, merged or dropped) older than
+        the retention window."""
+        cutoff = time.time() - self.retention
+        done = f"state IN ({', '.join('?' * len(DONE))}) AND updated < ?"
+        try:
+            with self._db_lock:
+                with self._db:
+                    removed = self._db.execute(
+                        f"SELECT message_id, target_room FROM outbox WHERE {done}",
+                        (*DONE, cutoff),
+                    ).fetchall()
+                    self._db.execute(f"DELETE FROM outbox WHERE {done}", (*DONE, cutoff))
+                self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error as e:
+            logger.error(f"Outbox compaction failed: {e}")
+            return
+        with self._lock:
+            for key in removed:
+                if self._states.get(key) in DONE:
+                    del self._states[key]
+        if removed:
+            logger.info(f"Outbox compacted {len(removed)} finished messages.")
+
+    def flush(self, timeout=None):
+        """Waits until every queued write is committed."""
+        if timeout is None:
+            self._writes.join()
+            return True
+        # queue.join has no timeout; poll the unfinished count instead
+        deadline = time.monotonic() + timeout
+        while self._writes.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for state in self._states.values():
+                counts[state] = counts.get(state, 0) + 1
+            return {
+                "states": counts,
+                "in_flight": len(self._in_flight),
+                "duplicates": self.duplicates,
+                "queued_writes": self._writes.qsize(),
+            }
@@ -0,0 +1,204 @@
+# utils/pipeline.py
+
+import asyncio
+import logging
+import time
+
+from utils.metrics import FRAMES_DROPPED, LANE_DEPTH, QUEUE_DEPTH, STAGE_SECONDS
+from utils.thread_pool import DaemonThreadPool
+
+logger = logging.getLogger("websockets")
+
+
+class Stage:
+    """One step of the pipeline: a bounded input queue drained by N workers.
+
+    The handler receives one item and returns the item for the next stage,
+    a list of items to fan out, or None to drop it. Blocking handlers are run
+    on the pipeline's thread pool so they never stall the event loop. A stage
+    that holds items back (e.g. to batch them) gives a `flush(drain)`
+    coroutine returning what it holds, which is called when the pipeline stops.
+    `queue` replaces the plain FIFO input queue, e.g. with a scheduler.FairQueue.
+    """
+
+    def __init__(
+        self, name, handler, workers=1, maxsize=0, blocking=False, flush=None, queue=None
+    ):
+        self.name = name
+        self.handler = handler
+        self.flush = flush
+        self.workers = workers
+        self.blocking = blocking
+        self.queue = queue if queue is not None else asyncio.Queue(maxsize=maxsize)
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+
+
+class Pipeline:
+    """Stages joined by bounded asyncio queues.
+
+    Only the entry point applies the overflow policy: "block" makes `put` wait
+    for room (backpressure onto the websocket), "drop" discards the new item.
+    Inner stages always block, so a slow stage backs up into the entry queue
+    instead of silently losing work that was already paid for.
+    """
+
+    def __init__(self, stages, overflow="block", report_interval=30.0):
+        if overflow not in ("block", "drop"):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.stages = stages
+        self.overflow = overflow
+        self.report_interval = report_interval
+        self._tasks = []
+        blocking_workers = sum(s.workers for s in stages if s.blocking)
+        self._executor = (
+            DaemonThreadPool(blocking_workers, thread_name_prefix="pipeline")
+            if blocking_workers
+            else None
+        )
+
+    async def start(self):
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                self._tasks.append(
+                    asyncio.create_task(
+                        self._worker(index), name=f"{stage.name}-{n}"
+                    )
+                )
+        if self.report_interval:
+            self._tasks.append(asyncio.create_task(self._reporter()))
+        QUEUE_DEPTH.set_function(
+            lambda: {(name,): depth for name, depth in self.queue_depths().items()}
+        )
+        LANE_DEPTH.set_function(self._lane_depths)
+
+    async def put(self, item):
+        """Feeds an item into the first stage. Returns False if it was dropped."""
+        stage = self.stages[0]
+        if self.overflow == "drop":
+            try:
+                stage.queue.put_nowait(item)
+            except asyncio.QueueFull:
+                stage.dropped += 1
+                FRAMES_DROPPED.inc(reason="overflow")
+                if stage.dropped % 100 == 1:
+                    logger.warning(
+                        f"Pipeline stage '{stage.name}' is full, "
+                        f"dropped {stage.dropped} items so far."
+                    )
+                return False
+        else:
+            await stage.queue.put(item)
+        return True
+
+    async def put_at(self, stage_name, item):
+        """Feeds an item straight into a later stage, e.g. to resume work
+        that already went through the earlier ones. Always waits for room."""
+        for stage in self.stages:
+            if stage.name == stage_name:
+                await stage.queue.put(item)
+                return
+        raise KeyError(stage_name)
+
+    async def _worker(self, index):
+        stage = self.stages[index]
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await stage.queue.get()
+            started = time.perf_counter()
+            try:
+                if stage.blocking:
+                    result = await loop.run_in_executor(
+                        self._executor, stage.handler, item
+                    )
+                else:
+                    result = await stage.handler(item)
+                stage.processed += 1
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage.name)
+                if result is not None and index + 1 < len(self.stages):
+                    if hasattr(stage.queue, "wait_turn"):
+                        # Keeps a lane's results in order (scheduler.FairQueue)
+                        await stage.queue.wait_turn()
+                    next_queue = self.stages[index + 1].queue
+                    for out in result if isinstance(result, list) else [result]:
+                        await next_queue.put(out)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                stage.errors += 1
+                logger.error(f"Error in pipeline stage '{stage.name}': {e}")
+            finally:
+                stage.queue.task_done()
+
+    async def _reporter(self):
+        last = None
+        while True:
+            await asyncio.sleep(self.report_interval)
+            depths = self.queue_depths()
+            if any(depths.values()) or depths != last:
+                logger.info(f"Pipeline queue depths: {depths}")
+            last = depths
+
+    def _lane_depths(self):
+        return {
+            (stage.name, lane_class): depth
+            for stage in self.stages
+            if hasattr(stage.queue, "class_depths")
+            for lane_class, depth in stage.queue.class_depths().items()
+        }
+
+    def queue_depths(self):
+        """Current number of items waiting in front of each stage."""
+        return {stage.name: stage.queue.qsize() for stage in self.stages}
+
+    def stats(self):
+        """Per-stage depth and counters, for status pages and logging."""
+        return {
+            stage.name: {
+                "depth": stage.queue.qsize(),
+                "maxsize": stage.queue.maxsize,
+                "workers": stage.workers,
+                "processed": stage.processed,
+                "dropped": stage.dropped,
+                "errors": stage.errors,
+            }
+            for stage in self.stages
+        }
+
+    async def stop(self, drain=True, timeout=5.0):
+        """Stops all workers, optionally giving queued items time to finish."""
+        if drain:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            try:
+                # Items flow forward, so join the stages in order.
+                for index, stage in enumerate(self.stages):
+                    await asyncio.wait_for(
+                        stage.queue.join(), timeout=max(0, deadline - loop.time())
+                    )
+                    if stage.flush is not None and index + 1 < len(self.stages):
+                        held = await asyncio.wait_for(
+                            stage.flush(True), timeout=max(0, deadline - loop.time())
+                        )
+                        for item in held:
+                            await self.stages[index + 1].queue.put(item)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"Pipeline did not drain within {timeout}s: {self.queue_depths()}"
+                )
+        for stage in self.stages:
+            if stage.flush is not None:
+                # Whatever is still held is given up, like queued items
+                await stage.flush(False)
+        QUEUE_DEPTH.set_function(None)
+        LANE_DEPTH.set_function(None)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor:
+            # Calls still running are cut off when the process exits instead
+            # of holding it open until their HTTP timeout; whatever they had
+            # in flight is resumed from the outbox
+            self._executor.shutdown(wait=False, cancel_futures=True)
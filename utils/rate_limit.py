@@ -0,0 +1,304 @@
+# utils/rate_limit.py
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger("websockets")
+
+# Responses that mean "slow down", not "this request is bad"
+THROTTLE_STATUSES = (429, 503)
+
+
+class Throttled(Exception):
+    """Raised by a throttled call; `retry_after` is the server's hint, if any."""
+
+    def __init__(self, message="throttled", retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header (only the delta-seconds form)."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def as_throttled(error):
+    """Converts a 429/503 from google-api-core or requests into Throttled.
+
+    Returns None for any other error, which should propagate unchanged.
+    """
+    status = getattr(error, "code", None)
+    if not isinstance(status, int):
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status not in THROTTLE_STATUSES:
+        return None
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    return Throttled(f"HTTP {status}: {error}", parse_retry_after(headers.get("Retry-After")))
+
+
+def jittered_backoff(attempt, base, cap):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate` tokens per second.
+
+    Callers reserve tokens up front and sleep off any debt, so a request
+    larger than the bucket (a big Translate batch) still goes through, and
+    waiting callers are served in the order they arrived. A rate of 0
+    disables the bucket.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        """Takes `amount` tokens. Returns how long to wait before using them."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= amount
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def acquire(self, amount=1):
+        delay = self.reserve(amount)
+        if delay:
+            time.sleep(delay)
+
+    async def async_acquire(self, amount=1):
+        delay = self.reserve(amount)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit shared by threads and event loops.
+
+    Each success raises the limit by `increase / limit` (about +`increase`
+    per round of requests); a throttle multiplies it by `decrease`, at most
+    once per `cooldown` seconds so one burst of 429s only backs off once.
+    """
+
+    def __init__(
+        self, initial, min_limit=1, max_limit=64, increase=1.0, decrease=0.5, cooldown=1.0
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._waiters = deque()  # (loop, future) for coroutines, (None, Event) for threads
+
+    def _has_room(self):
+        return self.in_flight < max(1, int(self.limit))
+
+    def acquire(self):
+        with self._lock:
+            if self._has_room() and not self._waiters:
+                self.in_flight += 1
+                return
+            event = threading.Event()
+            self._waiters.append((None, event))
+        event.wait()
+
+    async def async_acquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._has_room() and not self._waiters:
+                self.in_flight += 1
+                return
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove((loop, future))
+                    granted = False
+                except ValueError:
+                    granted = True
+            # A slot handed over just before the cancel must be given back
+            if granted and future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._wake()
+
+    def _wake(self):
+        # Called with the lock held; hands free slots to waiters in order
+        while self._waiters and self._has_room():
+            loop, waiter = self._waiters.popleft()
+            self.in_flight += 1
+            if loop is None:
+                waiter.set()
+            else:
+                try:
+                    loop.call_soon_threadsafe(self._grant, waiter)
+                except RuntimeError:
+                    # That loop is gone; nobody will use the slot
+                    self.in_flight -= 1
+
+    def _grant(self, future):
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(True)
+
+    def on_success(self):
+        with self._lock:
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+            self._wake()
+
+    def on_throttle(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_decrease < self.cooldown:
+                return
+            self._last_decrease = now
+            self.limit = max(self.min_limit, self.limit * self.decrease)
+        logger.warning(f"Throttled; concurrency limit lowered to {self.limit:.1f}")
+
+
+class Throttle:
+    """Rate limits, adaptive concurrency and jittered retries for one remote API.
+
+    Every call takes one token from the request bucket and `cost` tokens from
+    the unit bucket (e.g. characters), both globally and for its `key` (a
+    language or room pair) when that key has limits of its own. The wrapped
+    function raises Throttled on a 429/503; the call is then retried after a
+    jittered backoff, or the server's Retry-After, which also pauses every
+    other caller until it has passed.
+    """
+
+    def __init__(
+        self,
+        name,
+        requests_per_second=0,
+        units_per_minute=0,
+        concurrency=4,
+        max_concurrency=64,
+        key_limits=None,
+        retries=4,
+        backoff=0.5,
+        max_backoff=30.0,
+    ):
+        self.name = name
+        self.requests = TokenBucket(requests_per_second)
+        self.units = TokenBucket(units_per_minute / 60, capacity=units_per_minute or None)
+        self.concurrency = AdaptiveLimiter(concurrency, max_limit=max_concurrency)
+        # key -> {"requests_per_second": x, "units_per_minute": y}
+        self.key_limits = key_limits or {}
+        self._key_buckets = {}
+        self._key_lock = threading.Lock()
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.throttled = 0
+        self._paused_until = 0.0
+
+    def _buckets(self, key, cost):
+        buckets = [(self.requests, 1), (self.units, cost)]
+        limits = self.key_limits.get(key)
+        if limits:
+            with self._key_lock:
+                pair = self._key_buckets.get(key)
+                if pair is None:
+                    units_per_minute = limits.get("units_per_minute", 0)
+                    pair = self._key_buckets[key] = (
+                        TokenBucket(limits.get("requests_per_second", 0)),
+                        TokenBucket(units_per_minute / 60, capacity=units_per_minute or None),
+                    )
+            buckets += [(pair[0], 1), (pair[1], cost)]
+        return buckets
+
+    def _reserve(self, key, cost):
+        delay = max(0.0, self._paused_until - time.monotonic())
+        for bucket, amount in self._buckets(key, cost):
+            delay = max(delay, bucket.reserve(amount))
+        return delay
+
+    def _on_throttle(self, error, attempt):
+        self.throttled += 1
+        self.concurrency.on_throttle()
+        delay = error.retry_after
+        if delay is not None:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        else:
+            delay = jittered_backoff(attempt, self.backoff, self.max_backoff)
+        logger.warning(
+            f"{self.name} throttled (attempt {attempt + 1}/{self.retries + 1}), "
+            f"backing off {delay:.2f}s"
+        )
+        return delay
+
+    def call(self, fn, key=None, cost=1):
+        """Runs `fn()` under the limits from a worker thread."""
+        for attempt in range(self.retries + 1):
+            delay = self._reserve(key, cost)
+            if delay:
+                time.sleep(delay)
+            self.concurrency.acquire()
+            try:
+                result = fn()
+            except Throttled as e:
+                delay = self._on_throttle(e, attempt)
+                if attempt >= self.retries:
+                    raise
+            else:
+                self.concurrency.on_success()
+                return result
+            finally:
+                self.concurrency.release()
+            time.sleep(delay)
+
+    async def async_call(self, fn, key=None, cost=1):
+        """Like call, for a coroutine function, without blocking the event loop."""
+        for attempt in range(self.retries + 1):
+            delay = self._reserve(key, cost)
+            if delay:
+                await asyncio.sleep(delay)
+            await self.concurrency.async_acquire()
+            try:
+                result = await fn()
+            except Throttled as e:
+                delay = self._on_throttle(e, attempt)
+                if attempt >= self.retries:
+                    raise
+            else:
+                self.concurrency.on_success()
+                return result
+            finally:
+                self.concurrency.release()
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            "concurrency_limit": round(self.concurrency.limit, 2),
+            "in_flight": self.concurrency.in_flight,
+            "throttled": self.throttled,
+        }
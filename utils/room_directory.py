@@ -0,0 +1,170 @@
+# utils/room_directory.py
+
+import bisect
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("websockets")
+
+
+class RoomDirectory:
+    """Local index of every ChatSurfer room name, refreshed incrementally.
+
+    `fetch_page(page_number, page_size, session_id)` returns one page of room
+    names sorted newest first (FIRST_JOINED_DATE DESC) plus the total count.
+    An incremental refresh stops at the first page that has no unknown rooms,
+    so usually only page 0 is fetched; a periodic full refresh also drops
+    rooms that no longer exist. Rooms are added to the index page by page,
+    so lookups are served from the partial index while a scan runs.
+    Membership checks are set lookups and prefix search is a bisect over the
+    sorted names. `find_room(room_name, session_id)`, if given, asks the
+    server about a single room (see `lookup`).
+    """
+
+    def __init__(
+        self,
+        fetch_page,
+        path,
+        page_size=500,
+        max_pages=100,
+        refresh_interval=10 * 60,
+        full_refresh_interval=24 * 60 * 60,
+        find_room=None,
+    ):
+        self.fetch_page = fetch_page
+        self.find_room = find_room
+        self.path = path
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self.last_full_refresh = 0.0
+        self._names = set()
+        self._sorted = []
+        self._refresh_lock = threading.Lock()
+        # Serializes writers; readers use whatever index object they got
+        self._index_lock = threading.Lock()
+        self._refresher = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                names = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        self._swap(set(names))
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(sorted(self._names), f, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def _swap(self, names):
+        # Readers see either the old or the new index, never a partial one
+        with self._index_lock:
+            self._sorted = sorted((name.lower(), name) for name in names)
+            self._names = names
+
+    def _add(self, names):
+        entries = sorted((name.lower(), name) for name in names)
+        with self._index_lock:
+            self._sorted = list(heapq.merge(self._sorted, entries))
+            self._names = self._names | names
+
+    def __contains__(self, room_name):
+        return room_name in self._names
+
+    def __len__(self):
+        return len(self._names)
+
+    def search(self, prefix, limit=20):
+        """Room names starting with `prefix` (case-insensitive)."""
+        prefix = prefix.lower()
+        entries = self._sorted
+        start = bisect.bisect_left(entries, (prefix,))
+        matches = []
+        for lowered, name in entries[start:]:
+            if not lowered.startswith(prefix) or len(matches) >= limit:
+                break
+            matches.append(name)
+        return matches
+
+    @property
+    def refreshing(self):
+        return self._refresh_lock.locked()
+
+    def refresh(self, session_id=None, full=False, blocking=True):
+        """Fetches new rooms (or every room if `full`). Returns how many were
+        added, or None if another refresh is running and not `blocking`."""
+        if not self._refresh_lock.acquire(blocking=blocking):
+            return None
+        try:
+            known = self._names
+            found = set() if full else set(known)
+            added = 0
+            page_number = 0
+            total = float("inf")
+            while page_number * self.page_size < total and page_number < self.max_pages:
+                names, total = self.fetch_page(page_number, self.page_size, session_id)
+                new = [name for name in names if name not in found]
+                found.update(new)
+                unknown = {name for name in new if name not in self._names}
+                if unknown:
+                    # Usable at once, not only when the whole scan is done
+                    self._add(unknown)
+                added += sum(1 for name in new if name not in known)
+                page_number += 1
+                if not full and not new:
+                    break
+            if full:
+                self.last_full_refresh = time.time()
+                # Only a complete scan knows which rooms are gone
+                if found != self._names:
+                    self._swap(found)
+            if self._names != known:
+                self._save()
+            logger.info(
+                f"Room directory refreshed ({page_number} pages, {added} new, "
+                f"{len(self._names)} total)."
+            )
+            return added
+        finally:
+            self._refresh_lock.release()
+
+    def lookup(self, room_name, session_id=None):
+        """Whether `room_name` exists, without waiting for a running scan.
+
+        A room missing from the index is asked about directly (`find_room`),
+        then looked for among the newest rooms unless a refresh is already
+        running. Rooms found either way are added to the index.
+        """
+        if room_name in self._names:
+            return True
+        if self.find_room is not None and self.find_room(room_name, session_id):
+            self._add({room_name})
+            return True
+        self.refresh(session_id=session_id, blocking=False)
+        return room_name in self._names
+
+    def start(self):
+        """Starts the background refresh thread if it is not running yet."""
+        if self._refresher is None or not self._refresher.is_alive():
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, name="room-directory", daemon=True
+            )
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            full = time.time() - self.last_full_refresh > self.full_refresh_interval
+            try:
+                self.refresh(full=full)
+            except Exception as e:
+                logger.error(f"Room directory refresh failed: {e}")
+            time.sleep(self.refresh_interval)
@@ -0,0 +1,85 @@
+# utils/room_index.py
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("websockets")
+
+
+def file_signature(paths):
+    """A signature function that changes whenever one of `paths` is replaced or written."""
+
+    def signature():
+        result = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+                result.append((st.st_ino, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                result.append(None)
+        return tuple(result)
+
+    return signature
+
+
+class RoomIndex:
+    """In-memory room -> translation route index, rebuilt only when its sources change.
+
+    `loader` builds the whole lookup dict. The dict is swapped in as a single
+    reference, so `lookup` is a plain dict hit with no locking. `signature()`
+    (e.g. the link store's version plus the language file's mtime) is checked
+    at most once per `check_interval` seconds, and `notify` forces a reload
+    on the next lookup (used right after saving a link).
+    """
+
+    def __init__(self, loader, signature, check_interval=1.0):
+        self.loader = loader
+        self.signature = signature
+        self.check_interval = check_interval
+        self.reloads = 0
+        self._lookup = {}
+        self._signature = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        # Only one thread reloads; the others keep using the current index
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = now + self.check_interval
+            try:
+                signature = self.signature()
+                if signature == self._signature:
+                    return
+                lookup = self.loader()
+            except Exception as e:
+                # A broken source should not take translation down
+                logger.error(f"Failed to reload room links, keeping old index: {e}")
+                return
+            self._lookup = lookup
+            self._signature = signature
+            self.reloads += 1
+            logger.info(f"Room link index loaded with {len(lookup)} rooms.")
+        finally:
+            self._reload_lock.release()
+
+    def lookup(self, room_name):
+        """Returns the translation route for a room, or None if it is not linked."""
+        self._maybe_reload()
+        return self._lookup.get(room_name)
+
+    def rooms(self):
+        """All linked room names."""
+        self._maybe_reload()
+        return set(self._lookup)
+
+    def notify(self):
+        """Marks the index stale so the next lookup reloads it."""
+        self._next_check = 0.0
+        self._signature = None
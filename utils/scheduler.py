@@ -0,0 +1,192 @@
+# utils/scheduler.py
+
+import asyncio
+import time
+from collections import deque
+
+from utils.metrics import LANE_WAIT_SECONDS
+
+
+class _Lane:
+    __slots__ = (
+        "items", "priority", "weight", "credit", "ready",
+        "in_flight", "dispatched", "released", "finished", "turns",
+    )
+
+    def __init__(self, priority, weight):
+        self.items = deque()  # (enqueued at, item)
+        self.priority = priority
+        self.weight = weight
+        self.credit = weight
+        self.ready = False  # waiting in FairQueue._ready
+        self.in_flight = 0
+        self.dispatched = 0  # sequence number of the next item handed out
+        self.released = 0  # items before this one have all finished
+        self.finished = set()  # finished sequence numbers not yet released
+        self.turns = {}  # sequence number -> future of a worker awaiting its turn
+
+
+class FairQueue:
+    """Drop-in for a pipeline stage's asyncio.Queue that is fair across lanes
+    and keeps each lane in order.
+
+    Items are sorted into FIFO lanes by `lane_of(item)` (e.g. the room).
+    Up to `lane_concurrency` items of a lane are handed out at once, and a
+    worker calls `wait_turn` before passing its results on, so they reach
+    the next stage in the order the lane's items arrived even if later ones
+    finish first. Different lanes proceed in parallel.
+
+    Waiting lanes take turns: the lowest `priority_of(lane)` class first,
+    then round-robin within a class, a lane getting `weight_of(lane)` turns
+    in a row. `maxsize` bounds the items waiting in all lanes together.
+    Metrics are labelled with `class_of(lane)` rather than the lane, so new
+    rooms do not add label values.
+    """
+
+    def __init__(
+        self,
+        lane_of,
+        maxsize=0,
+        priority_of=None,
+        weight_of=None,
+        lane_concurrency=1,
+        name="",
+        class_of=None,
+    ):
+        self.lane_of = lane_of
+        self.maxsize = maxsize
+        self.priority_of = priority_of or (lambda lane: 0)
+        self.weight_of = weight_of or (lambda lane: 1)
+        self.lane_concurrency = max(1, lane_concurrency)
+        self.name = name
+        self.class_of = class_of or (lambda lane: "lane")
+        self._lanes = {}  # lane -> _Lane, while it has items waiting or in flight
+        self._ready = {}  # priority -> deque of lanes that can hand out an item
+        self._taken = {}  # worker task -> (lane, sequence number) of its item
+        self._size = 0
+        self._unfinished = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+        self._can_get = asyncio.Event()
+        self._can_put = asyncio.Event()
+
+    # --- asyncio.Queue interface used by the pipeline ---
+    def qsize(self):
+        return self._size
+
+    def full(self):
+        return 0 < self.maxsize <= self._size
+
+    def put_nowait(self, item):
+        if self.full():
+            raise asyncio.QueueFull
+        lane_key = self.lane_of(item)
+        lane = self._lanes.get(lane_key)
+        if lane is None:
+            lane = self._lanes[lane_key] = _Lane(
+                self.priority_of(lane_key), max(1, self.weight_of(lane_key))
+            )
+        lane.items.append((time.monotonic(), item))
+        self._make_ready(lane_key, lane)
+        self._size += 1
+        self._unfinished += 1
+        self._finished.clear()
+
+    async def put(self, item):
+        while self.full():
+            self._can_put.clear()
+            await self._can_put.wait()
+        self.put_nowait(item)
+
+    async def get(self):
+        while True:
+            item = self._dispatch()
+            if item is not None:
+                return item[0]
+            self._can_get.clear()
+            await self._can_get.wait()
+
+    def task_done(self):
+        taken = self._taken.pop(asyncio.current_task(), None)
+        if taken is not None:
+            lane_key, seq = taken
+            lane = self._lanes[lane_key]
+            lane.in_flight -= 1
+            lane.finished.add(seq)
+            while lane.released in lane.finished:
+                lane.finished.remove(lane.released)
+                lane.released += 1
+            turn = lane.turns.pop(lane.released, None)
+            if turn is not None and not turn.done():
+                turn.set_result(None)
+            if lane.items:
+                self._make_ready(lane_key, lane)
+            elif not lane.in_flight:
+                del self._lanes[lane_key]
+        self._unfinished -= 1
+        if self._unfinished <= 0:
+            self._finished.set()
+
+    async def join(self):
+        await self._finished.wait()
+
+    async def wait_turn(self):
+        """Waits until every earlier item of the calling worker's lane has
+        finished, so its results can be passed on in order."""
+        taken = self._taken.get(asyncio.current_task())
+        if taken is None:
+            return
+        lane_key, seq = taken
+        lane = self._lanes[lane_key]
+        if lane.released < seq:
+            lane.turns[seq] = asyncio.get_running_loop().create_future()
+            await lane.turns[seq]
+
+    # --- Scheduling ---
+    def _make_ready(self, lane_key, lane):
+        if lane.ready or not lane.items or lane.in_flight >= self.lane_concurrency:
+            return
+        ready = self._ready.setdefault(lane.priority, deque())
+        if lane.credit > 0:
+            # Turns left this round: go again before the others
+            ready.appendleft(lane_key)
+        else:
+            lane.credit = lane.weight
+            ready.append(lane_key)
+        lane.ready = True
+        self._can_get.set()
+
+    def _dispatch(self):
+        """Takes the next item for the calling worker, as a 1-tuple, or None."""
+        for priority in sorted(self._ready):
+            ready = self._ready[priority]
+            if not ready:
+                continue
+            lane_key = ready.popleft()
+            lane = self._lanes[lane_key]
+            lane.ready = False
+            enqueued, item = lane.items.popleft()
+            self._taken[asyncio.current_task()] = (lane_key, lane.dispatched)
+            lane.dispatched += 1
+            lane.in_flight += 1
+            lane.credit -= 1
+            self._size -= 1
+            self._can_put.set()
+            self._make_ready(lane_key, lane)
+            LANE_WAIT_SECONDS.observe(
+                time.monotonic() - enqueued, stage=self.name, lane_class=self.class_of(lane_key)
+            )
+            return (item,)
+        return None
+
+    def lane_depths(self):
+        """Items waiting per lane, for lanes that have any."""
+        return {key: len(lane.items) for key, lane in self._lanes.items() if lane.items}
+
+    def class_depths(self):
+        """Items waiting per lane class."""
+        depths = {}
+        for key, lane in self._lanes.items():
+            lane_class = self.class_of(key)
+            depths[lane_class] = depths.get(lane_class, 0) + len(lane.items)
+        return depths
@@ -0,0 +1,184 @@
+# utils/session_manager.py
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger("websockets")
+
+
+class SessionManager:
+    """Keeps the ChatSurfer session in memory and refreshes it before it expires.
+
+    `request_session` performs one newsession call and returns the session id,
+    or None on failure. Refreshes are single-flight: concurrent callers that
+    need a new session wait for the one refresh in progress. A background
+    thread rotates the session `refresh_margin` seconds before expiry, so the
+    send path normally never blocks. Rotation does not clear old sessions, so
+    the websocket keeps working on the session it connected with;
+    `clear_sessions` is only used as a last resort when no new session can be
+    obtained.
+    """
+
+    def __init__(
+        self,
+        request_session,
+        clear_sessions=None,
+        lifetime=60 * 60,
+        refresh_margin=5 * 60,
+        state_file=None,
+        max_tries=5,
+        backoff=1.0,
+    ):
+        self.request_session = request_session
+        self.clear_sessions = clear_sessions
+        self.lifetime = lifetime
+        self.refresh_margin = refresh_margin
+        self.state_file = state_file
+        self.max_tries = max_tries
+        self.backoff = backoff
+        self.refreshes = 0
+        self._session_id = None
+        self._expires = 0.0
+        self._cond = threading.Condition()
+        self._refreshing = False
+        self._last_error = None
+        self._wake = threading.Event()
+        self._refresher = None
+        self._load_state()
+
+    @property
+    def session_id(self):
+        """The current session id without validating or refreshing it."""
+        return self._session_id
+
+    def current(self):
+        """The session id if it is still valid, otherwise None. Never blocks."""
+        if self._session_id and time.time() < self._expires:
+            return self._session_id
+        return None
+
+    def _load_state(self):
+        """Picks up a session persisted by a previous run, if it is still valid."""
+        if not self.state_file:
+            return
+        try:
+            with open(self.state_file, "r") as f:
+                text = f.read()
+        except FileNotFoundError:
+            return
+        if "separator1234" in text:
+            expires, session_id = text.split("separator1234", 1)
+            try:
+                expires = float(expires)
+            except ValueError:
+                return
+            if session_id and expires > time.time():
+                self._session_id = session_id
+                self._expires = expires
+
+    def _save_state(self):
+        if not self.state_file:
+            return
+        try:
+            with open(self.state_file, "w") as f:
+                f.write(f"{self._expires}separator1234{self._session_id}")
+        except OSError as e:
+            logger.error(f"Could not persist session: {e}")
+
+    def get(self):
+        """Returns a valid session id, refreshing only if the current one expired."""
+        self._ensure_refresher()
+        if self._session_id and time.time() < self._expires:
+            return self._session_id
+        return self.refresh(stale=self._session_id)
+
+    def refresh(self, stale=None):
+        """Obtains a new session, sharing one in-flight refresh between callers.
+
+        `stale` is the session the caller saw; if another caller already
+        replaced it, the newer session is returned without another request.
+        """
+        with self._cond:
+            if self._session_id != stale and time.time() < self._expires:
+                return self._session_id
+            if self._refreshing:
+                while self._refreshing:
+                    self._cond.wait()
+                if self._session_id and time.time() < self._expires:
+                    return self._session_id
+                raise RuntimeError(f"Could not create session: {self._last_error}")
+            self._refreshing = True
+
+        session_id = None
+        try:
+            session_id = self._request_with_retries()
+        finally:
+            with self._cond:
+                if session_id:
+                    self._session_id = session_id
+                    self._expires = time.time() + self.lifetime
+                    self.refreshes += 1
+                    self._save_state()
+                self._refreshing = False
+                self._cond.notify_all()
+        self._wake.set()
+        if not session_id:
+            raise RuntimeError(f"Could not create session: {self._last_error}")
+        print("got session:", session_id)
+        return session_id
+
+    def invalidate(self, session_id):
+        """Marks a session as unusable, e.g. after the server rejected it."""
+        with self._cond:
+            if self._session_id == session_id:
+                self._expires = 0.0
+
+    def _request_with_retries(self):
+        delay = self.backoff
+        for attempt in range(self.max_tries):
+            try:
+                session_id = self.request_session()
+                if session_id:
+                    return session_id
+                self._last_error = "no session cookie in response"
+            except Exception as e:
+                self._last_error = e
+            logger.warning(
+                f"Session request failed ({self._last_error}), "
+                f"attempt {attempt + 1}/{self.max_tries}"
+            )
+            time.sleep(delay)
+            delay *= 2
+        if self.clear_sessions is not None:
+            # Likely hit the session limit for the API key; start over
+            logger.warning("Clearing all sessions for the API key and retrying.")
+            try:
+                self.clear_sessions()
+                return self.request_session()
+            except Exception as e:
+                self._last_error = e
+        return None
+
+    def _ensure_refresher(self):
+        if self._refresher is None or not self._refresher.is_alive():
+            with self._cond:
+                if self._refresher is None or not self._refresher.is_alive():
+                    self._refresher = threading.Thread(
+                        target=self._refresh_loop, name="session-refresher", daemon=True
+                    )
+                    self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            wait = self._expires - self.refresh_margin - time.time()
+            if wait > 0:
+                self._wake.wait(timeout=wait)
+                self._wake.clear()
+                continue
+            try:
+                self.refresh(stale=self._session_id)
+            except Exception as e:
+                logger.error(f"Background session refresh failed: {e}")
+                self._wake.wait(timeout=self.backoff * 30)
+                self._wake.clear()
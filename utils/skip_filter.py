@@ -0,0 +1,191 @@
+# utils/skip_filter.py
+
+"""Cheap local checks that decide whether a message needs the Translate API at
+all: content with nothing to translate (links, numbers, coordinates, emoji,
+one-letter acks) and text already written in the target language."""
+
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# Reasons a message is not sent to the Translate API
+UNTRANSLATABLE = "untranslatable"
+SAME_LANGUAGE = "same_language"
+
+# Policies for a skipped message, per room pair
+PASS = "pass"  # post the original text unchanged
+DROP = "drop"  # post nothing
+TRANSLATE = "translate"  # never skip for this pair
+POLICIES = (PASS, DROP, TRANSLATE)
+
+# Removed before looking for words
+_NOISE_REGEX = re.compile(
+    r"https?://\S+|www\.\S+|\S+@\S+\.\w+|[@#]\w+"  # links, emails, mentions, tags
+    r"|\S*\d\S*"  # numbers, times, coordinates, grid references, callsigns
+)
+_WORD_REGEX = re.compile(r"[^\W\d_]+")
+
+# Scripts only one language in language_codes.json is written in
+_SCRIPT_LANGUAGES = {
+    "HANGUL": "ko",
+    "HIRAGANA": "ja",
+    "KATAKANA": "ja",
+    "THAI": "th",
+    "GREEK": "el",
+    "HEBREW": "he",
+    "GEORGIAN": "ka",
+    "ARMENIAN": "hy",
+    "BENGALI": "bn",
+    "TAMIL": "ta",
+    "TELUGU": "te",
+    "GUJARATI": "gu",
+    "KANNADA": "kn",
+    "MALAYALAM": "ml",
+    "KHMER": "km",
+    "LAO": "lo",
+    "MYANMAR": "my",
+    "SINHALA": "si",
+}
+
+# Letters that single out one language among those sharing a script
+_DISTINCT_LETTERS = {
+    "ARABIC": [("ur", set("ٹڈڑںےۓ")), ("fa", set("پچژگی")), ("ar", None)],
+    "CYRILLIC": [("uk", set("іїєґІЇЄҐ")), ("ru", set("ыэёЫЭЁ"))],
+}
+
+# Frequent short words; a Latin-script message is only attributed to a
+# language when enough of its words are on that language's list
+_STOPWORDS = {
+    "en": "the a an and or but is are was were be to of in on at for with it this that i you we they he she not do does have has can will my your what there here yes no",
+    "es": "el la los las un una y o pero es son fue ser de del en con por para que no se lo le su sus mi yo tu muy ya está hay como más",
+    "fr": "le la les un une et ou mais est sont était être de du des en dans sur pour avec que qui ne pas je tu nous vous il elle ce cette oui non",
+    "de": "der die das ein eine und oder aber ist sind war sein zu von im in auf für mit es nicht ich du wir sie er ja nein auch noch wie was",
+    "it": "il lo la gli le un una e o ma è sono era essere di del della in con per che non si io tu noi voi lui lei questo sì anche",
+    "pt": "o a os as um uma e ou mas é são foi ser de do da dos das em no na com por para que não se eu tu nós você ele ela isso sim",
+    "nl": "de het een en of maar is zijn was te van in op voor met dat die niet ik jij wij zij hij ja nee ook wel er",
+    "id": "yang dan atau tapi adalah ini itu di ke dari untuk dengan tidak saya kamu kami mereka dia ada akan sudah juga bisa",
+    "tr": "ve veya ama bir bu şu o ile için değil ben sen biz siz onlar var yok evet hayır da de mi çok daha gibi",
+    "pl": "i lub ale jest są był być do z w na dla że nie się ja ty my wy on ona to tak jak co już",
+}
+_STOPWORDS = {lang: frozenset(words.split()) for lang, words in _STOPWORDS.items()}
+
+# Google codes with more than one spelling, mapped to the one used here
+_ALIASES = {"iw": "he", "jw": "jv", "tl": "fil"}
+# Variants a script or word list cannot tell apart (simplified and
+# traditional Chinese); never skipped as "same language"
+_UNCOMPARABLE = {"zh"}
+
+
+def base_language(code):
+    """'pt-BR' -> 'pt', 'iw' -> 'he'; a list of aliases uses its first entry."""
+    if isinstance(code, (list, tuple)):
+        code = code[0]
+    base = str(code).split("-")[0].lower()
+    return _ALIASES.get(base, base)
+
+
+def _script(char):
+    try:
+        return unicodedata.name(char).split(" ")[0]
+    except ValueError:
+        return None
+
+
+def dominant_script(words):
+    """The script most letters in `words` are written in, e.g. 'LATIN'."""
+    counts = {}
+    for word in words:
+        for char in word:
+            script = _script(char)
+            if script:
+                counts[script] = counts.get(script, 0) + 1
+    if not counts:
+        return None
+    # Japanese mixes kana with kanji; any kana makes it Japanese
+    if counts.get("HIRAGANA") or counts.get("KATAKANA"):
+        return "HIRAGANA"
+    return max(counts, key=counts.get)
+
+
+def detect_language(words, script, min_words=3, min_share=0.25):
+    """Best guess at the base language of `words`, or None if unsure."""
+    if script in _SCRIPT_LANGUAGES:
+        return _SCRIPT_LANGUAGES[script]
+    if script == "CJK":
+        return "zh"
+    if script in _DISTINCT_LETTERS:
+        letters = set("".join(words))
+        for lang, marks in _DISTINCT_LETTERS[script]:
+            if marks is None or letters & marks:
+                return lang
+        return None
+    if script != "LATIN" or len(words) < min_words:
+        return None
+    lowered = [word.lower() for word in words]
+    scores = sorted(
+        (
+            (sum(word in stopwords for word in lowered), lang)
+            for lang, stopwords in _STOPWORDS.items()
+        ),
+        reverse=True,
+    )
+    (best, lang), (runner_up, _) = scores[0], scores[1]
+    if best / len(lowered) < min_share or best <= runner_up:
+        return None
+    return lang
+
+
+class SkipFilter:
+    """Classifies messages before translation.
+
+    A message is untranslatable when, once links, numbers, coordinates,
+    mentions and emoji are removed, at most one letter is left. Otherwise its
+    language is guessed from its script, or from stopwords for Latin text.
+    Short messages rarely say enough on their own, so each sender's last
+    confident language is remembered (bounded LRU) and reused for their
+    inconclusive messages in the same script once they have written
+    `sender_streak` messages in it in a row.
+    """
+
+    def __init__(self, max_senders=5000, sender_streak=3):
+        self.max_senders = max_senders
+        self.sender_streak = sender_streak
+        self._senders = OrderedDict()  # sender -> (language, script, streak)
+        self._lock = threading.Lock()
+
+    def classify(self, text, sender=None):
+        """UNTRANSLATABLE, the base language `text` is written in, or None
+        when that cannot be told."""
+        words = _WORD_REGEX.findall(_NOISE_REGEX.sub(" ", text or ""))
+        if sum(len(word) for word in words) <= 1:
+            return UNTRANSLATABLE
+        script = dominant_script(words)
+        language = detect_language(words, script)
+        if sender is None:
+            return language
+        with self._lock:
+            known = self._senders.get(sender)
+            if language:
+                streak = known[2] + 1 if known and known[0] == language else 1
+                self._senders[sender] = (language, script, streak)
+                self._senders.move_to_end(sender)
+                if len(self._senders) > self.max_senders:
+                    self._senders.popitem(last=False)
+            elif known and known[1] == script and known[2] >= self.sender_streak:
+                language = known[0]
+        return language
+
+    def skip_reason(self, verdict, translate_to):
+        """Why translating a message classified as `verdict` into
+        `translate_to` can be skipped, or None if it must be translated."""
+        if verdict == UNTRANSLATABLE:
+            return UNTRANSLATABLE
+        target = base_language(translate_to)
+        if verdict == target and target not in _UNCOMPARABLE:
+            return SAME_LANGUAGE
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {"senders": len(self._senders)}
@@ -0,0 +1,186 @@
+# utils/stomp.py
+
+"""Minimal SockJS + STOMP 1.2 codec for the ChatSurfer websocket.
+
+The server wraps STOMP frames in SockJS framing: "o" (open), "h" (heartbeat),
+"c[code,reason]" (close) and "a[...]" (a JSON array of one or more STOMP
+frame strings). Each STOMP frame is COMMAND\\nheader:value...\\n\\nbody\\0.
+"""
+
+import json
+
+# A STOMP heart-beat is a bare EOL, sent as its own SockJS message
+HEARTBEAT = json.dumps(["\n"])
+
+_HEADER_UNESCAPES = {"\\\\": "\\", "\\n": "\n", "\\r": "\r", "\\c": ":"}
+
+_DECODER = json.JSONDecoder()
+
+
+def _loads(text, start=0):
+    """json.loads(text[start:]) without copying the slice or scanning for
+    whitespace first, which is most of the cost on short messages. Anything
+    raw_decode does not take exactly (surrounding whitespace, bad JSON) goes
+    through json.loads for the same result or error."""
+    try:
+        value, end = _DECODER.raw_decode(text, start)
+    except json.JSONDecodeError:
+        return json.loads(text[start:])
+    if end != len(text):
+        return json.loads(text[start:])
+    return value
+
+
+class StompFrame:
+    """A decoded STOMP frame. The JSON body is only decoded when asked for."""
+
+    __slots__ = ("command", "headers", "body", "_json")
+
+    def __init__(self, command, headers, body):
+        self.command = command
+        self.headers = headers
+        self.body = body
+        self._json = None
+
+    @property
+    def destination(self):
+        return self.headers.get("destination")
+
+    def json(self):
+        """The body decoded as JSON (decoded once, then cached)."""
+        if self._json is None:
+            self._json = _loads(self.body)
+        return self._json
+
+    def __repr__(self):
+        return f"StompFrame({self.command!r}, {self.headers!r}, {self.body[:40]!r})"
+
+
+def _unescape_header(value):
+    if "\\" not in value:
+        return value
+    out = []
+    i = 0
+    while i < len(value):
+        pair = value[i : i + 2]
+        if pair in _HEADER_UNESCAPES:
+            out.append(_HEADER_UNESCAPES[pair])
+            i += 2
+        else:
+            out.append(value[i])
+            i += 1
+    return "".join(out)
+
+
+def _escape_header(value):
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+        .replace(":", "\\c")
+    )
+
+
+def peek_json_string(body, key, escaped=False):
+    """Finds a compact "key":"value" pair in a JSON body without decoding it.
+
+    With `escaped=True` the body is still embedded in a SockJS JSON string, so
+    its quotes appear as \\". Only meant as a cheap prefilter: returns the
+    first match anywhere in the body, and None if the key is absent, spaced
+    out or its value contains escapes, in which case the caller should fall
+    back to a full decode.
+    """
+    quote = '\\"' if escaped else '"'
+    marker = f"{quote}{key}{quote}:{quote}"
+    start = body.find(marker)
+    if start == -1:
+        return None
+    start += len(marker)
+    end = body.find(quote, start)
+    if end == -1 or "\\" in body[start:end]:
+        return None
+    return body[start:end]
+
+
+def peek_header(message, name):
+    """Reads a STOMP header from a raw SockJS message without decoding it.
+
+    Returns None unless the message carries exactly one frame and the header
+    is present without escapes.
+    """
+    # The server escapes each frame's NUL terminator as \u0000
+    if message.count("\\u0000") != 1:
+        return None
+    marker = f"\\n{name}:"
+    start = message.find(marker)
+    if start == -1:
+        return None
+    start += len(marker)
+    end = message.find("\\n", start)
+    if end == -1 or "\\" in message[start:end]:
+        return None
+    return message[start:end]
+
+
+def decode_sockjs(message):
+    """Unwraps one SockJS message into the STOMP payload strings it carries."""
+    if not message:
+        return []
+    kind = message[0]
+    if kind == "a":
+        return _loads(message, 1)
+    if kind == "m":
+        return [_loads(message, 1)]
+    if kind in ("o", "h", "c"):
+        return []
+    raise ValueError(f"Unknown SockJS frame type: {kind!r}")
+
+
+def parse_frames(payload):
+    """Splits a STOMP payload into frames. Bare EOLs (heart-beats) are skipped."""
+    frames = []
+    rest = payload.lstrip("\r\n")
+    while rest:
+        head, sep, rest = rest.partition("\n\n")
+        if not sep:
+            raise ValueError("STOMP frame without header terminator")
+        # JSON bodies never contain a raw NUL, so the terminator is enough
+        body, _, rest = rest.partition("\x00")
+        lines = head.split("\n")
+        command = lines[0]
+        headers = {}
+        # STOMP 1.2: the first occurrence of a repeated header wins, so later
+        # lines are written first and overwritten
+        if "\\" in head or "\r" in head:
+            command = command.rstrip("\r")
+            for line in reversed(lines[1:]):
+                key, _, value = line.rstrip("\r").partition(":")
+                headers[_unescape_header(key)] = _unescape_header(value)
+        else:
+            # The usual case: nothing to strip or unescape
+            for i in range(len(lines) - 1, 0, -1):
+                key, _, value = lines[i].partition(":")
+                headers[key] = value
+        frames.append(StompFrame(command, headers, body))
+        # Heart-beats are bare EOLs between frames
+        rest = rest.lstrip("\r\n")
+    return frames
+
+
+def decode(message):
+    """Decodes a raw websocket message into the STOMP frames it carries."""
+    frames = []
+    for payload in decode_sockjs(message):
+        frames.extend(parse_frames(payload))
+    return frames
+
+
+def encode_frame(command, headers=None, body=""):
+    """Encodes a client STOMP frame as a SockJS message."""
+    # STOMP 1.2 does not escape the headers of CONNECT frames
+    escape = _escape_header if command != "CONNECT" else str
+    lines = [command]
+    for key, value in (headers or {}).items():
+        lines.append(f"{escape(key)}:{escape(value)}")
+    return json.dumps(["\n".join(lines) + "\n\n" + body + "\x00"])
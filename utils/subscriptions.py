@@ -0,0 +1,98 @@
+# utils/subscriptions.py
+
+import logging
+import threading
+
+from utils import stomp
+
+logger = logging.getLogger("websockets")
+
+
+class SubscriptionRegistry:
+    """Tracks the live connection's subscriptions as destination -> sub-{id}.
+
+    Lets the client add and remove single subscriptions on a running
+    connection instead of reconnecting to change them.
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self._ids = {}
+        self._count = 0
+
+    def __contains__(self, destination):
+        return destination in self._ids
+
+    def destinations(self):
+        return set(self._ids)
+
+    async def subscribe(self, destination):
+        if destination in self._ids:
+            return False
+        sub_id = f"sub-{self._count}"
+        self._count += 1
+        await self.websocket.send(
+            stomp.encode_frame("SUBSCRIBE", {"id": sub_id, "destination": destination})
+        )
+        self._ids[destination] = sub_id
+        logger.info(f"Subscribed to {destination} as {sub_id}")
+        return True
+
+    async def unsubscribe(self, destination):
+        sub_id = self._ids.pop(destination, None)
+        if sub_id is None:
+            return False
+        await self.websocket.send(stomp.encode_frame("UNSUBSCRIBE", {"id": sub_id}))
+        logger.info(f"Unsubscribed from {destination} ({sub_id})")
+        return True
+
+    async def sync(self, wanted, prefix):
+        """Makes the subscriptions under `prefix` match the `wanted` destinations."""
+        wanted = set(wanted)
+        current = {d for d in self._ids if d.startswith(prefix)}
+        for destination in sorted(current - wanted):
+            await self.unsubscribe(destination)
+        for destination in sorted(wanted - current):
+            await self.subscribe(destination)
+
+
+class ClientControl:
+    """Thread-safe control channel into the running websocket client.
+
+    Other threads (Streamlit pages) call `send`; the client's event loop
+    consumes the commands from the queue it bound with `bind`. Commands sent
+    while no connection is up are dropped, since a new connection subscribes
+    from the current link index anyway.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._queue = None
+
+    def bind(self, loop, queue):
+        with self._lock:
+            self._loop = loop
+            self._queue = queue
+
+    def unbind(self, queue):
+        with self._lock:
+            if self._queue is queue:
+                self._loop = None
+                self._queue = None
+
+    @property
+    def connected(self):
+        return self._queue is not None
+
+    def send(self, command, *args):
+        """Queues a command for the client. Returns False if no client is connected."""
+        with self._lock:
+            if self._queue is None:
+                return False
+            try:
+                self._loop.call_soon_threadsafe(self._queue.put_nowait, (command, args))
+            except RuntimeError:
+                # The loop was closed under us
+                return False
+        return True
@@ -0,0 +1,84 @@
+# utils/thread_pool.py
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class DaemonThreadPool:
+    """A small ThreadPoolExecutor stand-in whose threads are daemons.
+
+    concurrent.futures joins its worker threads at interpreter exit, so a
+    single call blocked on a socket keeps the process alive for the whole
+    HTTP read timeout. These threads are not waited for: once `shutdown`
+    returns, whatever is still running is abandoned when the process exits.
+    Only use it for work that is safe to cut off, e.g. calls whose outcome
+    the outbox resumes anyway.
+    """
+
+    def __init__(self, max_workers, thread_name_prefix="pool"):
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._work = queue.SimpleQueue()
+        self._idle = threading.Semaphore(0)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            future = Future()
+            self._work.put((future, fn, args, kwargs))
+            # Start a thread only if none is idle, like ThreadPoolExecutor
+            if not self._idle.acquire(timeout=0) and len(self._threads) < self.max_workers:
+                thread = threading.Thread(
+                    target=self._run,
+                    name=f"{self.thread_name_prefix}_{len(self._threads)}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+        return future
+
+    def _run(self):
+        while True:
+            item = self._work.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+            del item, future
+            self._idle.release()
+
+    def shutdown(self, wait=True, cancel_futures=False, timeout=None):
+        """Stops taking work. With `cancel_futures`, queued calls that have
+        not started are cancelled. With `wait`, waits up to `timeout` seconds
+        (None: no limit) for running calls; returns False if some are still
+        running."""
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                while True:
+                    try:
+                        item = self._work.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not None:
+                        item[0].cancel()
+            for _ in self._threads:
+                self._work.put(None)
+            threads = list(self._threads)
+        if wait:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            for thread in threads:
+                thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in threads)
@@ -0,0 +1,151 @@
+# utils/translation_cache.py
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger("websockets")
+
+
+def normalize_text(text: str):
+    """Normalizes text for use as a cache key without changing its meaning."""
+    return unicodedata.normalize("NFC", text).strip()
+
+
+class TranslationCache:
+    """Two-tier cache of translations keyed on (normalized text, source, target).
+
+    The memory tier is a bounded LRU with a TTL. The optional disk tier is a
+    SQLite table that survives restarts; memory misses fall through to it and
+    disk hits are promoted back into memory. New translations are written to
+    disk by a background thread that commits every `commit_interval` seconds,
+    so a miss never waits on the disk. Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        max_entries=10000,
+        ttl=24 * 60 * 60,
+        db_path=None,
+        db_ttl=None,
+        commit_interval=1.0,
+        commit_every=500,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_ttl = db_ttl
+        self.commit_interval = commit_interval
+        self.commit_every = commit_every
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._writes = queue.Queue()
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            # Losing the last second of cache writes in a power cut costs
+            # only a repeated translation
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                " text TEXT NOT NULL, source TEXT NOT NULL, target TEXT NOT NULL,"
+                " translated TEXT NOT NULL, created REAL NOT NULL,"
+                " PRIMARY KEY (text, source, target))"
+            )
+            self._db.commit()
+            threading.Thread(
+                target=self._write_loop, name="translation-cache", daemon=True
+            ).start()
+
+    def get(self, text: str, source: str, target: str):
+        """Returns the cached translation, or None on a miss."""
+        key = (normalize_text(text), source, target)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                translated, created = entry
+                if now - created < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return translated
+                del self._entries[key]
+
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT translated, created FROM translations"
+                    " WHERE text = ? AND source = ? AND target = ?",
+                    key,
+                ).fetchone()
+            if row is not None and (self.db_ttl is None or now - row[1] < self.db_ttl):
+                with self._lock:
+                    self._remember(key, row[0], now)
+                    self.hits += 1
+                    self.disk_hits += 1
+                return row[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, text: str, source: str, target: str, translated: str):
+        key = (normalize_text(text), source, target)
+        now = time.time()
+        with self._lock:
+            self._remember(key, translated, now)
+        if self._db is not None:
+            self._writes.put((*key, translated, now))
+
+    def _write_loop(self):
+        while True:
+            batch = [self._writes.get()]
+            deadline = time.monotonic() + self.commit_interval
+            while len(batch) < self.commit_every:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._writes.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                with self._db_lock, self._db:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?)", batch
+                    )
+            except sqlite3.Error as e:
+                logger.error(f"Translation cache commit of {len(batch)} entries failed: {e}")
+            finally:
+                for _ in batch:
+                    self._writes.task_done()
+
+    def flush(self):
+        """Waits until every queued write is committed."""
+        self._writes.join()
+
+    def _remember(self, key, translated, created):
+        self._entries[key] = (translated, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
@@ -0,0 +1,119 @@
+# utils/translation_memory.py
+
+import re
+import threading
+from collections import OrderedDict
+
+from utils.translation_cache import normalize_text
+
+LINES = "lines"
+SENTENCES = "sentences"
+
+_LINE_REGEX = re.compile(r"(\r?\n)")
+_EDGE_SPACE_REGEX = re.compile(r"^(\s*)(.*?)(\s*)$", re.S)
+_SENTENCE_END_REGEX = re.compile(r"(?<=[.!?。！？])(\s+)")
+
+
+def split_segments(text, mode=LINES):
+    """Splits `text` into pieces that join back into exactly `text`.
+
+    Returns a list of (piece, translatable) pairs. Line breaks, the spacing
+    around each line and pieces without letters (rules, numbers, times) are
+    kept as they are; the rest, each line or with SENTENCES each sentence,
+    is what gets translated.
+    """
+    pieces = []
+    for part in _LINE_REGEX.split(text):
+        if not part:
+            continue
+        if _LINE_REGEX.fullmatch(part):
+            pieces.append((part, False))
+            continue
+        leading, content, trailing = _EDGE_SPACE_REGEX.match(part).groups()
+        if leading:
+            pieces.append((leading, False))
+        sentences = _SENTENCE_END_REGEX.split(content) if mode == SENTENCES else [content]
+        for index, sentence in enumerate(sentences):
+            if sentence:
+                # Odd indexes are the spaces the split kept between sentences
+                translatable = index % 2 == 0 and any(c.isalpha() for c in sentence)
+                pieces.append((sentence, translatable))
+        if trailing:
+            pieces.append((trailing, False))
+    return pieces
+
+
+class TranslationMemory:
+    """Bounded memory of translated segments, keyed on (segment, source, target).
+
+    Eviction is least-frequently-used, oldest first among equally used
+    segments, so standard headers and phrases outlive one-off lines. Lookups
+    and the characters they cover are counted for the hit ratios. Safe to
+    share between threads.
+    """
+
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.hit_chars = 0
+        self.miss_chars = 0
+        self._entries = {}  # key -> [translated, uses]
+        self._by_uses = {}  # uses -> OrderedDict of keys, oldest first
+        self._min_uses = 0
+        self._lock = threading.Lock()
+
+    def _touch(self, key, entry):
+        # Called with the lock held; moves a key up one use
+        uses = entry[1]
+        bucket = self._by_uses[uses]
+        del bucket[key]
+        if not bucket:
+            del self._by_uses[uses]
+            if self._min_uses == uses:
+                self._min_uses = uses + 1
+        entry[1] = uses + 1
+        self._by_uses.setdefault(uses + 1, OrderedDict())[key] = None
+
+    def get(self, segment, source, target):
+        """Returns the remembered translation, or None on a miss."""
+        key = (normalize_text(segment), source, target)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                self.miss_chars += len(segment)
+                return None
+            self._touch(key, entry)
+            self.hits += 1
+            self.hit_chars += len(segment)
+            return entry[0]
+
+    def put(self, segment, source, target, translated):
+        key = (normalize_text(segment), source, target)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[0] = translated
+                self._touch(key, entry)
+                return
+            if len(self._entries) >= self.max_entries:
+                bucket = self._by_uses[self._min_uses]
+                evicted, _ = bucket.popitem(last=False)
+                if not bucket:
+                    del self._by_uses[self._min_uses]
+                del self._entries[evicted]
+            self._entries[key] = [translated, 1]
+            self._by_uses.setdefault(1, OrderedDict())[key] = None
+            self._min_uses = 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        chars = self.hit_chars + self.miss_chars
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "char_hit_ratio": self.hit_chars / chars if chars else 0.0,
+            "entries": len(self._entries),
+        }
@@ -0,0 +1,231 @@
+# utils/translation_service.py
+
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+from utils.http_client import request as http_request
+from utils.rate_limit import as_throttled
+from utils.thread_pool import DaemonThreadPool
+
+logger = logging.getLogger("websockets")
+
+
+class _Batch:
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.texts = []
+        self.futures = []
+        self.chars = 0
+
+
+class HttpTranslateClient:
+    """Stand-in for TranslationServiceClient that POSTs requests to a plain
+    HTTP endpoint, e.g. the soak harness's fake translation backend."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+
+    def translate_text(self, request):
+        response = http_request("POST", self.endpoint, json=request)
+        response.raise_for_status()
+        return SimpleNamespace(
+            translations=[
+                SimpleNamespace(translated_text=text)
+                for text in response.json()["translations"]
+            ]
+        )
+
+
+class TranslationService:
+    """Owns one long-lived Translate client and micro-batches requests.
+
+    Callers on different threads asking for the same (source, target) pair
+    within `batch_window` seconds share a single `contents[]` request. A batch
+    is sent early once it reaches `max_batch_items` texts or `max_batch_chars`
+    characters. A window of 0 disables batching. Batches are sent by a pool
+    of `sender_threads` threads. With `endpoint` set, requests go to that
+    HTTP endpoint instead of Google. With a `throttle`, every request goes
+    through its rate limits and retries throttled batches.
+    """
+
+    def __init__(
+        self,
+        project_id="cs-autotranslation",
+        location="global",
+        batch_window=0.01,
+        max_batch_items=64,
+        max_batch_chars=10000,
+        endpoint=None,
+        throttle=None,
+        sender_threads=8,
+    ):
+        self.endpoint = endpoint
+        self.throttle = throttle
+        self.parent = f"projects/{project_id}/locations/{location}"
+        self.batch_window = batch_window
+        self.max_batch_items = max_batch_items
+        self.max_batch_chars = max_batch_chars
+        self.requests = 0
+        self.texts = 0
+        self._stats_lock = threading.Lock()
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._flusher = None
+        # Daemon threads: a request blocked on its read timeout must not
+        # keep a stopping process alive
+        self._senders = DaemonThreadPool(sender_threads, thread_name_prefix="translate-batch")
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    if self.endpoint:
+                        self._client = HttpTranslateClient(self.endpoint)
+                    else:
+                        # Imported here: google.cloud.translate takes a large
+                        # share of startup, and endpoint mode never needs it
+                        from google.cloud import translate
+
+                        self._client = translate.TranslationServiceClient()
+        return self._client
+
+    def warm_up(self):
+        """Builds the client on a background thread, so the first message
+        does not wait for the import, credentials and channel setup."""
+
+        def build():
+            try:
+                self.client
+            except Exception as e:
+                # The first real request will raise it again, where it is handled
+                logger.warning(f"Could not prepare the Translate client: {e}")
+
+        threading.Thread(target=build, name="translate-warm-up", daemon=True).start()
+
+    def translate_many(self, texts, translate_from, translate_to):
+        """Translates a list of texts in one request, preserving order."""
+        request = {
+            "parent": self.parent,
+            "contents": list(texts),
+            "mime_type": "text/plain",
+            "source_language_code": translate_from,
+            "target_language_code": translate_to,
+        }
+
+        def send():
+            try:
+                return self.client.translate_text(request=request)
+            except Exception as e:
+                throttled = as_throttled(e)
+                if throttled is not None:
+                    raise throttled from e
+                raise
+
+        if self.throttle is None:
+            response = send()
+        else:
+            response = self.throttle.call(
+                send,
+                key=f"{translate_from}:{translate_to}",
+                cost=sum(len(text) for text in texts),
+            )
+        with self._stats_lock:
+            self.requests += 1
+            self.texts += len(texts)
+        return [t.translated_text for t in response.translations]
+
+    def translate(self, text, translate_from, translate_to):
+        """Translates one text, sharing a request with concurrent callers."""
+        if not self.batch_window:
+            return self.translate_many([text], translate_from, translate_to)[0]
+        return self.submit(text, translate_from, translate_to).result()
+
+    def submit(self, text, translate_from, translate_to):
+        """Queues one text for translation and returns a Future for the result,
+        so a caller can wait on several target languages at once."""
+        return self.submit_many([text], translate_from, translate_to)[0]
+
+    def submit_many(self, texts, translate_from, translate_to):
+        """Like submit for several texts, which are kept in the same request
+        unless that would overflow a batch. Returns one Future per text."""
+        if not texts:
+            return []
+        if not self.batch_window:
+            batch = _Batch(0)
+            batch.texts = list(texts)
+            batch.futures = [Future() for _ in batch.texts]
+            self._senders.submit(self._send, (translate_from, translate_to), batch)
+            return batch.futures
+
+        futures = []
+        key = (translate_from, translate_to)
+        full = []
+        with self._cond:
+            for text in texts:
+                batch = self._pending.get(key)
+                if batch is None:
+                    batch = self._pending[key] = _Batch(time.monotonic() + self.batch_window)
+                    self._ensure_flusher()
+                    self._cond.notify()
+                future = Future()
+                batch.texts.append(text)
+                batch.futures.append(future)
+                batch.chars += len(text)
+                futures.append(future)
+                if (
+                    len(batch.texts) >= self.max_batch_items
+                    or batch.chars >= self.max_batch_chars
+                ):
+                    full.append(self._pending.pop(key))
+
+        for batch in full:
+            # A full batch goes out now instead of waiting for the timer
+            self._senders.submit(self._send, key, batch)
+        return futures
+
+    def _ensure_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name="translate-batcher", daemon=True
+            )
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                now = time.monotonic()
+                due = [k for k, b in self._pending.items() if b.deadline <= now]
+                if not due:
+                    next_deadline = min(b.deadline for b in self._pending.values())
+                    self._cond.wait(timeout=next_deadline - now)
+                    continue
+                batches = [(k, self._pending.pop(k)) for k in due]
+            for key, batch in batches:
+                self._senders.submit(self._send, key, batch)
+
+    def _send(self, key, batch):
+        try:
+            results = self.translate_many(batch.texts, *key)
+        except Exception as e:
+            for future in batch.futures:
+                future.set_exception(e)
+            return
+        for future, result in zip(batch.futures, results):
+            future.set_result(result)
+
+    def stats(self):
+        with self._stats_lock:
+            requests, texts = self.requests, self.texts
+        return {
+            "requests": requests,
+            "texts": texts,
+            "texts_per_request": texts / requests if requests else 0.0,
+        }
@@ -1,80 +1,564 @@
-from google.cloud import translate
+import contextlib
 import json
+import time
+import zlib
+from datetime import datetime
+from types import SimpleNamespace
 from config import *
-from utils.cs_helpers import send_public_message, create_session
+from utils.cs_helpers import (
+    SESSIONS,
+    async_create_session,
+    async_send_public_message,
+    create_session,
+    send_public_message,
+)
+from utils.metrics import (
+    CACHE_REQUESTS,
+    CALLS_SAVED,
+    CHARACTERS_SKIPPED,
+    CONCURRENCY_LIMIT,
+    LAG_SECONDS,
+    MEMORY_CHARACTERS,
+    MEMORY_SEGMENTS,
+    MESSAGES_POSTED,
+    MESSAGES_SKIPPED,
+    MESSAGES_TRANSLATED,
+    POST_SECONDS,
+    SESSION_SECONDS,
+    THROTTLED,
+    OUTBOX_MESSAGES,
+    TRANSLATE_SECONDS,
+)
+from utils.outbox import Outbox
+from utils.rate_limit import THROTTLE_STATUSES, Throttle, Throttled
+from utils.link_store import LINK_STORE
+from utils.room_index import RoomIndex, file_signature
+from utils.skip_filter import DROP, SAME_LANGUAGE, TRANSLATE, SkipFilter
+from utils.translation_cache import TranslationCache
+from utils.translation_memory import TranslationMemory, split_segments
+from utils.translation_service import TranslationService
 
+TRANSLATION_CACHE = TranslationCache(
+    max_entries=TRANSLATION_CACHE_SIZE,
+    ttl=TRANSLATION_CACHE_TTL,
+    db_path=TRANSLATION_CACHE_DB or None,
+    db_ttl=TRANSLATION_CACHE_DB_TTL,
+    commit_interval=TRANSLATION_CACHE_COMMIT_INTERVAL,
+)
 
-def translate_text(text="I", translate_from="en", translate_to="ko"):
-    project_id = "cs-autotranslation"
-    client = translate.TranslationServiceClient()
-    location = "global"
-    parent = f"projects/{project_id}/locations/{location}"
-
-    response = client.translate_text(
-        request={
-            "parent": parent,
-            "contents": [text],
-            "mime_type": "text/plain",
-            "source_language_code": translate_from,
-            "target_language_code": translate_to,
+# One throttle per remote API, shared by every thread and connection
+TRANSLATE_THROTTLE = Throttle(
+    "Translate",
+    requests_per_second=TRANSLATE_REQUESTS_PER_SECOND,
+    units_per_minute=TRANSLATE_CHARS_PER_MINUTE,
+    concurrency=TRANSLATE_MAX_CONCURRENCY,
+    max_concurrency=TRANSLATE_MAX_CONCURRENCY,
+    key_limits=TRANSLATE_PAIR_LIMITS,
+    retries=RATE_LIMIT_RETRIES,
+    backoff=RATE_LIMIT_BACKOFF,
+    max_backoff=RATE_LIMIT_MAX_BACKOFF,
+)
+POST_THROTTLE = Throttle(
+    "ChatSurfer post",
+    requests_per_second=POST_REQUESTS_PER_SECOND,
+    concurrency=POST_MAX_CONCURRENCY,
+    max_concurrency=POST_MAX_CONCURRENCY,
+    key_limits=POST_ROOM_LIMITS,
+    retries=RATE_LIMIT_RETRIES,
+    backoff=RATE_LIMIT_BACKOFF,
+    max_backoff=RATE_LIMIT_MAX_BACKOFF,
+)
+THROTTLED.set_function(
+    lambda: {("translate",): TRANSLATE_THROTTLE.throttled, ("post",): POST_THROTTLE.throttled}
+)
+CONCURRENCY_LIMIT.set_function(
+    lambda: {
+        ("translate",): TRANSLATE_THROTTLE.concurrency.limit,
+        ("post",): POST_THROTTLE.concurrency.limit,
+    }
+)
+
+# Tracks accepted messages until they are posted; None when disabled
+OUTBOX = (
+    Outbox(
+        OUTBOX_DB,
+        commit_interval=OUTBOX_COMMIT_INTERVAL,
+        retention=OUTBOX_RETENTION,
+        compact_interval=OUTBOX_COMPACT_INTERVAL,
+        max_attempts=OUTBOX_MAX_ATTEMPTS,
+        max_age=OUTBOX_MAX_AGE,
+    )
+    if OUTBOX_DB
+    else None
+)
+if OUTBOX is not None:
+    OUTBOX_MESSAGES.set_function(
+        lambda: {(state,): n for state, n in OUTBOX.stats()["states"].items()}
+    )
+
+# Segments of multi-line messages; None when disabled
+TRANSLATION_MEMORY = (
+    TranslationMemory(max_entries=TRANSLATION_MEMORY_SIZE) if TRANSLATION_MEMORY_SIZE else None
+)
+if TRANSLATION_MEMORY is not None:
+    MEMORY_SEGMENTS.set_function(
+        lambda: {("hit",): TRANSLATION_MEMORY.hits, ("miss",): TRANSLATION_MEMORY.misses}
+    )
+    MEMORY_CHARACTERS.set_function(
+        lambda: {
+            ("hit",): TRANSLATION_MEMORY.hit_chars,
+            ("miss",): TRANSLATION_MEMORY.miss_chars,
         }
     )
 
-    for translation in response.translations:
-        return translation.translated_text
+SKIP_FILTER = SkipFilter(
+    max_senders=SKIP_SENDER_CACHE_SIZE, sender_streak=SKIP_SENDER_STREAK
+)
+
+TRANSLATION_SERVICE = TranslationService(
+    project_id=TRANSLATE_PROJECT_ID,
+    batch_window=TRANSLATE_BATCH_WINDOW,
+    max_batch_items=TRANSLATE_BATCH_MAX_ITEMS,
+    max_batch_chars=TRANSLATE_BATCH_MAX_CHARS,
+    endpoint=TRANSLATE_ENDPOINT or None,
+    throttle=TRANSLATE_THROTTLE,
+    sender_threads=TRANSLATE_SENDER_THREADS,
+)
+
+
+def translate_text(text="I", translate_from="en", translate_to="ko"):
+    """Translates `text` into one language, through the same cache and
+    translation memory as `translate_to_languages`."""
+    return translate_to_languages(text, [(translate_from, translate_to)])[
+        (translate_from, translate_to)
+    ]
+
+
+def translate_to_languages(text, language_pairs):
+    """Translates `text` for each (from, to) language pair, each only once.
+
+    Cache misses for different languages are sent concurrently, so a hub
+    message waits for the slowest language rather than the sum of them. A
+    multi-line miss only sends the lines the translation memory lacks, in
+    one request, and is reassembled around the remembered ones.
+    Returns {(from, to): translated text}.
+    """
+    results = {}
+    missing = []
+    for translate_from, translate_to in language_pairs:
+        if translate_from == translate_to:
+            results[(translate_from, translate_to)] = text
+            continue
+        cached = TRANSLATION_CACHE.get(text, translate_from, translate_to)
+        if cached is not None:
+            CACHE_REQUESTS.inc(result="hit")
+            results[(translate_from, translate_to)] = cached
+        else:
+            CACHE_REQUESTS.inc(result="miss")
+            missing.append((translate_from, translate_to))
+
+    # Each miss is sent whole, or as the segments the memory lacks
+    plans = {pair: _segment_plan(text, pair) for pair in missing}
+    if len(missing) == 1 and plans[missing[0]] is None:
+        # The common 1:1 case stays on this thread
+        translated = {missing[0]: TRANSLATION_SERVICE.translate(text, *missing[0])}
+    else:
+        futures = {
+            pair: (
+                TRANSLATION_SERVICE.submit(text, *pair)
+                if plan is None
+                else TRANSLATION_SERVICE.submit_many([plan[0][i][0] for i in plan[1]], *pair)
+            )
+            for pair, plan in plans.items()
+        }
+        translated = {}
+        for pair, future in futures.items():
+            plan = plans[pair]
+            if plan is None:
+                translated[pair] = future.result()
+                continue
+            pieces, todo = plan
+            for index, segment_future in zip(todo, future):
+                result = segment_future.result()
+                TRANSLATION_MEMORY.put(pieces[index][0], *pair, result)
+                pieces[index] = (result, False)
+            translated[pair] = "".join(piece for piece, _ in pieces)
+    for pair, translated_text in translated.items():
+        if translated_text is not None:
+            TRANSLATION_CACHE.put(text, *pair, translated_text)
+        results[pair] = translated_text
+    return results
+
 
+def _segment_plan(text, language_pair):
+    """Splits a multi-segment text and fills in the segments the translation
+    memory knows. Returns (pieces, indexes of pieces still to translate), or
+    None if the text should be translated whole."""
+    if TRANSLATION_MEMORY is None:
+        return None
+    pieces = split_segments(text, TRANSLATION_MEMORY_SPLIT)
+    if sum(translatable for _, translatable in pieces) < 2:
+        return None
+    todo = []
+    for index, (piece, translatable) in enumerate(pieces):
+        if not translatable:
+            continue
+        remembered = TRANSLATION_MEMORY.get(piece, *language_pair)
+        if remembered is None:
+            todo.append(index)
+        else:
+            pieces[index] = (remembered, False)
+    return pieces, todo
 
-def recreate_room_lookups():
-    # Load room pair configuration
-    with open("data/rooms_for_translating.json", "r") as f:
-        room_pairs = json.load(f)["rooms"]
-    f.close()
 
-    with open("data/language_codes.json", "r") as f:
+LANG_CODES_FILE = "data/language_codes.json"
+
+# (index, count): this process only translates messages from rooms whose
+# shard_of is index. The daemon runs one worker process per shard.
+SHARD = (0, 1)
+
+
+def shard_of(room_name, count):
+    """The shard a source room belongs to; the same in every process."""
+    return zlib.crc32(room_name.encode("utf-8")) % count
+
+
+def owns_room(room_name):
+    index, count = SHARD
+    return count <= 1 or shard_of(room_name or "", count) == index
+
+
+def set_shard(index, count):
+    """Limits this process to one shard of the source rooms."""
+    global SHARD
+    SHARD = (index, count)
+    ROOM_INDEX.notify()
+
+
+def recreate_room_lookups(store=None, codes_file=LANG_CODES_FILE):
+    """Builds room -> [route, ...] from the link store, for this shard's rooms.
+
+    Every room in a link group routes to every other room in the group, and
+    a room in several groups gets the routes of all of them.
+    """
+    with open(codes_file, "r") as f:
         codes = json.load(f)
-    f.close()
 
-    # Build a lookup for both directions
+    # Collect each group's rooms and their languages
+    groups = {}
+    for link in (store or LINK_STORE).links():
+        members = groups.setdefault(link["groupId"], {})
+        members[link["room1name"]] = link["room1lang"]
+        members[link["room2name"]] = link["room2lang"]
+
     room_lookup = {}
-    for pair in room_pairs:
-        room_lookup[pair["room1name"]] = {
-            "target_room": pair["room2name"],
-            "from_lang": codes[pair["room1lang"]],
-            "to_lang": codes[pair["room2lang"]],
-        }
-        room_lookup[pair["room2name"]] = {
-            "target_room": pair["room1name"],
-            "from_lang": codes[pair["room2lang"]],
-            "to_lang": codes[pair["room1lang"]],
-        }
-    return room_lookup
+    for members in groups.values():
+        for room, lang in members.items():
+            routes = room_lookup.setdefault(room, [])
+            for target, target_lang in members.items():
+                if target == room or any(r["target_room"] == target for r in routes):
+                    continue
+                routes.append(
+                    {
+                        "target_room": target,
+                        "from_lang": codes[lang],
+                        "to_lang": codes[target_lang],
+                    }
+                )
+    return {room: routes for room, routes in room_lookup.items() if owns_room(room)}
 
 
-def translation_module(cs_message: dict):
-    room_name = cs_message["roomName"]
-    room_lookup = recreate_room_lookups()
-    if room_name in room_lookup:
-        config = room_lookup[room_name]
+# Rebuilt only when a link is saved or the language codes change, not on every message
+_codes_signature = file_signature([LANG_CODES_FILE])
+ROOM_INDEX = RoomIndex(
+    recreate_room_lookups, lambda: (LINK_STORE.version(), _codes_signature())
+)
+
 
+def accept_message(cs_message: dict):
+    """Records a received message in the outbox for every room it is routed
+    to, before it waits in any queue, so a crash or a stop that does not
+    drain leaves it to be resumed. The rooms it was accepted for travel with
+    it as `accepted_for`.
+
+    Returns False if the outbox already has it for every route, i.e. it is
+    a duplicate and must be dropped.
+    """
+    if OUTBOX is None:
+        return True
+    routes = ROOM_INDEX.lookup(cs_message.get("roomName")) or []
+    accepted_for = [
+        route["target_room"]
+        for route in routes
+        if OUTBOX.accept(cs_message["id"], route["target_room"], cs_message)
+    ]
+    cs_message["accepted_for"] = accepted_for
+    return bool(accepted_for) or not routes
+
+
+def translate_message(cs_message: dict):
+    """Translates a message for every room linked to its room.
+
+    Each distinct target language is translated once and shared by all the
+    target rooms in that language. Returns the list of outgoing messages for
+    `post_translation` (empty if the room is not linked or the outbox has
+    already seen this message for every target).
+    """
+    routes = ROOM_INDEX.lookup(cs_message.get("roomName")) or []
+    accepted = set()
+    if OUTBOX is not None:
+        if "accepted_for" in cs_message:
+            accepted = set(cs_message["accepted_for"])
+        else:
+            # Resumed from the outbox, or translated outside the pipeline
+            accepted = {
+                route["target_room"]
+                for route in routes
+                if OUTBOX.accept(cs_message["id"], route["target_room"], cs_message)
+            }
+        routes = [route for route in routes if route["target_room"] in accepted]
+    routes = skip_untranslated(cs_message, routes)
+    # A burst of messages joined by the coalescer is translated and posted once
+    merged_ids = cs_message.get("coalesced_ids") or []
+    if OUTBOX is not None:
+        # Dropped by the skip filter, or unlinked since it was received
+        for target_room in accepted - {route["target_room"] for route in routes}:
+            OUTBOX.mark_dropped(cs_message["id"], target_room)
+            OUTBOX.merge(merged_ids[1:], target_room)
+    if not routes:
+        return []
+
+    languages = {}
+    for route in routes:
+        # Same-language rooms get the text unchanged; no call to make or save
+        if not route.get("skip") and route["from_lang"] != route["to_lang"]:
+            languages.setdefault((route["from_lang"], route["to_lang"]), []).append(route)
+    if merged_ids:
+        CALLS_SAVED.inc((len(merged_ids) - 1) * len(languages), call="translate")
+        CALLS_SAVED.inc((len(merged_ids) - 1) * len(routes), call="post")
+    translations = {}
+    started = time.perf_counter()
+    if languages:
         print(
-            f"Translating text: {cs_message["text"][:20]} from {config['from_lang']} to {config['to_lang']}"
+            f"Translating text: {cs_message['text'][:20]} from {routes[0]['from_lang']} "
+            f"to {', '.join(to_lang for _, to_lang in languages)}"
         )
+        try:
+            translations = translate_to_languages(cs_message["text"], list(languages))
+        except Exception:
+            if OUTBOX is not None:
+                for route in routes:
+                    for message_id in merged_ids or [cs_message["id"]]:
+                        OUTBOX.release(message_id, route["target_room"])
+            raise
+    elapsed = time.perf_counter() - started
+
+    outgoings = []
+    for route in routes:
+        pair = {"source_room": cs_message["roomName"], "target_room": route["target_room"]}
+        if route["from_lang"] == route["to_lang"] or route.get("skip") == SAME_LANGUAGE:
+            # Already in the room's language: copied as is, nothing to credit
+            text, suffix = cs_message["text"], ""
+        elif route.get("skip"):
+            text, suffix = cs_message["text"], " (original text)"
+        else:
+            TRANSLATE_SECONDS.observe(elapsed, **pair)
+            MESSAGES_TRANSLATED.inc(**pair)
+            text = translations[(route["from_lang"], route["to_lang"])]
+            suffix = " (from Google Translate)"
+        outgoing = {
+            "message_text": text,
+            "message_id": cs_message["id"],
+            "nickName": cs_message["sender"] + suffix,
+            "roomName": route["target_room"],
+            # Not sent; labels the post metrics and measures end-to-end lag
+            "source_room": cs_message["roomName"],
+            "timestamp": cs_message.get("timestamp"),
+        }
+        if OUTBOX is not None:
+            OUTBOX.mark_translated(cs_message["id"], route["target_room"], outgoing)
+            # Queued after the translation that carries their text, so no
+            # commit can hold the merge without it
+            OUTBOX.merge(merged_ids[1:], route["target_room"])
+        outgoings.append(outgoing)
+    return outgoings
+
+
+def skip_untranslated(cs_message: dict, routes: list):
+    """Applies the skip filter to a message's routes.
+
+    Routes whose translation can be skipped are marked `skip` (the original
+    text is posted) or left out (dropped), following each room pair's
+    policy. Returns the routes to keep.
+    """
+    source = cs_message.get("roomName")
+    policies = [
+        SKIP_PAIR_POLICIES.get(f"{source}:{route['target_room']}", SKIP_POLICY)
+        for route in routes
+    ]
+    if all(policy == TRANSLATE for policy in policies):
+        return routes
+    verdict = SKIP_FILTER.classify(cs_message["text"], cs_message.get("userId"))
+    kept = []
+    skipped, translated = {}, set()
+    for route, policy in zip(routes, policies):
+        language = (route["from_lang"], route["to_lang"])
+        reason = None
+        if policy != TRANSLATE and language[0] != language[1]:
+            reason = SKIP_FILTER.skip_reason(verdict, route["to_lang"])
+        if reason is None:
+            translated.add(language)
+            kept.append(route)
+            continue
+        MESSAGES_SKIPPED.inc(reason=reason, action=policy)
+        skipped[language] = reason
+        if policy != DROP:
+            kept.append({**route, "skip": reason})
+    # Rooms sharing a language share one API call, which is only saved if
+    # none of them still needs it
+    for language, reason in skipped.items():
+        if language not in translated:
+            CHARACTERS_SKIPPED.inc(len(cs_message["text"]), reason=reason)
+    return kept
+
+
+# A rejected session, not a rejected message: worth retrying with a new one
+AUTH_STATUSES = (401, 403)
+
+
+def settle_outbox(outgoing: dict, status=None):
+    """Moves a post's outbox entry on: posted on 2xx, failed on a rejection
+    that retrying cannot fix, otherwise left pending for the next resume."""
+    if OUTBOX is None:
+        return
+    key = (outgoing["message_id"], outgoing["roomName"])
+    if status is not None and 200 <= status < 300:
+        OUTBOX.mark_posted(*key)
+    elif (
+        status is not None
+        and 400 <= status < 500
+        and status not in THROTTLE_STATUSES
+        and status not in AUTH_STATUSES
+    ):
+        OUTBOX.mark_failed(*key)
+    else:
+        OUTBOX.release(*key)
+
+
+def record_post(outgoing: dict, started: float, outcome: str):
+    """Records post latency, outcome and end-to-end lag for one translation."""
+    pair = {
+        "source_room": outgoing.get("source_room"),
+        "target_room": outgoing["roomName"],
+    }
+    POST_SECONDS.observe(time.perf_counter() - started, **pair)
+    MESSAGES_POSTED.inc(outcome=outcome, **pair)
+    if outgoing.get("timestamp"):
+        try:
+            sent = datetime.fromisoformat(outgoing["timestamp"].replace("Z", "+00:00"))
+        except ValueError:
+            return
+        LAG_SECONDS.observe(time.time() - sent.timestamp(), **pair)
 
-        translated_text = translate_text(
-            text=cs_message["text"],
-            translate_from=config["from_lang"],
-            translate_to=config["to_lang"],
+
+def session_rejected(status, session_id):
+    """True if ChatSurfer turned down the session rather than the post (it
+    expired early or was revoked). The session is dropped, so a retry gets
+    a new one."""
+    if status in AUTH_STATUSES:
+        SESSIONS.invalidate(session_id)
+        return True
+    return False
+
+
+@contextlib.contextmanager
+def settling_post(outgoing: dict):
+    """Times one post and, however it ends, records it and settles its
+    outbox entry. The block sets `status` on what it yields once ChatSurfer
+    has answered."""
+    post = SimpleNamespace(started=time.perf_counter(), status=None)
+    try:
+        yield post
+    except Throttled:
+        record_post(outgoing, post.started, "throttled")
+        settle_outbox(outgoing)
+        raise
+    except Exception:
+        record_post(outgoing, post.started, "error")
+        settle_outbox(outgoing)
+        raise
+    ok = 200 <= post.status < 300
+    record_post(outgoing, post.started, "ok" if ok else f"http_{post.status}")
+    settle_outbox(outgoing, post.status)
+
+
+def post_translation(outgoing: dict):
+    """Posts a message produced by `translate_message` to its target room,
+    for callers without an event loop. Same retries as
+    `async_post_translation`."""
+    session_id = None
+
+    def send():
+        nonlocal session_id
+        session_id = create_session()
+        response = send_public_message(
+            message_text=outgoing["message_text"],
+            message_id=outgoing["message_id"],
+            session_id=session_id,
+            nickName=outgoing["nickName"],
+            roomName=outgoing["roomName"],
+            thread=False,
         )
+        if response.status_code in THROTTLE_STATUSES:
+            raise Throttled(f"HTTP {response.status_code}")
+        return response.status_code
+
+    with settling_post(outgoing) as post:
+        # A rejected session is retried once on a new one
+        for _ in range(2):
+            post.status = POST_THROTTLE.call(send, key=outgoing["roomName"])
+            if not session_rejected(post.status, session_id):
+                break
+    return post.status
 
-        t_message = " (from Google Translate)"
-        send_public_message(
-            message_text=translated_text,
-            message_id=cs_message["id"],
-            session_id=create_session(),
-            nickName=cs_message["sender"] + t_message,
-            roomName=config["target_room"],
+
+async def async_post_translation(outgoing: dict):
+    """Posts a translation from the event loop over the pooled async client.
+
+    Throttled posts (429/503) are retried by POST_THROTTLE, and a rejected
+    session (401/403) once on a new session; other failures are not, since
+    the server may already have accepted the message.
+    """
+    session_id = None
+
+    async def send():
+        status = await async_send_public_message(
+            message_text=outgoing["message_text"],
+            message_id=outgoing["message_id"],
+            session_id=session_id,
+            nickName=outgoing["nickName"],
+            roomName=outgoing["roomName"],
             thread=False,
         )
+        if status in THROTTLE_STATUSES:
+            raise Throttled(f"HTTP {status}")
+        return status
+
+    with settling_post(outgoing) as post:
+        for _ in range(2):
+            started = time.perf_counter()
+            session_id = await async_create_session()
+            SESSION_SECONDS.observe(time.perf_counter() - started)
+            post.status = await POST_THROTTLE.async_call(send, key=outgoing["roomName"])
+            if not session_rejected(post.status, session_id):
+                break
+    return post.status
+
+
+def translation_module(cs_message: dict):
+    """Translates and posts a message synchronously, outside the pipeline."""
+    for outgoing in translate_message(cs_message):
+        post_translation(outgoing)
 
 
 sample_message = {
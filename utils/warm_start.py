@@ -0,0 +1,59 @@
+# utils/warm_start.py
+
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("websockets")
+
+
+class WarmStart:
+    """Small JSON snapshot of state fetched from ChatSurfer at connect time.
+
+    A restart reads values from it instead of waiting on the server, and
+    the caller refreshes them in the background. Values older than
+    `max_age` seconds are ignored. An empty `path` turns the snapshot off.
+    """
+
+    def __init__(self, path, max_age=24 * 60 * 60):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._values = self._load()
+
+    def _load(self):
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                values = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable warm-start snapshot {self.path}: {e}")
+            return {}
+        return values if isinstance(values, dict) else {}
+
+    def get(self, key):
+        """The saved value, or None if there is none or it is too old."""
+        entry = self._values.get(key)
+        if not isinstance(entry, dict) or time.time() - entry.get("saved", 0) > self.max_age:
+            return None
+        return entry.get("value")
+
+    def put(self, key, value):
+        with self._lock:
+            self._values[key] = {"value": value, "saved": time.time()}
+            if not self.path:
+                return
+            # Per process: sharded daemon workers share the file
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self._values, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.error(f"Could not save warm-start snapshot: {e}")
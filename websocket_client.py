@@ -1,163 +1,657 @@
 # websocket_client.py
 
 import asyncio
+import functools
 import json
 import logging
-import ssl
 import time
-from uuid import uuid4
-import re
 import websockets
-from config import BOT_USER_ID, CA_BUNDLE_PATH, CERT_PATH, KEY_PATH
-from utils.cs_helpers import create_session, get_private_rooms
-from utils.translator import translation_module
+from config import (
+    BACKFILL_MAX_AGE,
+    BACKFILL_RATE,
+    BACKFILL_SEEN_IDS,
+    BOT_USER_ID,
+    COALESCE_GAP,
+    COALESCE_MAX_CHARS,
+    COALESCE_MAX_MESSAGES,
+    COALESCE_MAX_WAIT,
+    COALESCE_ROOM_GAPS,
+    DAEMON_DRAIN_TIMEOUT,
+    METRICS_HOST,
+    METRICS_PORT,
+    RECORD_FRAMES_PATH,
+    SCHEDULER,
+    SCHEDULER_LANE_CONCURRENCY,
+    SCHEDULER_ROOM_PRIORITIES,
+    SCHEDULER_ROOM_WEIGHTS,
+    SUBSCRIPTION_MODE,
+    PIPELINE_OVERFLOW,
+    PIPELINE_QUEUE_SIZE,
+    PIPELINE_REPORT_INTERVAL,
+    POST_WORKERS,
+    RECONNECT_BACKOFF,
+    RECONNECT_MAX_BACKOFF,
+    RECONNECT_STABLE_AFTER,
+    SILENCE_TIMEOUT,
+    STOMP_HEARTBEAT_RECEIVE_MS,
+    STOMP_HEARTBEAT_SEND_MS,
+    TRANSLATE_WORKERS,
+    WARM_START_FILE,
+    WARM_START_MAX_AGE,
+)
+from utils.backfill import HighWaterMarks, parse_timestamp
+from utils.coalescer import Coalescer
+from utils.cs_helpers import (
+    SESSIONS,
+    async_create_session,
+    async_get_private_rooms,
+    async_get_room_messages,
+)
+from utils.heartbeat import Watchdog, negotiate, send_heartbeats, stop_signal
+from utils.http_client import close_async_client, get_ssl_context
+from utils import stomp
+from utils.frame_filter import (
+    FIREHOSE_TOPIC,
+    ROOM_TOPIC_PREFIX,
+    frame_room,
+    raw_message_room,
+)
+from utils.frame_recorder import FrameRecorder
+from utils.metrics import (
+    BACKFILLED,
+    FRAMES_DROPPED,
+    FRAMES_RECEIVED,
+    RECONNECTS,
+    SILENT_CONNECTIONS,
+    start_exporter,
+)
+from utils.pipeline import Pipeline, Stage
+from utils.rate_limit import TokenBucket, jittered_backoff
+from utils.scheduler import FairQueue
+from utils.subscriptions import ClientControl, SubscriptionRegistry
+from utils.warm_start import WarmStart
+from utils.translator import (
+    OUTBOX,
+    ROOM_INDEX,
+    TRANSLATION_SERVICE,
+    accept_message,
+    async_post_translation,
+    owns_room,
+    translate_message,
+)
 
 # Set up logging
 logger = logging.getLogger("websockets")
 logger.setLevel(logging.INFO)
 logger.addHandler(logging.StreamHandler())
 
-# A unique string to temporarily replace escaped quotes during parsing
-QUOTECODE = str(uuid4())
 
+# Lets other threads add/remove subscriptions on the live connection
+CONTROL = ClientControl()
 
-async def connect_and_subscribe(uri: str, stop_event: asyncio.Event):
+# Newest message handled per room, so a reconnect knows what it missed
+HIGH_WATER_MARKS = HighWaterMarks(store=OUTBOX, max_ids=BACKFILL_SEEN_IDS)
+# Marks only move once the outbox holds a message (see take_on), so a crash
+# loses nothing older than them. Backfill still re-reads this far behind, for
+# messages whose timestamps arrive out of order; the outbox drops the copies.
+BACKFILL_OVERLAP = 10.0 if OUTBOX is not None else 0.0
+
+# Lets a restart subscribe before ChatSurfer has answered
+WARM_START = WarmStart(WARM_START_FILE, max_age=WARM_START_MAX_AGE)
+
+HEARTBEAT_OFFER = f"{STOMP_HEARTBEAT_SEND_MS},{STOMP_HEARTBEAT_RECEIVE_MS}"
+
+
+def links_changed():
+    """Applies saved room-link changes to the running client without reconnecting.
+
+    Returns False if no client is connected; the next connection will pick
+    up the new links on its own.
     """
-    Connects to the websocket, subscribes to topics, and processes messages.
+    ROOM_INDEX.notify()
+    return CONTROL.send("sync_links")
+
+
+async def connect_and_subscribe(
+    uri: str, stop_event: asyncio.Event, drain_event=None, stopped=None
+):
+    """
+    Connects to the websocket, subscribes to topics, and feeds received frames
+    into the translation pipeline.
+
+    Setting `stop_event` disconnects and leaves queued work in the outbox for
+    the next start; setting `drain_event` as well finishes it first. `stopped`
+    is the loop's view of `stop_event` (see heartbeat.stop_signal); pass one
+    to reuse it across connections.
+    Returns how many seconds the connection was up (0 if it never was).
     """
-    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-    ssl_context.load_verify_locations(CA_BUNDLE_PATH)
-    ssl_context.load_cert_chain(CERT_PATH, KEY_PATH)
+    if stopped is None:
+        stopped = stop_signal(stop_event, asyncio.get_running_loop())
+    ssl_context = get_ssl_context()
 
-    session_id = create_session()
+    session_id = await async_create_session()
     headers = {"Cookie": f"SESSION={session_id}"}
 
-    private_rooms_list = get_private_rooms(session_id)
-    new_priv_rooms = {}
-    count = 0
+    private_rooms = None
+    if SUBSCRIPTION_MODE == "firehose":
+        # Public rooms arrive on the firehose; private rooms need their own
+        # topic. A saved list is used at once and refreshed once connected.
+        private_rooms = WARM_START.get("private_rooms")
+        if private_rooms is None:
+            private_rooms = await async_get_private_rooms(session_id) or []
+            WARM_START.put("private_rooms", private_rooms)
+            refresh_rooms = False
+        else:
+            refresh_rooms = True
+        rooms_to_subscribe = private_rooms
+    else:
+        rooms_to_subscribe = sorted(ROOM_INDEX.rooms())
+    pipeline = None
+    control_queue = asyncio.Queue()
+    control_task = None
+    resume_task = None
+    backfill_task = None
+    refresh_task = None
+    heartbeat_task = None
+    receiver = None
+    watchdog = None
+    connected_at = None
+    # Captures raw traffic for the replay benchmarks when configured
+    recorder = FrameRecorder(RECORD_FRAMES_PATH) if RECORD_FRAMES_PATH else None
 
     try:
-        async with websockets.connect(
-            uri, ssl=ssl_context, extra_headers=headers
-        ) as websocket:
+        # websockets rejects an ssl argument for ws:// URIs
+        tls = {"ssl": ssl_context} if ssl_context is not None else {}
+        async with websockets.connect(uri, extra_headers=headers, **tls) as websocket:
             logger.info("Successfully connected to websocket.")
+            connected_at = time.monotonic()
+
+            pipeline = build_pipeline()
+            await pipeline.start()
+            if OUTBOX is not None:
+                resume_task = asyncio.create_task(resume_outbox(pipeline))
 
             # STOMP CONNECT frame
             await websocket.send(
-                '["CONNECT\\naccept-version:1.2\\nheart-beat:0,0\\n\\n\\u0000"]'
+                stomp.encode_frame(
+                    "CONNECT", {"accept-version": "1.2", "heart-beat": HEARTBEAT_OFFER}
+                )
             )
+            connected = await asyncio.wait_for(
+                await_connected(websocket, pipeline), timeout=10.0
+            )
+            send_every, expect_every = negotiate(
+                HEARTBEAT_OFFER, connected.headers.get("heart-beat")
+            )
+            if send_every:
+                heartbeat_task = asyncio.create_task(send_heartbeats(websocket, send_every))
+
+            # Anything newer than these marks was missed while disconnected
+            missed_since = HIGH_WATER_MARKS.snapshot()
 
             # Basic Subscriptions
-            subscriptions = {
-                "all-messages": "/topic/chat-messages-all",
-                "direct-messages": "/user/topic/direct-message",
-                "room-updates": "/user/topic/room-membership-changed-event",
-            }
-            for key, dest in subscriptions.items():
-                await websocket.send(
-                    f'["SUBSCRIBE\\nid:sub-{count}\\ndestination:{dest}\\n\\n\\u0000"]'
-                )
-                count += 1
+            registry = SubscriptionRegistry(websocket)
+            await registry.subscribe("/user/topic/direct-message")
+            await registry.subscribe("/user/topic/room-membership-changed-event")
+            if SUBSCRIPTION_MODE == "firehose":
+                await registry.subscribe(FIREHOSE_TOPIC)
+
+            # Subscribe to each linked room (or each private room on the firehose)
+            for room_name in rooms_to_subscribe:
+                await registry.subscribe(ROOM_TOPIC_PREFIX + room_name)
 
-            # Subscribe to initial private rooms
-            for room_name in private_rooms_list:
-                new_priv_rooms[room_name] = count
-                sub_frame = f'["SUBSCRIBE\\nid:sub-{count}\\ndestination:/topic/chat-messages-room/chatsurferxmppunclass/{room_name}\\n\\n\\u0000"]'
-                await websocket.send(sub_frame)
-                count += 1
+            control_task = asyncio.create_task(run_control(control_queue, registry))
+            CONTROL.bind(asyncio.get_running_loop(), control_queue)
+            # Links saved while we were connecting would otherwise be missed
+            control_queue.put_nowait(("sync_links", ()))
+            if private_rooms is not None and refresh_rooms:
+                refresh_task = asyncio.create_task(
+                    refresh_private_rooms(session_id, private_rooms)
+                )
+            if BACKFILL_MAX_AGE:
+                backfill_task = asyncio.create_task(
+                    backfill(pipeline, session_id, missed_since)
+                )
 
             logger.info("Subscriptions sent. Listening for messages...")
 
-            while not stop_event.is_set():
-                try:
-                    # The timeout allows the loop to periodically check the stop_event
-                    stomp_message = await asyncio.wait_for(
-                        websocket.recv(), timeout=1.0
-                    )
-                    await process_stomp_message(
-                        stomp_message, websocket, new_priv_rooms
-                    )
-                except asyncio.TimeoutError:
-                    # No message received, continue loop to check stop_event again
-                    continue
-                except websockets.exceptions.ConnectionClosed:
-                    logger.warning("Websocket connection closed.")
-                    break
+            # Without heart-beats from the server, a quiet room would look dead
+            silence = max(SILENCE_TIMEOUT, 2 * expect_every) if expect_every else 0
+            watchdog = Watchdog(silence, lambda: receiver.cancel())
+            receiver = asyncio.create_task(
+                receive(websocket, pipeline, recorder, watchdog)
+            )
+            watchdog.start()
+            stop_waiter = asyncio.create_task(stopped.wait())
+            try:
+                await asyncio.wait(
+                    {receiver, stop_waiter}, return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                stop_waiter.cancel()
+            if watchdog.expired:
+                SILENT_CONNECTIONS.inc()
+                logger.warning(
+                    f"Nothing received from the server for {silence:.0f} seconds; "
+                    "reconnecting."
+                )
 
+    except websockets.exceptions.InvalidStatusCode as e:
+        logger.error(f"Websocket connection refused: {e}")
+        if e.status_code in (401, 403):
+            # Likely a saved session that expired early; get a new one
+            SESSIONS.invalidate(session_id)
     except Exception as e:
         logger.error(f"Websocket connection error: {e}")
     finally:
+        CONTROL.unbind(control_queue)
+        if watchdog is not None:
+            watchdog.stop()
+        if receiver is not None:
+            receiver.cancel()
+        if heartbeat_task is not None:
+            heartbeat_task.cancel()
+        if recorder is not None:
+            recorder.close()
+        if control_task is not None:
+            control_task.cancel()
+        if resume_task is not None:
+            resume_task.cancel()
+        if backfill_task is not None:
+            backfill_task.cancel()
+        if refresh_task is not None:
+            refresh_task.cancel()
+        if pipeline is not None:
+            # Let messages that were already received finish translating
+            draining = drain_event is not None and drain_event.is_set()
+            await pipeline.stop(
+                drain=draining or not stop_event.is_set(),
+                timeout=DAEMON_DRAIN_TIMEOUT if draining else 5.0,
+            )
+            if OUTBOX is not None:
+                # Whatever did not finish is resumed by the next connection
+                OUTBOX.release_all()
         logger.info("Websocket client coroutine finished.")
+    return time.monotonic() - connected_at if connected_at is not None else 0.0
 
 
-async def process_stomp_message(stomp_message, websocket, new_priv_rooms):
-    """Parses and acts on a single STOMP message from the server."""
-    # Ignore initial connection confirmation and heartbeats
-    if "CONNECTED" in stomp_message or stomp_message == "o":
-        return
+async def await_connected(websocket, pipeline):
+    """Waits for the server's answer to CONNECT and returns the CONNECTED
+    frame. Raises ConnectionError if the server refuses it."""
+    while True:
+        stomp_message = await websocket.recv()
+        # Only "o" should precede it; anything else still gets handled
+        for frame in stomp.decode(stomp_message):
+            if frame.command == "CONNECTED":
+                return frame
+            if frame.command == "ERROR":
+                raise ConnectionError(
+                    f"STOMP CONNECT refused: {frame.headers.get('message')}"
+                )
+        await pipeline.put(stomp_message)
+
 
+async def receive(websocket, pipeline, recorder, watchdog):
+    """Feeds websocket messages into the pipeline until the connection closes.
+    Heart-beats and SockJS frames count as traffic for the watchdog."""
     try:
-        # A more robust way to find the JSON part of a STOMP message
-        json_part_match = re.search(r"(\{.+\})", stomp_message)
-        if not json_part_match:
+        while True:
+            stomp_message = await websocket.recv()
+            FRAMES_RECEIVED.inc()
+            if recorder is not None:
+                recorder.record(stomp_message)
+            # Waiting on a full pipeline is not the server going quiet
+            watchdog.busy = True
+            try:
+                await pipeline.put(stomp_message)
+            finally:
+                watchdog.busy = False
+                watchdog.touch()
+    except websockets.exceptions.ConnectionClosed:
+        logger.warning("Websocket connection closed.")
+
+
+async def resume_outbox(pipeline):
+    """Feeds work left unfinished by an earlier connection or process back
+    into the pipeline: untranslated messages to translate, the rest to post."""
+    messages, outgoings = await asyncio.to_thread(OUTBOX.claim_pending, owns_room)
+    if messages or outgoings:
+        logger.info(
+            f"Resuming {len(messages)} untranslated and {len(outgoings)} unposted "
+            "messages from the outbox."
+        )
+    for message in messages:
+        await pipeline.put_at("translate", message)
+    for outgoing in outgoings:
+        await pipeline.put_at("post", outgoing)
+
+
+async def backfill(pipeline, session_id, since):
+    """Translates messages posted in linked rooms while the client was not
+    listening: those newer than the room's high-water mark and at most
+    BACKFILL_MAX_AGE old, oldest first, at BACKFILL_RATE messages a second.
+
+    Rooms without a mark (never seen, e.g. just linked) are not backfilled.
+    Copies the live stream also delivered are dropped by their id.
+    """
+    oldest = time.time() - BACKFILL_MAX_AGE
+    bucket = TokenBucket(BACKFILL_RATE)
+    queued = 0
+    for room in sorted(ROOM_INDEX.rooms()):
+        mark = since.get(room)
+        if mark is None:
+            continue
+        try:
+            messages = await async_get_room_messages(room, session_id)
+        except Exception as e:
+            logger.error(f"Could not fetch missed messages for {room}: {e}")
+            continue
+        missed = []
+        reached_mark = False
+        for message in messages:
+            sent = parse_timestamp(message.get("timestamp"))
+            if sent is None:
+                continue
+            reached_mark = reached_mark or sent <= mark
+            if sent <= mark - BACKFILL_OVERLAP:
+                continue
+            if sent < oldest:
+                BACKFILLED.inc(result="too_old")
+                continue
+            missed.append((sent, message))
+        if messages and not reached_mark:
+            # The endpoint only returns the latest page of messages
+            logger.warning(
+                f"Backfill of {room} may be incomplete: all {len(messages)} fetched "
+                "messages are newer than the last one handled."
+            )
+        for _, message in sorted(missed, key=lambda item: item[0]):
+            message.setdefault("roomName", room)
+            message = handle_message(message)
+            if message is None:
+                continue
+            if not take_on(message):
+                BACKFILLED.inc(result="duplicate")
+                continue
+            await bucket.async_acquire()
+            await pipeline.put_at("translate", message)
+            BACKFILLED.inc(result="queued")
+            queued += 1
+    if queued:
+        logger.info(f"Backfilled {queued} messages missed while disconnected.")
+
+
+async def refresh_private_rooms(session_id, subscribed):
+    """Fetches the private room list that a connection subscribed from the
+    warm-start snapshot, and catches its subscriptions up with it."""
+    try:
+        rooms = await async_get_private_rooms(session_id)
+    except Exception as e:
+        logger.error(f"Could not refresh the private room list: {e}")
+        return
+    if rooms is None:
+        return
+    WARM_START.put("private_rooms", rooms)
+    for room in sorted(set(rooms) - set(subscribed)):
+        CONTROL.send("subscribe_room", room)
+    for room in sorted(set(subscribed) - set(rooms)):
+        CONTROL.send("unsubscribe_room", room)
+
+
+def take_on(message):
+    """Claims a received message and records it in the outbox, then moves its
+    room's high-water mark. Returns False if it is a duplicate."""
+    if not HIGH_WATER_MARKS.claim(message) or not accept_message(message):
+        return False
+    HIGH_WATER_MARKS.advance(message)
+    return True
+
+
+async def run_control(queue, registry):
+    """Applies control commands to the live connection's subscriptions."""
+    while True:
+        command, args = await queue.get()
+        try:
+            if command == "sync_links":
+                # On the firehose, public rooms need no subscription of their own
+                if SUBSCRIPTION_MODE != "firehose":
+                    await registry.sync(
+                        {ROOM_TOPIC_PREFIX + room for room in ROOM_INDEX.rooms()},
+                        ROOM_TOPIC_PREFIX,
+                    )
+            elif command == "subscribe_room":
+                await registry.subscribe(ROOM_TOPIC_PREFIX + args[0])
+            elif command == "unsubscribe_room":
+                await registry.unsubscribe(ROOM_TOPIC_PREFIX + args[0])
+            else:
+                logger.warning(f"Unknown control command: {command}")
+        except websockets.exceptions.ConnectionClosed:
             return
+        except Exception as e:
+            logger.error(f"Error applying control command {command}: {e}")
+
+
+def coalesce_gap(room_name):
+    """Seconds a sender may pause in a room and still extend their burst."""
+    return COALESCE_ROOM_GAPS.get(room_name, COALESCE_GAP)
+
+
+def translate_lane(message):
+    """Source room of a message; direct messages get a lane per sender."""
+    return message.get("roomName") or f"dm:{message.get('userId')}"
+
+
+def post_lane(outgoing):
+    return outgoing["roomName"]
+
+
+def lane_class(lane):
+    # ":" is not allowed in room names, so no room looks like a DM lane
+    return "dm" if lane.startswith("dm:") else "room"
+
+
+def lane_priority(lane):
+    return 0 if lane_class(lane) == "dm" else SCHEDULER_ROOM_PRIORITIES.get(lane, 1)
+
+
+def lane_weight(lane):
+    return SCHEDULER_ROOM_WEIGHTS.get(lane, 1)
+
 
-        # Clean and parse JSON
-        json_str = (
-            json_part_match.group(1).replace('\\\\\\"', QUOTECODE).replace("\\", "")
+def stage_queue(name, lane_of, lane_concurrency=1):
+    """The input queue of the translate or post stage (see SCHEDULER)."""
+    if SCHEDULER != "fair":
+        return None
+    return FairQueue(
+        lane_of,
+        maxsize=PIPELINE_QUEUE_SIZE,
+        priority_of=lane_priority,
+        weight_of=lane_weight,
+        lane_concurrency=lane_concurrency,
+        name=name,
+        class_of=lane_class,
+    )
+
+
+def build_pipeline():
+    """Creates the parse -> [coalesce ->] translate -> post pipeline for one
+    connection. The coalesce stage is only there if some room has a gap."""
+    coalesce = []
+    coalescer = None
+    if COALESCE_GAP or any(COALESCE_ROOM_GAPS.values()):
+        coalescer = Coalescer(
+            coalesce_gap,
+            max_messages=COALESCE_MAX_MESSAGES,
+            max_chars=COALESCE_MAX_CHARS,
+            max_wait=COALESCE_MAX_WAIT,
         )
-        parsed_dict = json.loads(json_str)
-
-        # Handle direct messages by normalizing their structure
-        is_dm = "message" in parsed_dict and "contactUserId" in parsed_dict
-        if is_dm:
-            parsed_dict = parsed_dict["message"]
-            parsed_dict["userId"] = parsed_dict.get("senderUserId")
-
-        if "text" in parsed_dict:
-            parsed_dict["text"] = parsed_dict["text"].replace(QUOTECODE, '"')
-
-        # Handle room membership changes
-        if "changedMembershipType" in parsed_dict:
-            room_name = parsed_dict.get("roomName")
-            if parsed_dict["changedMembershipType"] == "FOLLOWER" and parsed_dict.get(
-                "privateRoom"
-            ):
-                logger.info(f"Bot added to private room: {room_name}")
-                # Dynamically subscribe to new room (optional, restart is safer)
-            elif parsed_dict["changedMembershipType"] == "NONE" and parsed_dict.get(
-                "privateRoom"
-            ):
-                logger.info(f"Bot removed from room: {room_name}")
-                # Dynamically unsubscribe (optional, restart is safer)
-
-        # Process translatable messages
-        is_bot_message = parsed_dict.get("userId") == BOT_USER_ID
-        has_required_fields = all(k in parsed_dict for k in ["userId", "text"]) and (
-            "roomName" in parsed_dict or is_dm
+        coalesce.append(
+            Stage(
+                "coalesce",
+                coalescer.add,
+                maxsize=PIPELINE_QUEUE_SIZE,
+                flush=coalescer.flush,
+            )
         )
+    pipeline = Pipeline(
+        [
+            Stage("parse", process_stomp_message, maxsize=PIPELINE_QUEUE_SIZE),
+            *coalesce,
+            Stage(
+                "translate",
+                translate_message,
+                workers=TRANSLATE_WORKERS,
+                maxsize=PIPELINE_QUEUE_SIZE,
+                blocking=True,
+                queue=stage_queue("translate", translate_lane, SCHEDULER_LANE_CONCURRENCY),
+            ),
+            Stage(
+                "post",
+                async_post_translation,
+                workers=POST_WORKERS,
+                maxsize=PIPELINE_QUEUE_SIZE,
+                queue=stage_queue("post", post_lane),
+            ),
+        ],
+        overflow=PIPELINE_OVERFLOW,
+        report_interval=PIPELINE_REPORT_INTERVAL,
+    )
+    if coalescer is not None:
+        # Bursts that end on a timer skip ahead to translation
+        coalescer.emit = functools.partial(pipeline.put_at, "translate")
+    return pipeline
 
-        if not is_bot_message and has_required_fields:
-            translation_module(parsed_dict)
 
-    except json.JSONDecodeError:
-        logger.error(f"Failed to decode JSON from message: {stomp_message}")
-    except Exception as e:
-        logger.error(f"Error processing message: {e}")
+async def process_stomp_message(stomp_message):
+    """Decodes one websocket message, which may carry several STOMP frames.
+
+    Returns the list of message dicts that should be translated.
+    """
+    to_translate = []
+    # Most firehose traffic is for unlinked rooms; drop it before decoding
+    if not is_room_wanted(raw_message_room(stomp_message)):
+        FRAMES_DROPPED.inc(reason="unlinked")
+        return to_translate
+    try:
+        frames = stomp.decode(stomp_message)
+    except ValueError as e:
+        FRAMES_DROPPED.inc(reason="decode_error")
+        logger.error(f"Failed to decode frame ({e}): {stomp_message[:200]}")
+        return to_translate
+
+    for frame in frames:
+        if frame.command == "ERROR":
+            logger.error(f"STOMP error from server: {frame.headers.get('message')}")
+            continue
+        # CONNECTED, RECEIPT and anything else carries no chat payload
+        if frame.command != "MESSAGE":
+            continue
+        if not is_room_wanted(frame_room(frame)):
+            FRAMES_DROPPED.inc(reason="unlinked")
+            continue
+        try:
+            parsed_dict = handle_message(frame.json())
+        except json.JSONDecodeError:
+            logger.error(f"Failed to decode JSON from message: {frame.body[:200]}")
+            continue
+        except Exception as e:
+            logger.error(f"Error processing message: {e}")
+            continue
+        if parsed_dict is None:
+            continue
+        # Already handled, by a backfill or an earlier delivery
+        if not take_on(parsed_dict):
+            FRAMES_DROPPED.inc(reason="duplicate")
+            continue
+        to_translate.append(parsed_dict)
+    return to_translate
+
 
+def is_room_wanted(room_name):
+    """False only for traffic known to belong to a room that is not linked."""
+    return room_name is None or ROOM_INDEX.lookup(room_name) is not None
 
-def websocket_thread_runner(uri: str, stop_event: asyncio.Event):
+
+def handle_message(parsed_dict):
+    """Acts on one decoded message body. Returns it if it should be translated."""
+    # Handle direct messages by normalizing their structure
+    is_dm = "message" in parsed_dict and "contactUserId" in parsed_dict
+    if is_dm:
+        parsed_dict = parsed_dict["message"]
+        parsed_dict["userId"] = parsed_dict.get("senderUserId")
+
+    # Handle room membership changes
+    if "changedMembershipType" in parsed_dict:
+        room_name = parsed_dict.get("roomName")
+        if parsed_dict["changedMembershipType"] == "FOLLOWER" and parsed_dict.get(
+            "privateRoom"
+        ):
+            logger.info(f"Bot added to private room: {room_name}")
+            # On the firehose every private room needs its own topic; in
+            # rooms mode only the linked ones are subscribed
+            if SUBSCRIPTION_MODE == "firehose" or ROOM_INDEX.lookup(room_name):
+                CONTROL.send("subscribe_room", room_name)
+        elif parsed_dict["changedMembershipType"] == "NONE" and parsed_dict.get(
+            "privateRoom"
+        ):
+            logger.info(f"Bot removed from room: {room_name}")
+            CONTROL.send("unsubscribe_room", room_name)
+
+    # Process translatable messages
+    is_bot_message = parsed_dict.get("userId") == BOT_USER_ID
+    has_required_fields = all(k in parsed_dict for k in ["userId", "text"]) and (
+        "roomName" in parsed_dict or is_dm
+    )
+
+    if not is_bot_message and has_required_fields:
+        return parsed_dict
+    return None
+
+
+def reconnect_delay(attempt):
+    """Exponential backoff with full jitter, so many clients that lost the
+    server together do not reconnect in lockstep."""
+    return min(
+        RECONNECT_MAX_BACKOFF,
+        RECONNECT_BACKOFF + jittered_backoff(attempt, RECONNECT_BACKOFF, RECONNECT_MAX_BACKOFF),
+    )
+
+
+def websocket_thread_runner(
+    uri: str, stop_event: asyncio.Event, drain_event=None, metrics_port=METRICS_PORT
+):
     """The target function for the background thread."""
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
+    start_exporter(metrics_port, METRICS_HOST)
+    # Ready by the time the first message arrives
+    TRANSLATION_SERVICE.warm_up()
 
+    # Wakes the client as soon as the thread is told to stop
+    stopped = stop_signal(stop_event, loop)
+    attempt = 0
     while not stop_event.is_set():
         try:
             # Run the client. This will block until the connection is lost.
-            loop.run_until_complete(connect_and_subscribe(uri, stop_event))
-            if not stop_event.is_set():
-                logger.info("Connection lost. Reconnecting in 5 seconds...")
-                time.sleep(5)
+            connected_for = loop.run_until_complete(
+                connect_and_subscribe(uri, stop_event, drain_event, stopped)
+            )
+            if stop_event.is_set():
+                break
+            if connected_for >= RECONNECT_STABLE_AFTER:
+                attempt = 0
+            delay = reconnect_delay(attempt)
+            logger.info(f"Connection lost. Reconnecting in {delay:.1f} seconds...")
         except Exception as e:
-            logger.error(f"Error in websocket runner: {e}. Retrying in 10 seconds.")
-            time.sleep(10)
+            delay = reconnect_delay(attempt)
+            logger.error(f"Error in websocket runner: {e}. Retrying in {delay:.1f} seconds.")
+        attempt += 1
+        RECONNECTS.inc()
+        # Wakes early if the client is stopped meanwhile
+        stop_event.wait(delay)
+
+    # Release pooled connections before the thread's loop goes away
+    loop.run_until_complete(close_async_client())
+    loop.close()
+    if OUTBOX is not None:
+        OUTBOX.flush(timeout=2.0)